@@ -1,8 +1,7 @@
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from core.utils.utils_templates import templates
 
-templates = Jinja2Templates(directory="templates")
 router = APIRouter()
 
 @router.get("/access_matrix", response_class=HTMLResponse)
@@ -1,19 +1,38 @@
-from fastapi import APIRouter, HTTPException
-from core.db import SessionLocal
+import json
+from types import SimpleNamespace
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from core.utils.utils_db_session import fetch_all, get_db, module_db
+from core.utils.utils_read_replica import read_session_scope
+from core.utils.utils_table_versions import list_etag, not_modified, set_etag, track_tables
 from core.utils.safe_import import safe_import
 from core.models.role import Role
 from core.models.user import User 
+from core.utils.utils_access_matrix import (
+    bump_access_version,
+    access_index_stats,
+    effective_permissions,
+)
 
 AccessMatrix = safe_import("model_access_matrix", "models", "AccessMatrix")
 router = APIRouter(prefix="/api/access_matrix", tags=["Access Matrix"])
 
-@router.get("/")
-def list_access():
-    db = SessionLocal()
+LIST_DEFAULT_LIMIT = 100
+LIST_MAX_LIMIT = 1000
+STREAM_CHUNK_SIZE = 500
+# Tables whose changes alter list_access output (names are joined in)
+ACCESS_LIST_TABLES = track_tables(AccessMatrix.__tablename__, Role.__tablename__, User.__tablename__)
+
 
+def _access_list_query(cursor=None, role_id=None, user_id=None, module=None, permission=None):
     # 🧠 Join with roles and users if they exist
     query = (
-        db.query(
+        select(
             AccessMatrix.id,
             AccessMatrix.role_id,
             Role.name.label("role_name"),
@@ -27,50 +46,258 @@ def list_access():
         .outerjoin(User, User.id == AccessMatrix.user_id)
     )
 
-    rows = query.all()
-
-    data = []
-    for r in rows:
-        data.append(
-            dict(
-                id=r.id,
-                role_id=r.role_id,
-                role_name=r.role_name,
-                user_id=r.user_id,
-                user_name=r.user_name,
-                user_email=r.user_email,
-                module=r.module,
-                permission=r.permission,
-                subject=(
-                    r.role_name
-                    or r.user_name
-                    or r.user_email
-                    or f"Role #{r.role_id}" if r.role_id else f"User #{r.user_id}"
-                ),
-                subject_type="role" if r.role_id else "user",
-            )
-        )
+    # 🔎 Server-side filters
+    if cursor is not None:
+        query = query.filter(AccessMatrix.id > cursor)
+    if role_id is not None:
+        query = query.filter(AccessMatrix.role_id == role_id)
+    if user_id is not None:
+        query = query.filter(AccessMatrix.user_id == user_id)
+    if module:
+        query = query.filter(AccessMatrix.module == module)
+    if permission:
+        query = query.filter(AccessMatrix.permission == permission)
+
+    return query.order_by(AccessMatrix.id.asc())
+
+
+def _serialize_access_row(r):
+    return dict(
+        id=r.id,
+        role_id=r.role_id,
+        role_name=r.role_name,
+        user_id=r.user_id,
+        user_name=r.user_name,
+        user_email=r.user_email,
+        module=r.module,
+        permission=r.permission,
+        subject=(
+            r.role_name
+            or r.user_name
+            or r.user_email
+            or f"Role #{r.role_id}" if r.role_id else f"User #{r.user_id}"
+        ),
+        subject_type="role" if r.role_id else "user",
+    )
+
+
+def _stream_access_rows(cursor, filters):
+    """
+    Yield NDJSON lines from a server-side cursor.
+    The stream owns its session because it outlives the request dependency.
+    """
+    with read_session_scope() as db:
+        query = _access_list_query(cursor, **filters).execution_options(stream_results=True)
+        for r in db.execute(query).yield_per(STREAM_CHUNK_SIZE):
+            yield json.dumps(_serialize_access_row(r)) + "\n"
+
 
-    db.close()
-    return data
+@router.get("/")
+async def list_access(
+    request: Request,
+    response: Response,
+    cursor: Optional[int] = Query(None, description="Return rows with id greater than this value"),
+    limit: int = Query(LIST_DEFAULT_LIMIT, ge=1, le=LIST_MAX_LIMIT),
+    role_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    module: Optional[str] = None,
+    permission: Optional[str] = None,
+    stream: bool = Query(False, description="Stream every matching row as NDJSON"),
+    db=Depends(module_db("access_matrix", read_only=True)),
+):
+    """
+    Keyset-paginated access rules ordered by id.
+    Pass the returned next_cursor back as ?cursor= to fetch the next page.
+    With ?stream=true all matching rows are streamed as NDJSON instead.
+    Pages carry an ETag; an unchanged page is answered 304 without querying it.
+    """
+    filters = dict(role_id=role_id, user_id=user_id, module=module, permission=permission)
+    if stream:
+        return StreamingResponse(_stream_access_rows(cursor, filters), media_type="application/x-ndjson")
+
+    etag = await list_etag(db, ACCESS_LIST_TABLES, request)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    rows = await fetch_all(db, _access_list_query(cursor, **filters).limit(limit + 1))
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    set_etag(response, etag)
+    return {
+        "items": [_serialize_access_row(r) for r in rows],
+        "next_cursor": rows[-1].id if has_more else None,
+        "limit": limit,
+    }
+
+@router.post("/effective")
+def get_effective_permissions(payload: dict, db: Session = Depends(get_db)):
+    """
+    Batch permission evaluation for one subject.
+    Payload: {"user_id": int?, "role_id": int?, "checks": "all" | [[module, permission], ...]}
+    """
+    user_id = payload.get("user_id")
+    role_id = payload.get("role_id")
+    checks = payload.get("checks", "all")
+
+    if user_id is None and role_id is None:
+        raise HTTPException(status_code=400, detail="user_id or role_id is required")
+
+    if user_id is not None and role_id is None:
+        user = db.query(User.id, User.role_id).filter(User.id == user_id).first()
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        role_id = user.role_id
+
+    if checks != "all":
+        if not isinstance(checks, list) or not all(
+            isinstance(c, (list, tuple)) and len(c) == 2 for c in checks
+        ):
+            raise HTTPException(status_code=400, detail="checks must be 'all' or a list of [module, permission] pairs")
+        checks = [tuple(c) for c in checks]
+
+    subject = SimpleNamespace(id=user_id, role_id=role_id)
+    return {
+        "user_id": user_id,
+        "role_id": role_id,
+        "permissions": effective_permissions(subject, checks),
+    }
 
 @router.post("/add")
-def add_access(payload: dict):
-    db = SessionLocal()
+def add_access(payload: dict, db: Session = Depends(get_db)):
     record = AccessMatrix(**payload)
     db.add(record)
-    db.commit()
-    db.close()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Access rule already exists")
+    bump_access_version()
     return {"message": "✅ Access rule added."}
 
+
+class AccessRule(BaseModel):
+    role_id: Optional[int] = None
+    user_id: Optional[int] = None
+    module: str
+    permission: str
+
+
+class BulkAccessRequest(BaseModel):
+    mode: Literal["upsert", "replace"] = "upsert"
+    # Subject whose rule set is replaced (replace mode only)
+    role_id: Optional[int] = None
+    user_id: Optional[int] = None
+    rules: List[AccessRule]
+
+
+def _rule_key(role_id, user_id, module, permission):
+    return (role_id, user_id, module, permission)
+
+
+def _existing_rule_ids(db, keys):
+    """Map existing (role_id, user_id, module, permission) keys to row ids in one query."""
+    role_ids = {k[0] for k in keys if k[0] is not None}
+    user_ids = {k[1] for k in keys if k[1] is not None}
+    criteria = []
+    if role_ids:
+        criteria.append(AccessMatrix.role_id.in_(role_ids))
+    if user_ids:
+        criteria.append(AccessMatrix.user_id.in_(user_ids))
+    if not criteria:
+        return {}
+
+    rows = db.query(
+        AccessMatrix.id,
+        AccessMatrix.role_id,
+        AccessMatrix.user_id,
+        AccessMatrix.module,
+        AccessMatrix.permission,
+    ).filter(or_(*criteria)).all()
+    return {_rule_key(r.role_id, r.user_id, r.module, r.permission): r.id for r in rows}
+
+
+@router.post("/bulk")
+def bulk_access(data: BulkAccessRequest, db: Session = Depends(get_db)):
+    """
+    Apply many access rules in a single transaction.
+
+    mode="upsert"  -> insert every rule that does not exist yet, skip duplicates.
+    mode="replace" -> make the rule set of the given role_id/user_id exactly `rules`,
+                      inserting only missing rows and deleting only stale ones.
+    """
+    if data.mode == "replace":
+        if (data.role_id is None) == (data.user_id is None):
+            raise HTTPException(status_code=400, detail="replace mode needs exactly one of role_id or user_id")
+        desired = {
+            _rule_key(data.role_id, data.user_id, r.module, r.permission)
+            for r in data.rules
+        }
+    else:
+        for r in data.rules:
+            if r.role_id is None and r.user_id is None:
+                raise HTTPException(status_code=400, detail=f"Rule {r.module}/{r.permission} needs role_id or user_id")
+        desired = {
+            _rule_key(r.role_id, r.user_id, r.module, r.permission)
+            for r in data.rules
+        }
+
+    try:
+        if data.mode == "replace":
+            if data.role_id is not None:
+                subject = (AccessMatrix.role_id == data.role_id, AccessMatrix.user_id.is_(None))
+            else:
+                subject = (AccessMatrix.user_id == data.user_id, AccessMatrix.role_id.is_(None))
+            rows = db.query(
+                AccessMatrix.id, AccessMatrix.role_id, AccessMatrix.user_id,
+                AccessMatrix.module, AccessMatrix.permission,
+            ).filter(*subject).all()
+            existing = {_rule_key(r.role_id, r.user_id, r.module, r.permission): r.id for r in rows}
+        else:
+            existing = _existing_rule_ids(db, desired)
+
+        to_insert = [
+            {"role_id": k[0], "user_id": k[1], "module": k[2], "permission": k[3]}
+            for k in sorted(desired - existing.keys(), key=str)
+        ]
+        to_delete = (
+            [row_id for k, row_id in existing.items() if k not in desired]
+            if data.mode == "replace" else []
+        )
+
+        # 📦 One multi-row insert + one delete, committed together
+        if to_insert:
+            db.execute(insert(AccessMatrix.__table__), to_insert)
+        if to_delete:
+            db.query(AccessMatrix).filter(AccessMatrix.id.in_(to_delete)).delete(synchronize_session=False)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Conflicting access rule was written concurrently; retry")
+
+    if to_insert or to_delete:
+        bump_access_version()
+
+    return {
+        "message": "✅ Access rules applied.",
+        "mode": data.mode,
+        "inserted": len(to_insert),
+        "deleted": len(to_delete),
+        "unchanged": len(desired) - len(to_insert),
+    }
+
 @router.delete("/{access_id}")
-def remove_access(access_id: int):
-    db = SessionLocal()
+def remove_access(access_id: int, db: Session = Depends(get_db)):
     row = db.query(AccessMatrix).get(access_id)
     if not row:
-        db.close()
         raise HTTPException(status_code=404, detail="Access not found")
     db.delete(row)
     db.commit()
-    db.close()
+    bump_access_version()
     return {"message": "🗑️ Access rule removed."}
+
+@router.get("/index/stats")
+def get_index_stats():
+    """Hit/miss counters for the in-process permission index."""
+    return access_index_stats()
@@ -1,10 +1,25 @@
-async function loadAccess() {
-  const res = await fetch("/api/access_matrix/");
+const accessPaging = {
+  limit: 100,
+  cursors: [null],   // cursor used to fetch each visited page
+  page: 0,
+  nextCursor: null,
+};
+
+async function loadAccess(page = 0) {
+  const params = new URLSearchParams({ limit: accessPaging.limit });
+  const cursor = accessPaging.cursors[page];
+  if (cursor !== null && cursor !== undefined) params.set("cursor", cursor);
+
+  const res = await fetch(`/api/access_matrix/?${params.toString()}`);
   const data = await res.json();
+  accessPaging.page = page;
+  accessPaging.nextCursor = data.next_cursor;
+  accessPaging.cursors[page + 1] = data.next_cursor;
+
   const tbody = document.querySelector("#accessTable tbody");
-  tbody.innerHTML = "";
+  const fragment = document.createDocumentFragment();
 
-  data.forEach(row => {
+  data.items.forEach(row => {
     const tr = document.createElement("tr");
     tr.innerHTML = `
       <td>${row.id}</td>
@@ -16,8 +31,16 @@ async function loadAccess() {
         <button class="btn btn-danger btn-sm" onclick="deleteAccess(${row.id})">🗑️ Delete</button>
       </td>
     `;
-    tbody.appendChild(tr);
+    fragment.appendChild(tr);
   });
+  tbody.replaceChildren(fragment);
+
+  const pageInfo = document.getElementById("pageInfo");
+  if (pageInfo) pageInfo.textContent = `Page ${page + 1}`;
+  const prev = document.getElementById("prevPage");
+  if (prev) prev.disabled = page === 0;
+  const next = document.getElementById("nextPage");
+  if (next) next.disabled = data.next_cursor === null;
 }
 
 async function addAccess() {
@@ -36,7 +59,7 @@ async function addAccess() {
 
   if (res.ok) {
     alert("✅ Access rule added.");
-    loadAccess();
+    loadAccess(accessPaging.page);
   } else {
     const err = await res.json();
     alert("❌ Error: " + err.detail);
@@ -49,11 +72,17 @@ async function deleteAccess(id) {
   const res = await fetch(`/api/access_matrix/${id}`, { method: "DELETE" });
   if (res.ok) {
     alert("🗑️ Deleted successfully.");
-    loadAccess();
+    loadAccess(accessPaging.page);
   } else {
     alert("❌ Failed to delete.");
   }
 }
 
 // Auto-load table on page load
-document.addEventListener("DOMContentLoaded", loadAccess);
+document.addEventListener("DOMContentLoaded", () => {
+  const prev = document.getElementById("prevPage");
+  if (prev) prev.addEventListener("click", () => accessPaging.page > 0 && loadAccess(accessPaging.page - 1));
+  const next = document.getElementById("nextPage");
+  if (next) next.addEventListener("click", () => accessPaging.nextCursor !== null && loadAccess(accessPaging.page + 1));
+  loadAccess(0);
+});
@@ -1,34 +1,290 @@
-from core.db import SessionLocal
+import os
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy.exc import SQLAlchemyError
+from core.utils.utils_db_session import module_engine
 from core.utils.safe_import import safe_import
+from core.utils.utils_instrumentation import timed
+from core.utils.utils_read_replica import read_session_scope
+from core.utils.utils_table_versions import read_table_versions, track_tables
 
+# 🧠 In-process compiled permission index.
+# Each (role_id, user_id) subject is compiled once into hashed sets and then
+# answered from memory until the access version is bumped by a mutation.
+# Mutations made by other workers are picked up from the shared
+# core_table_versions counter, read at most once per ACCESS_VERSION_CHECK_MS;
+# entries also expire after ACCESS_INDEX_TTL_SECONDS as a backstop.
+ACCESS_INDEX_MAX_ENTRIES = 4096
+ACCESS_VERSION_CHECK_SECONDS = int(os.getenv("ACCESS_VERSION_CHECK_MS", "1000")) / 1000
+ACCESS_INDEX_TTL_SECONDS = float(os.getenv("ACCESS_INDEX_TTL_SECONDS", "300"))
+
+_index_lock = threading.Lock()
+_index = OrderedDict()
+_index_stats = {"hits": 0, "misses": 0, "invalidations": 0, "expired": 0, "shared_changes": 0}
+_access_version = 0
+_shared = {"version": None, "checked": float("-inf")}
+_access_model = None
+
+
+def _get_access_model():
+    """Resolve the AccessMatrix model once and reuse it on later checks."""
+    global _access_model
+    if _access_model is None:
+        _access_model = safe_import("model_access_matrix", "models", "AccessMatrix")
+        # Rule writes bump this counter, so replica reads can tell when they are behind
+        track_tables(_access_model.__tablename__)
+    return _access_model
+
+
+def bump_access_version():
+    """
+    Invalidate every compiled entry.
+    Must be called by routes that add or remove access rules.
+    """
+    with _index_lock:
+        return _invalidate()
+
+
+def _invalidate():
+    # Caller holds _index_lock
+    global _access_version
+    _access_version += 1
+    _index.clear()
+    _index_stats["invalidations"] += 1
+    return _access_version
+
+
+def _sync_shared_version(AccessMatrix):
+    """Clear the index when the shared rule counter moved (a write in any worker)."""
+    now = time.monotonic()
+    with _index_lock:
+        if now - _shared["checked"] < ACCESS_VERSION_CHECK_SECONDS:
+            return
+        _shared["checked"] = now
+    name = AccessMatrix.__tablename__
+    try:
+        # Always the primary: the replica may not have the write yet
+        with module_engine.connect() as conn:
+            version = read_table_versions(conn, [name])[name]
+    except SQLAlchemyError as e:
+        print(f"⚠️ Access version check failed: {e}")
+        return
+    with _index_lock:
+        if _shared["version"] is not None and version != _shared["version"]:
+            _index_stats["shared_changes"] += 1
+            _invalidate()
+        _shared["version"] = version
+
+
+def access_index_stats():
+    """Return hit/miss counters and size of the compiled permission index."""
+    with _index_lock:
+        return dict(_index_stats, version=_access_version, shared_version=_shared["version"], entries=len(_index))
+
+
+# 🌳 Hierarchical patterns
+# Module and permission values are dotted paths ("appointments.reports", "view").
+# A "*" segment matches exactly one segment; a trailing "*" matches the rest of
+# that part (zero or more segments), so "*" alone still means "anything".
+_SEP = "\x00"        # boundary between module and permission segments
+_ONE = "*"           # exactly one segment
+_REST = "\x01*"      # trailing wildcard: remaining segments of the part
+
+
+def _pattern_segments(module, permission):
+    segments = []
+    for part in (module, permission):
+        parts = part.split(".")
+        if parts[-1] == _ONE:
+            parts[-1] = _REST
+        segments.extend(parts)
+        segments.append(_SEP)
+    return segments
+
+
+def _check_segments(module_name, permission):
+    return module_name.split(".") + [_SEP] + permission.split(".") + [_SEP]
+
+
+def _trie_insert(root, segments):
+    node = root
+    for seg in segments:
+        node = node.setdefault(seg, {})
+    node[None] = True
+
+
+def _trie_match(node, path, i=0):
+    """Walk the trie; cost depends on path length and wildcard fan-out, not rule count."""
+    if i == len(path):
+        return None in node
+
+    seg = path[i]
+    child = node.get(seg)
+    if child is not None and _trie_match(child, path, i + 1):
+        return True
+
+    if seg == _SEP:
+        # A trailing wildcard may consume zero segments of this part
+        rest = node.get(_REST)
+        return rest is not None and _trie_match(rest, path, i)
+
+    child = node.get(_ONE)
+    if child is not None and _trie_match(child, path, i + 1):
+        return True
+
+    rest = node.get(_REST)
+    if rest is not None:
+        # Consume segments up to the part boundary, then continue after it
+        j = i
+        while path[j] != _SEP:
+            j += 1
+        if _trie_match(rest, path, j):
+            return True
+    return False
+
+
+def _compile_rules(rules):
+    """
+    Compile (module, permission) patterns for one subject:
+      exact    -> {(module, permission)} for literal rules, O(1) hash lookup
+      trie     -> segment trie holding every wildcard pattern
+      all      -> "*" / "*" superuser rule
+      patterns -> raw rules, kept for effective-permission listings
+    """
+    compiled = {"exact": set(), "trie": {}, "all": False, "patterns": set()}
+    for module, permission in rules:
+        compiled["patterns"].add((module, permission))
+        if module == "*" and permission == "*":
+            compiled["all"] = True
+        elif _ONE in module.split(".") or _ONE in permission.split("."):
+            _trie_insert(compiled["trie"], _pattern_segments(module, permission))
+        else:
+            compiled["exact"].add((module, permission))
+    return compiled
+
+
+def _match(compiled, module_name: str, permission: str) -> bool:
+    return (
+        compiled["all"]
+        or (module_name, permission) in compiled["exact"]
+        or (bool(compiled["trie"]) and _trie_match(compiled["trie"], _check_segments(module_name, permission)))
+    )
+
+
+def _load_rules(AccessMatrix, role_id, user_id):
+    """Fetch the raw (module, permission) pairs for a role/user subject."""
+    conditions = []
+    if role_id is not None:
+        conditions.append(AccessMatrix.role_id == role_id)
+    if user_id is not None:
+        conditions.append(AccessMatrix.user_id == user_id)
+    if not conditions:
+        return []
+
+    criteria = conditions[0]
+    for c in conditions[1:]:
+        criteria = criteria | c
+
+    # Compiled rules are cached, so only read the replica once it has every rule change
+    with read_session_scope(tables=(AccessMatrix.__tablename__,)) as db:
+        return db.query(AccessMatrix.module, AccessMatrix.permission).filter(criteria).all()
+
+
+def _get_compiled(AccessMatrix, role_id, user_id):
+    _sync_shared_version(AccessMatrix)
+    key = (role_id, user_id)
+    now = time.monotonic()
+    with _index_lock:
+        entry = _index.get(key)
+        if entry is not None:
+            compiled, loaded_at = entry
+            if now - loaded_at < ACCESS_INDEX_TTL_SECONDS:
+                _index.move_to_end(key)
+                _index_stats["hits"] += 1
+                return compiled
+            del _index[key]
+            _index_stats["expired"] += 1
+        _index_stats["misses"] += 1
+        version = _access_version
+
+    compiled = _compile_rules(_load_rules(AccessMatrix, role_id, user_id))
+
+    with _index_lock:
+        # Only publish if no mutation happened while we were loading
+        if version == _access_version:
+            _index[key] = (compiled, now)
+            if len(_index) > ACCESS_INDEX_MAX_ENTRIES:
+                _index.popitem(last=False)
+    return compiled
+
+
+@timed("access_matrix", "user_has_access")
 def user_has_access(user, module_name: str, permission: str = "view"):
     """
     Returns True if user has access to given module/permission.
-    Wildcards in AccessMatrix are respected (*).
+    Wildcards and dotted patterns in AccessMatrix are respected
+    (*, appointments.*, *.view, staff_invites.create).
     Falls back to True if AccessMatrix not found.
+    Checks are served from the compiled index; the DB is only hit on a miss.
     """
-    AccessMatrix = safe_import("model_access_matrix", "models", "AccessMatrix")
+    AccessMatrix = _get_access_model()
     if not AccessMatrix:
         return True
 
-    db = SessionLocal()
     role_id = getattr(user, "role_id", None)
     user_id = getattr(user, "id", None)
 
     try:
-        rows = db.query(AccessMatrix).filter(
-            (AccessMatrix.role_id == role_id) | (AccessMatrix.user_id == user_id)
-        ).all()
-        for r in rows:
-            if (
-                r.module in ("*", module_name)
-                and (r.permission in ("*", permission))
-            ):
-                db.close()
-                return True
-        db.close()
-        return False
+        compiled = _get_compiled(AccessMatrix, role_id, user_id)
+        return _match(compiled, module_name, permission)
     except Exception as e:
         print(f"⚠️ Access check failed: {e}")
-        db.close()
         return True
+
+
+def _expand_compiled(compiled):
+    """Turn a compiled entry back into a {module pattern: [permission patterns]} map."""
+    granted = {}
+    for module, permission in compiled["patterns"]:
+        granted.setdefault(module, set()).add(permission)
+    return {m: sorted(p) for m, p in sorted(granted.items())}
+
+
+def effective_permissions(user, checks="all"):
+    """
+    Evaluate many permissions for one user with at most one DB query.
+
+    checks="all"  -> {"all": bool, "modules": {module: [permissions]}}
+    checks=[(module, permission), ...] -> {module: {permission: bool}}
+    Falls back to granting everything if AccessMatrix not found.
+    """
+    AccessMatrix = _get_access_model()
+    role_id = getattr(user, "role_id", None)
+    user_id = getattr(user, "id", None)
+
+    if not AccessMatrix:
+        if checks == "all":
+            return {"all": True, "modules": {"*": ["*"]}}
+        compiled = _compile_rules([("*", "*")])
+    else:
+        try:
+            compiled = _get_compiled(AccessMatrix, role_id, user_id)
+        except Exception as e:
+            print(f"⚠️ Access check failed: {e}")
+            compiled = _compile_rules([("*", "*")])
+
+    if checks == "all":
+        return {"all": compiled["all"], "modules": _expand_compiled(compiled)}
+
+    result = {}
+    for module_name, permission in checks:
+        result.setdefault(module_name, {})[permission] = _match(compiled, module_name, permission)
+    return result
+
+
+def visible_modules(user, module_names, permission: str = "view"):
+    """Return the subset of module slugs the user may see, e.g. for sidebar rendering."""
+    checks = [(m, permission) for m in module_names]
+    granted = effective_permissions(user, checks)
+    return [m for m in module_names if granted[m][permission]]
@@ -1,15 +1,82 @@
 import os, sys
 from core.db import Base, engine
+from sqlalchemy import func, insert, select, text
+from core.utils.utils_install_planner import add_missing_columns
 
-# Ensure local 'models' directory is importable
-current_dir = os.path.dirname(os.path.abspath(__file__))
-models_path = os.path.join(current_dir, "models")
-if models_path not in sys.path:
+
+def _add_missing_columns(table):
+    """Add columns introduced after the table was first created (data kept)."""
+    with engine.begin() as conn:
+        for ddl in add_missing_columns(conn, table):
+            print(f"🧩 {ddl}")
+
+
+def _create_missing_indexes(table):
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+
+def _fill_missing_dates(conn, Appointment):
+    """Give undated rows a date (install time) so the column can be NOT NULL."""
+    table = Appointment.__table__
+    result = conn.execute(table.update().where(table.c.date.is_(None)).values(date=func.now()))
+    if result.rowcount:
+        print(f"🗓️ Dated {result.rowcount} appointment(s) that had no date.")
+    # SQLite cannot alter a column's nullability; the model and routes never write NULL
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN date SET NOT NULL"))
+
+
+def _backfill_stats(conn, Appointment, AppointmentDailyStat):
+    """Seed the rollup from existing appointments the first time it is created."""
+    stats = AppointmentDailyStat.__table__
+    if conn.execute(select(func.count()).select_from(stats)).scalar():
+        return
+    day = func.date(Appointment.date)
+    status = func.coalesce(Appointment.status, "pending")
+    dentist = func.coalesce(Appointment.dentist_name, "")
+    result = conn.execute(insert(stats).from_select(
+        ["day", "status", "dentist_name", "count"],
+        select(day, status, dentist, func.count()).group_by(day, status, dentist),
+    ))
+    if result.rowcount:
+        print(f"📊 Backfilled {result.rowcount} appointment stat rows.")
+
+
+def _load_models():
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    models_path = os.path.join(current_dir, "models")
+    # Once the router is loaded the models live under models.appointment_model;
+    # importing the file again would redefine the tables
+    loaded = sys.modules.get("models.appointment_model")
+    if loaded is not None and os.path.dirname(os.path.abspath(loaded.__file__)) == models_path:
+        return loaded.Appointment, loaded.AppointmentDailyStat, loaded.AppointmentDentistLock
     sys.path.insert(0, models_path)
+    try:
+        from appointment_model import Appointment, AppointmentDailyStat, AppointmentDentistLock
+        return Appointment, AppointmentDailyStat, AppointmentDentistLock
+    finally:
+        if models_path in sys.path:
+            sys.path.remove(models_path)
 
-from appointment_model import Appointment
 
 def install(app=None):
-    """Register Appointment model and create its table."""
-    Base.metadata.create_all(bind=engine, tables=[Appointment.__table__])
+    """Register Appointment models, create tables, migrate columns/indexes and seed stats."""
+    Appointment, AppointmentDailyStat, AppointmentDentistLock = _load_models()
+    Base.metadata.create_all(
+        bind=engine,
+        tables=[Appointment.__table__, AppointmentDailyStat.__table__, AppointmentDentistLock.__table__],
+    )
+    _add_missing_columns(Appointment.__table__)
+    _create_missing_indexes(Appointment.__table__)
+    with engine.begin() as conn:
+        _fill_missing_dates(conn, Appointment)
+        _backfill_stats(conn, Appointment, AppointmentDailyStat)
     print("✅ Appointments module installed successfully.")
+
+
+def post_install(conn):
+    """Data step for the batched installer (core.utils.utils_install_planner); schema is already in place."""
+    Appointment, AppointmentDailyStat, _ = _load_models()
+    _fill_missing_dates(conn, Appointment)
+    _backfill_stats(conn, Appointment, AppointmentDailyStat)
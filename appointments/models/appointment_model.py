@@ -1,9 +1,52 @@
 from core.db import Base
-from sqlalchemy import Column, Integer, String, DateTime, func
+from sqlalchemy import Column, Integer, String, Date, DateTime, Index, UniqueConstraint, func
+
+APPOINTMENT_STATUSES = ("pending", "confirmed", "completed", "cancelled", "no_show")
+MAX_DURATION_MINUTES = 480
 
 class Appointment(Base):
     __tablename__ = "appointments"
     id = Column(Integer, primary_key=True, index=True)
     patient_name = Column(String(100), nullable=False)
-    date = Column(DateTime(timezone=True), server_default=func.now())
+    patient_email = Column(String(255))
+    dentist_name = Column(String(100))
+    # NOT NULL: the listing keyset-paginates on (date, id); install.py fills legacy NULLs
+    date = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    duration_minutes = Column(Integer, nullable=False, default=30, server_default="30")
+    status = Column(String(20), nullable=False, default="pending", server_default="pending")
     notes = Column(String(255))
+    reminder_sent_at = Column(DateTime)
+    # Set with reminder_sent_at by the claiming worker; its batch is re-read by this token
+    reminder_claim_token = Column(String(32))
+
+    __table_args__ = (
+        # Keyset pagination walks (date, id); status filters narrow the same range
+        Index("ix_appointments_date_id", "date", "id"),
+        Index("ix_appointments_status_date", "status", "date"),
+        # Availability lookups read one dentist's appointments for a day range
+        Index("ix_appointments_dentist_date", "dentist_name", "date"),
+        # Reminder scheduler refills by date window among unsent reminders
+        Index("ix_appointments_reminder_date", "reminder_sent_at", "date"),
+    )
+
+
+class AppointmentDailyStat(Base):
+    """Rollup of appointment counts per day/status/dentist, kept current on every write."""
+    __tablename__ = "appointment_daily_stats"
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)
+    status = Column(String(20), nullable=False)
+    # "" when no dentist is assigned, so the unique key never contains NULL
+    dentist_name = Column(String(100), nullable=False, default="", server_default="")
+    count = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        UniqueConstraint("day", "status", "dentist_name", name="_unique_appointment_stat"),
+    )
+
+
+class AppointmentDentistLock(Base):
+    """One row per dentist; bookings lock it so conflict check and insert are serialized across workers."""
+    __tablename__ = "appointment_dentist_locks"
+    dentist_name = Column(String(100), primary_key=True)
+    locked_at = Column(DateTime)
@@ -1,9 +1,7 @@
 # modules/appointments/page_routes/appointments_page.py
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
-
-templates = Jinja2Templates(directory="templates")
+from core.utils.utils_templates import templates
 
 router = APIRouter(prefix="/appointments", tags=["Appointments Pages"])
 
@@ -1,21 +1,196 @@
-from fastapi import APIRouter, HTTPException
-from core.db import SessionLocal
-from models.appointment_model import Appointment
+import os
+from datetime import date as date_type, datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+from core.utils.utils_db_session import fetch_all, get_db, module_db
+from models.appointment_model import Appointment, APPOINTMENT_STATUSES, MAX_DURATION_MINUTES
+from utils.utils_availability import SLOT_MINUTES, SlotConflict, book_slot, free_slots, invalidate_booking
+from utils.utils_import import IMPORT_CHUNK_SIZE, import_appointments_upload
+from utils.utils_stats import get_stats
 
 router = APIRouter(prefix="/api/appointments", tags=["Appointments"])
 
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 200
+MODULE_MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "module.json")
+
+
+def _encode_cursor(row):
+    return f"{row.date.isoformat()}|{row.id}"
+
+
+def _decode_cursor(cursor: str):
+    try:
+        date_part, id_part = cursor.rsplit("|", 1)
+        return datetime.fromisoformat(date_part), int(id_part)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _serialize_appointment(row):
+    return {
+        "id": row.id,
+        "patient": row.patient_name,
+        "dentist": row.dentist_name,
+        "date": row.date.isoformat() if row.date else None,
+        "status": row.status,
+        "notes": row.notes,
+    }
+
+
 @router.get("/")
-def list_appointments():
-    db = SessionLocal()
-    data = db.query(Appointment).all()
-    db.close()
-    return {"appointments": [a.__dict__ for a in data]}
+async def list_appointments(
+    page: int = Query(1, ge=1),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Keyset cursor from a previous next_cursor"),
+    status: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    q: Optional[str] = None,
+    db=Depends(module_db("appointments", MODULE_MANIFEST, read_only=True)),
+):
+    """
+    Paginated appointments, newest first.
+    Uses keyset pagination on (date, id) when a cursor is given, page/limit otherwise.
+    """
+    query = select(
+        Appointment.id,
+        Appointment.patient_name,
+        Appointment.dentist_name,
+        Appointment.date,
+        Appointment.status,
+        Appointment.notes,
+    )
+
+    if status:
+        query = query.filter(Appointment.status == status)
+    if date_from:
+        query = query.filter(Appointment.date >= date_from)
+    if date_to:
+        query = query.filter(Appointment.date < date_to)
+    if q:
+        query = query.filter(Appointment.patient_name.ilike(f"%{q}%"))
+
+    if cursor:
+        cursor_date, cursor_id = _decode_cursor(cursor)
+        query = query.filter(
+            or_(
+                Appointment.date < cursor_date,
+                and_(Appointment.date == cursor_date, Appointment.id < cursor_id),
+            )
+        )
+    else:
+        query = query.offset((page - 1) * limit)
+
+    rows = await fetch_all(
+        db,
+        query.order_by(Appointment.date.desc(), Appointment.id.desc()).limit(limit + 1),
+    )
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "items": [_serialize_appointment(r) for r in rows],
+        "page": page,
+        "limit": limit,
+        "has_more": has_more,
+        "next_cursor": _encode_cursor(rows[-1]) if has_more else None,
+    }
 
 @router.post("/")
-def create_appointment(patient_name: str, doctor_name: str):
-    db = SessionLocal()
-    appointment = Appointment(patient_name=patient_name, doctor_name=doctor_name)
-    db.add(appointment)
+def create_appointment(
+    patient_name: str,
+    patient_email: Optional[str] = None,
+    dentist_name: Optional[str] = None,
+    date: Optional[datetime] = None,
+    duration_minutes: int = Query(SLOT_MINUTES, ge=5, le=MAX_DURATION_MINUTES),
+    notes: Optional[str] = None,
+    # Name used before dentist_name; still accepted so existing clients keep working
+    doctor_name: Optional[str] = Query(None, deprecated=True, description="Deprecated alias of dentist_name"),
+    db: Session = Depends(get_db),
+):
+    dentist_name = dentist_name or doctor_name
+    appointment = Appointment(
+        patient_name=patient_name,
+        patient_email=patient_email,
+        dentist_name=dentist_name,
+        date=date or datetime.now(),
+        duration_minutes=duration_minutes,
+        notes=notes,
+    )
+    try:
+        book_slot(db, appointment)
+        appointment_id = appointment.id
+    except SlotConflict as e:
+        raise HTTPException(status_code=409, detail=f"{dentist_name} is already booked at that time (appointment #{e.conflicting_id})")
+    return {"message": "Appointment created successfully", "id": appointment_id}
+
+
+@router.patch("/{appointment_id}")
+def update_appointment_status(appointment_id: int, status: str, db: Session = Depends(get_db)):
+    """Change an appointment's status (confirm, complete, cancel...)."""
+    if status not in APPOINTMENT_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Invalid status '{status}'")
+
+    appointment = db.query(Appointment).get(appointment_id)
+    if not appointment:
+        raise HTTPException(status_code=404, detail="Appointment not found")
+    appointment.status = status
     db.commit()
-    db.close()
-    return {"message": "Appointment created successfully"}
+    if appointment.dentist_name and appointment.date:
+        invalidate_booking(appointment.dentist_name, appointment.date, appointment.duration_minutes)
+    return {"message": f"Appointment #{appointment_id} marked as {status}"}
+
+
+@router.get("/stats")
+def appointment_stats(
+    date_from: Optional[date_type] = None,
+    date_to: Optional[date_type] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Dashboard counts per day, status and dentist, served from the rollup table.
+    Without dates the last APPOINTMENT_STATS_DEFAULT_DAYS days (default 90) are counted.
+    """
+    return get_stats(db, date_from, date_to)
+
+
+@router.get("/availability")
+def get_availability(
+    dentist: str,
+    days: int = Query(7, ge=1, le=60),
+    slot_minutes: int = Query(SLOT_MINUTES, ge=5, le=240),
+):
+    """Free slots for a dentist over the next N days."""
+    return {
+        "dentist": dentist,
+        "slot_minutes": slot_minutes,
+        "slots": free_slots(dentist, days=days, slot_minutes=slot_minutes),
+    }
+
+
+@router.post("/import")
+def import_appointments(
+    file: UploadFile = File(...),
+    chunk_size: int = Query(IMPORT_CHUNK_SIZE, ge=100, le=10000),
+):
+    """
+    Bulk-import appointments from CSV.
+    The upload is read and inserted chunk by chunk; only the per-chunk progress
+    and (capped) per-row errors are kept for the response.
+    """
+    progress, errors, summary = [], [], None
+    try:
+        for event in import_appointments_upload(file.file, chunk_size=chunk_size):
+            if event["type"] == "error":
+                errors.append(event)
+            elif event["type"] == "progress":
+                progress.append(event)
+            else:
+                summary = event
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Import aborted after {len(progress)} chunk(s): {e}")
+
+    return {"summary": summary, "progress": progress, "errors": errors}
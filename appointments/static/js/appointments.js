@@ -5,6 +5,7 @@
     pageSize: 10,
     status: "all",
     search: "",
+    hasMore: false,
     rows: []
   };
 
@@ -32,18 +33,17 @@
 
   async function fetchRows() {
     try {
-      const params = new URLSearchParams({
-        page: state.page,
-        page_size: state.pageSize,
-        status: state.status === "all" ? "" : state.status,
-        q: state.search
-      });
-      const res = await fetch(`/api/appointments?${params.toString()}`);
+      const params = new URLSearchParams({ page: state.page, limit: state.pageSize });
+      if (state.status !== "all") params.set("status", state.status);
+      if (state.search) params.set("q", state.search);
+      const res = await fetch(`/api/appointments/?${params.toString()}`);
       if (!res.ok) throw new Error("No API yet");
       const data = await res.json();
       state.rows = Array.isArray(data.items) ? data.items : [];
+      state.hasMore = Boolean(data.has_more);
     } catch {
       state.rows = sampleRows.slice();
+      state.hasMore = false;
     }
     renderTable();
   }
@@ -52,20 +52,12 @@
     const tbody = qs(".appointments-table tbody");
     if (!tbody) return;
 
-    const filtered = state.rows.filter(row => {
-      const matchStatus = state.status === "all" || String(row.status).toLowerCase() === state.status;
-      const matchSearch = !state.search || JSON.stringify(row).toLowerCase().includes(state.search.toLowerCase());
-      return matchStatus && matchSearch;
-    });
-
-    const start = (state.page - 1) * state.pageSize;
-    const pageRows = filtered.slice(start, start + state.pageSize);
-
-    tbody.innerHTML = pageRows.map(r => `
+    // Rows arrive already filtered and paged by the server
+    tbody.innerHTML = state.rows.map(r => `
       <tr>
         <td>#${r.id}</td>
         <td>${r.patient}</td>
-        <td>${r.dentist}</td>
+        <td>${r.dentist ?? "-"}</td>
         <td>${r.date}</td>
         <td>${statusBadge(r.status)}</td>
         <td class="text-end">
@@ -76,19 +68,18 @@
       </tr>
     `).join("");
 
-    renderPagination(filtered.length);
+    renderPagination();
   }
 
-  function renderPagination(total) {
+  function renderPagination() {
     const wrap = qs(".appointments-pagination");
     if (!wrap) return;
-    const totalPages = Math.max(1, Math.ceil(total / state.pageSize));
 
     wrap.innerHTML = `
       <div class="d-flex align-items-center gap-2">
         <button class="btn btn-sm btn-outline-secondary" data-page="prev" ${state.page <= 1 ? "disabled" : ""}>Prev</button>
-        <span class="small">Page ${state.page} / ${totalPages}</span>
-        <button class="btn btn-sm btn-outline-secondary" data-page="next" ${state.page >= totalPages ? "disabled" : ""}>Next</button>
+        <span class="small">Page ${state.page}</span>
+        <button class="btn btn-sm btn-outline-secondary" data-page="next" ${state.hasMore ? "" : "disabled"}>Next</button>
       </div>
     `;
   }
@@ -119,7 +110,7 @@
         const btn = e.target.closest("[data-page]");
         if (!btn) return;
         if (btn.dataset.page === "prev" && state.page > 1) state.page--;
-        if (btn.dataset.page === "next") state.page++;
+        if (btn.dataset.page === "next" && state.hasMore) state.page++;
         fetchRows();
       });
     }
@@ -139,7 +130,8 @@
         console.log("Reschedule", id);
       } else if (action === "cancel") {
         if (confirm("Cancel this appointment?")) {
-          console.log("Cancelled", id);
+          fetch(`/api/appointments/${id}?status=cancelled`, { method: "PATCH" })
+            .then(() => fetchRows());
         }
       }
     });
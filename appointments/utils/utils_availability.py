@@ -0,0 +1,232 @@
+"""
+modules/appointments/utils/utils_availability.py
+-------------------------------------------------
+Per-dentist availability engine.
+
+Booked slots are kept in a sorted interval list per (dentist, day), so a
+conflict check is a bisect instead of a scan over every appointment row.
+Day lists are loaded with one indexed (dentist_name, date) range query and
+cached briefly. An appointment that crosses midnight is listed on every day
+it touches.
+
+Bookings re-read the days they touch inside the booking transaction, after
+locking the dentist's row in appointment_dentist_locks, so the check and the
+insert are atomic across workers. Times are compared as naive local time;
+timezone-aware values are converted first.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, update
+from sqlalchemy.exc import IntegrityError
+from core.utils.utils_db_session import session_scope
+from models.appointment_model import Appointment, AppointmentDentistLock, MAX_DURATION_MINUTES
+
+CLINIC_OPEN_HOUR = int(os.getenv("CLINIC_OPEN_HOUR", "9"))
+CLINIC_CLOSE_HOUR = int(os.getenv("CLINIC_CLOSE_HOUR", "17"))
+SLOT_MINUTES = int(os.getenv("APPOINTMENT_SLOT_MINUTES", "30"))
+DAY_CACHE_TTL_SECONDS = 30
+
+# Cancelled appointments do not occupy the chair
+INACTIVE_STATUSES = ("cancelled",)
+
+_cache_lock = threading.Lock()
+_day_cache = {}          # (dentist, date) -> (loaded_at, [(start, end, id), ...])
+MAX_DURATION = timedelta(minutes=MAX_DURATION_MINUTES)
+
+
+class SlotConflict(Exception):
+    """Raised when a requested slot overlaps an existing booking."""
+
+    def __init__(self, conflicting_id):
+        super().__init__(f"Slot overlaps appointment #{conflicting_id}")
+        self.conflicting_id = conflicting_id
+
+
+def local_naive(value):
+    """Naive local time; aware values are converted rather than having their offset dropped."""
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def _interval(date, duration_minutes):
+    start = local_naive(date)
+    return start, start + timedelta(minutes=duration_minutes or SLOT_MINUTES)
+
+
+def _days_touched(start, end):
+    """Every calendar day [start, end) overlaps, in order."""
+    days, day = [], start.date()
+    while day <= (end - timedelta(microseconds=1)).date():
+        days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def _day_bounds(day):
+    start = datetime.combine(day, datetime.min.time())
+    return start, start + timedelta(days=1)
+
+
+def _load_intervals(db, dentist_name, first_day, last_day):
+    """One range query for [first_day, last_day]; returns {day: sorted intervals}."""
+    range_start, _ = _day_bounds(first_day)
+    _, range_end = _day_bounds(last_day)
+    # Start earlier so bookings running past midnight into first_day are included
+    range_start -= MAX_DURATION
+    rows = (
+        db.query(Appointment.id, Appointment.date, Appointment.duration_minutes)
+        .filter(
+            Appointment.dentist_name == dentist_name,
+            Appointment.date >= range_start,
+            Appointment.date < range_end,
+            Appointment.status.notin_(INACTIVE_STATUSES),
+        )
+        .order_by(Appointment.date.asc())
+        .all()
+    )
+
+    by_day = {}
+    day = first_day
+    while day <= last_day:
+        by_day[day] = []
+        day += timedelta(days=1)
+    for r in rows:
+        start, end = _interval(r.date, r.duration_minutes)
+        for touched in _days_touched(start, end):
+            if touched in by_day:
+                by_day[touched].append((start, end, r.id))
+    for intervals in by_day.values():
+        intervals.sort()
+    return by_day
+
+
+def _get_days(dentist_name, first_day, last_day, fresh=False):
+    """Return cached interval lists for each day, loading any stale ones in one query."""
+    now = time.monotonic()
+    result, missing = {}, []
+    day = first_day
+    with _cache_lock:
+        while day <= last_day:
+            entry = _day_cache.get((dentist_name, day))
+            if entry and not fresh and now - entry[0] < DAY_CACHE_TTL_SECONDS:
+                result[day] = entry[1]
+            else:
+                missing.append(day)
+            day += timedelta(days=1)
+
+    if missing:
+        with session_scope() as db:
+            loaded = _load_intervals(db, dentist_name, missing[0], missing[-1])
+        with _cache_lock:
+            for d in missing:
+                _day_cache[(dentist_name, d)] = (now, loaded[d])
+                result[d] = loaded[d]
+    return result
+
+
+def find_conflict(intervals, start, end):
+    """Return the id overlapping [start, end) in a sorted interval list, or None."""
+    # Walk back from the last booking starting before `end`; none can start
+    # more than MAX_DURATION before `start` and still reach it
+    i = bisect_left(intervals, (end,))
+    earliest = start - MAX_DURATION
+    while i > 0:
+        i -= 1
+        booked_start, booked_end, booked_id = intervals[i]
+        if booked_start < earliest:
+            break
+        if booked_end > start:
+            return booked_id
+    return None
+
+
+def invalidate_day(dentist_name, day):
+    """Drop a cached day so the next lookup re-reads it (after cancel/reschedule)."""
+    with _cache_lock:
+        _day_cache.pop((dentist_name, day), None)
+
+
+def invalidate_booking(dentist_name, date, duration_minutes):
+    """Drop every cached day a booking touches."""
+    for day in _days_touched(*_interval(date, duration_minutes)):
+        invalidate_day(dentist_name, day)
+
+
+def _lock_dentist(db, dentist_name):
+    """
+    Lock the dentist's row for the rest of the transaction. The UPDATE takes a
+    row lock on PostgreSQL/MySQL and the write lock on SQLite, so a second
+    booking for the same dentist waits here until the first commits.
+    """
+    table = AppointmentDentistLock.__table__
+    touch = update(table).where(table.c.dentist_name == dentist_name).values(locked_at=func.now())
+    if db.execute(touch).rowcount:
+        return
+    try:
+        with db.begin_nested():
+            db.execute(insert(table).values(dentist_name=dentist_name, locked_at=func.now()))
+    except IntegrityError:
+        # Another booking created the row first; wait for its lock
+        db.execute(touch)
+
+
+def book_slot(db, appointment):
+    """
+    Insert and commit `appointment` if its slot is free, otherwise raise SlotConflict.
+    The check and the insert share one transaction holding the dentist's lock
+    row, so two requests in any worker cannot both claim the same slot.
+    """
+    if not appointment.dentist_name or appointment.date is None:
+        db.add(appointment)
+        db.commit()
+        return appointment
+
+    start, end = _interval(appointment.date, appointment.duration_minutes)
+    days = _days_touched(start, end)
+    try:
+        _lock_dentist(db, appointment.dentist_name)
+        by_day = _load_intervals(db, appointment.dentist_name, days[0], days[-1])
+        for day in days:
+            conflict = find_conflict(by_day[day], start, end)
+            if conflict is not None:
+                raise SlotConflict(conflict)
+        db.add(appointment)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    for day in days:
+        invalidate_day(appointment.dentist_name, day)
+    return appointment
+
+
+def free_slots(dentist_name, days=7, start_day=None, slot_minutes=SLOT_MINUTES):
+    """
+    Free slots for a dentist over the next `days` days within clinic hours.
+    Returns {"YYYY-MM-DD": ["HH:MM", ...]}.
+    """
+    first_day = start_day or datetime.now().date()
+    last_day = first_day + timedelta(days=days - 1)
+    by_day = _get_days(dentist_name, first_day, last_day)
+    step = timedelta(minutes=slot_minutes)
+    now = datetime.now()
+
+    result = {}
+    for day in sorted(by_day):
+        intervals = by_day[day]
+        day_start, _ = _day_bounds(day)
+        cursor = day_start + timedelta(hours=CLINIC_OPEN_HOUR)
+        close = day_start + timedelta(hours=CLINIC_CLOSE_HOUR)
+        free = []
+        while cursor + step <= close:
+            if cursor >= now and find_conflict(intervals, cursor, cursor + step) is None:
+                free.append(cursor.strftime("%H:%M"))
+            cursor += step
+        result[day.isoformat()] = free
+    return result
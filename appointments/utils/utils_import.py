@@ -0,0 +1,145 @@
+"""
+modules/appointments/utils/utils_import.py
+-------------------------------------------
+Streaming CSV import for historical appointments.
+
+Rows are read incrementally, validated in chunks and written with one
+executemany insert + commit per chunk, so memory stays bounded by the chunk
+size regardless of file size.
+
+CLI:
+    python -m utils.utils_import appointments.csv [--chunk-size 1000]
+
+Expected header: patient_name,patient_email,dentist_name,date,duration_minutes,status,notes
+(only patient_name and date are required).
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import insert
+from core.utils.utils_db_session import session_scope
+from models.appointment_model import Appointment, APPOINTMENT_STATUSES, MAX_DURATION_MINUTES
+from utils.utils_stats import apply_stat_deltas, stat_key
+
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 500
+DATE_FORMATS = ("%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%m/%d/%Y %H:%M")
+
+
+def _parse_date(value):
+    value = (value or "").strip()
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"unrecognised date '{value}'")
+
+
+def validate_row(row):
+    """Turn one CSV dict into insert params; raises ValueError with a readable reason."""
+    patient_name = (row.get("patient_name") or "").strip()
+    if not patient_name:
+        raise ValueError("patient_name is required")
+    if len(patient_name) > 100:
+        raise ValueError("patient_name longer than 100 characters")
+
+    status = (row.get("status") or "pending").strip().lower()
+    if status not in APPOINTMENT_STATUSES:
+        raise ValueError(f"invalid status '{status}'")
+
+    duration = (row.get("duration_minutes") or "").strip()
+    duration = int(duration) if duration else 30
+    if not 5 <= duration <= MAX_DURATION_MINUTES:
+        raise ValueError(f"duration_minutes must be between 5 and {MAX_DURATION_MINUTES}")
+    notes = (row.get("notes") or "").strip() or None
+    if notes and len(notes) > 255:
+        raise ValueError("notes longer than 255 characters")
+
+    return {
+        "patient_name": patient_name,
+        "patient_email": (row.get("patient_email") or "").strip() or None,
+        "dentist_name": (row.get("dentist_name") or "").strip() or None,
+        "date": _parse_date(row.get("date")),
+        "duration_minutes": duration,
+        "status": status,
+        "notes": notes,
+    }
+
+
+def _flush(db, batch):
+    # Core inserts bypass the ORM flush hook, so roll the chunk into the stats here
+    deltas = Counter(stat_key(r["date"], r["status"], r["dentist_name"]) for r in batch)
+    db.execute(insert(Appointment.__table__), batch)
+    apply_stat_deltas(db.connection(), deltas)
+    db.commit()
+
+
+def import_appointments_csv(text_stream, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Import appointments from a text stream of CSV.
+    Yields progress dicts:
+      {"type": "error", "line": n, "error": "..."}     per rejected row
+      {"type": "progress", "processed": n, "inserted": n, "failed": n}  per chunk
+      {"type": "done", ...}                            once at the end
+    """
+    reader = csv.DictReader(text_stream)
+    processed = inserted = failed = 0
+    batch = []
+
+    with session_scope() as db:
+        for row in reader:
+            processed += 1
+            try:
+                batch.append(validate_row(row))
+            except ValueError as e:
+                failed += 1
+                if failed <= MAX_REPORTED_ERRORS:
+                    yield {"type": "error", "line": reader.line_num, "error": str(e)}
+
+            if len(batch) >= chunk_size:
+                _flush(db, batch)
+                inserted += len(batch)
+                batch = []
+                yield {"type": "progress", "processed": processed, "inserted": inserted, "failed": failed}
+
+        if batch:
+            _flush(db, batch)
+            inserted += len(batch)
+
+    yield {"type": "done", "processed": processed, "inserted": inserted, "failed": failed}
+
+
+def import_appointments_upload(binary_stream, chunk_size=IMPORT_CHUNK_SIZE, encoding="utf-8-sig"):
+    """Same as import_appointments_csv for a binary file object (e.g. an UploadFile)."""
+    text_stream = io.TextIOWrapper(binary_stream, encoding=encoding, newline="")
+    try:
+        yield from import_appointments_csv(text_stream, chunk_size=chunk_size)
+    finally:
+        text_stream.detach()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import appointments from a CSV file.")
+    parser.add_argument("csv_path")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    with open(args.csv_path, newline="", encoding="utf-8-sig") as f:
+        for event in import_appointments_csv(f, chunk_size=args.chunk_size):
+            print(json.dumps(event), file=sys.stderr if event["type"] == "error" else sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
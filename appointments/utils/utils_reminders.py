@@ -0,0 +1,262 @@
+"""
+modules/appointments/utils/utils_reminders.py
+----------------------------------------------
+Batched reminder scheduler for upcoming appointments.
+
+Every tick re-reads the unsent reminders for appointments in the next
+lead + window hours (one indexed range query, not a table scan) and keeps
+them in a heap ordered by reminder time. New, rescheduled or re-confirmed
+appointments are therefore picked up on the next tick, and a moved
+appointment's old heap entry is skipped. Due reminders are claimed in the
+database, which re-checks status and date (so several workers never send the
+same reminder twice, and a moved slot is not reminded at its old time), and
+delivered in batches over a single SMTP connection.
+
+SMTP settings are read by core.utils.utils_smtp (SMTP_HOST, ...). Without
+SMTP_HOST every message goes through core.utils.smtp_utils.send_email instead.
+
+CLI:
+    python -m utils.utils_reminders --once
+"""
+
+import argparse
+import heapq
+import os
+import smtplib
+import sys
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import update
+from core.utils.utils_db_session import session_scope
+from core.utils.smtp_utils import send_email
+from core.utils.utils_smtp import build_message, close_smtp, open_smtp, smtp_config
+from models.appointment_model import Appointment
+from utils.utils_availability import local_naive
+
+REMINDER_LEAD = timedelta(minutes=int(os.getenv("APPOINTMENT_REMINDER_LEAD_MINUTES", "1440")))
+REFILL_WINDOW = timedelta(hours=int(os.getenv("APPOINTMENT_REMINDER_WINDOW_HOURS", "6")))
+BATCH_SIZE = int(os.getenv("APPOINTMENT_REMINDER_BATCH_SIZE", "50"))
+TICK_SECONDS = int(os.getenv("APPOINTMENT_REMINDER_TICK_SECONDS", "60"))
+RETRY_DELAY = timedelta(minutes=5)
+REMINDABLE_STATUSES = ("pending", "confirmed")
+
+
+class SMTPBatch:
+    """Send several messages over one SMTP connection; falls back to send_email per message."""
+
+    def __init__(self, config=None):
+        self.config = config if config is not None else smtp_config()
+        self.server = None
+
+    def __enter__(self):
+        if self.config:
+            self.server = open_smtp(self.config)
+        return self
+
+    def send(self, to, subject, html_body):
+        if self.server is None:
+            send_email(to, subject, html_body)
+            return
+        self.server.send_message(build_message(self.config, to, subject, html_body))
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.server is not None:
+            close_smtp(self.server)
+        return False
+
+
+def reminder_body(patient_name, dentist_name, date):
+    with_dentist = f" with <b>{dentist_name}</b>" if dentist_name else ""
+    return f"""
+        <h3>Appointment reminder</h3>
+        <p>Hi {patient_name},</p>
+        <p>This is a reminder of your dental appointment{with_dentist} on
+        <b>{date.strftime('%Y-%m-%d %H:%M')}</b>.</p>
+        <p>If you need to reschedule, please contact the clinic.</p>
+    """
+
+
+class ReminderScheduler:
+    """Time-ordered heap of pending reminders, re-read for the upcoming window every tick."""
+
+    def __init__(self, lead=REMINDER_LEAD, window=REFILL_WINDOW, batch_size=BATCH_SIZE):
+        self.lead = lead
+        self.window = window
+        self.batch_size = batch_size
+        self.heap = []
+        self.scheduled = {}     # appointment id -> reminder time of its live heap entry
+        self.retrying = set()   # ids waiting out RETRY_DELAY after a failed send
+        self.stats = {"sent": 0, "failed": 0, "skipped": 0, "batches": 0}
+
+    def refill(self, now):
+        """Queue new or moved reminders for appointments in [now, now + lead + window)."""
+        horizon = now + self.lead + self.window
+        with session_scope() as db:
+            rows = db.query(Appointment.id, Appointment.date).filter(
+                Appointment.reminder_sent_at.is_(None),
+                Appointment.date >= now,
+                Appointment.date < horizon,
+                Appointment.status.in_(REMINDABLE_STATUSES),
+                Appointment.patient_email.isnot(None),
+            ).all()
+
+        queued = 0
+        for r in rows:
+            due_at = local_naive(r.date) - self.lead
+            if r.id in self.retrying or self.scheduled.get(r.id) == due_at:
+                continue
+            # A moved appointment gets a new entry; _pop_due drops the old one
+            self.scheduled[r.id] = due_at
+            heapq.heappush(self.heap, (due_at, r.id))
+            queued += 1
+        return queued
+
+    def _pop_due(self, now):
+        due = []
+        while self.heap and self.heap[0][0] <= now and len(due) < self.batch_size:
+            due_at, appointment_id = heapq.heappop(self.heap)
+            if self.scheduled.get(appointment_id) != due_at:
+                continue    # superseded by a later refill
+            del self.scheduled[appointment_id]
+            self.retrying.discard(appointment_id)
+            due.append(appointment_id)
+        return due
+
+    def _claim(self, ids, now):
+        """Mark reminders as sent and return the rows this worker won, in one round-trip pair."""
+        token = uuid.uuid4().hex
+        with session_scope() as db:
+            db.execute(
+                update(Appointment)
+                .where(
+                    Appointment.id.in_(ids),
+                    Appointment.reminder_sent_at.is_(None),
+                    Appointment.status.in_(REMINDABLE_STATUSES),
+                    # Re-checked at send time: cancelled or moved appointments are skipped here
+                    # and re-queued at their new time by the next refill
+                    Appointment.date >= now,
+                    Appointment.date <= now + self.lead,
+                )
+                .values(
+                    reminder_sent_at=datetime.now(timezone.utc).replace(tzinfo=None),
+                    reminder_claim_token=token,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            return db.query(
+                Appointment.id,
+                Appointment.patient_name,
+                Appointment.patient_email,
+                Appointment.dentist_name,
+                Appointment.date,
+            ).filter(Appointment.reminder_claim_token == token).all()
+
+    def _release(self, ids):
+        """Give failed reminders back so a later tick retries them."""
+        with session_scope() as db:
+            db.execute(
+                update(Appointment)
+                .where(Appointment.id.in_(ids))
+                .values(reminder_sent_at=None, reminder_claim_token=None)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+
+    def dispatch_due(self, now=None, smtp_factory=SMTPBatch):
+        """Send every reminder that is due, batch by batch. Returns the number sent."""
+        now = now or datetime.now()
+        self.refill(now)
+        sent = 0
+        while True:
+            ids = self._pop_due(now)
+            if not ids:
+                break
+            rows = self._claim(ids, now)
+            self.stats["skipped"] += len(ids) - len(rows)
+            if not rows:
+                continue
+
+            delivered, failed = 0, []
+            try:
+                with smtp_factory() as smtp:
+                    for r in rows:
+                        try:
+                            smtp.send(
+                                r.patient_email,
+                                "Your ByteSmile appointment reminder",
+                                reminder_body(r.patient_name, r.dentist_name, r.date),
+                            )
+                            delivered += 1
+                        except (smtplib.SMTPException, OSError) as e:
+                            print(f"⚠️ Reminder for appointment #{r.id} failed: {e}")
+                            failed.append(r.id)
+            except (smtplib.SMTPException, OSError) as e:
+                # Could not open the connection: nothing in this batch went out
+                print(f"⚠️ SMTP connection failed: {e}")
+                failed = [r.id for r in rows]
+
+            if failed:
+                self._release(failed)
+                retry_at = now + RETRY_DELAY
+                for appointment_id in failed:
+                    self.scheduled[appointment_id] = retry_at
+                    self.retrying.add(appointment_id)
+                    heapq.heappush(self.heap, (retry_at, appointment_id))
+            sent += delivered
+            self.stats["batches"] += 1
+            self.stats["failed"] += len(failed)
+        self.stats["sent"] += sent
+        return sent
+
+
+_scheduler = None
+_stop_event = threading.Event()
+
+
+def run_once(now=None):
+    """Single scheduler tick (for cron, tests and the CLI)."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = ReminderScheduler()
+    return _scheduler.dispatch_due(now)
+
+
+def start_reminder_scheduler(tick_seconds=TICK_SECONDS):
+    """Run run_once() every tick in a daemon thread."""
+    _stop_event.clear()
+
+    def loop():
+        while not _stop_event.is_set():
+            try:
+                run_once()
+            except Exception as e:
+                print(f"⚠️ Reminder tick failed: {e}")
+            _stop_event.wait(tick_seconds)
+
+    thread = threading.Thread(target=loop, name="appointment-reminders", daemon=True)
+    thread.start()
+    print("⏰ Appointment reminder scheduler started.")
+    return thread
+
+
+def stop_reminder_scheduler():
+    _stop_event.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send due appointment reminders.")
+    parser.add_argument("--once", action="store_true", help="Run a single tick and exit")
+    args = parser.parse_args(argv)
+
+    if args.once:
+        print(f"✉️ Sent {run_once()} reminder(s).")
+        return 0
+    start_reminder_scheduler().join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+modules/appointments/utils/utils_stats.py
+------------------------------------------
+Incrementally maintained appointment rollup (appointment_daily_stats).
+
+ORM writes through the shared module sessions are captured by a before_flush hook, so every
+create, reschedule, status change or delete adjusts the matching counters in
+the same transaction. Core bulk inserts (CSV import) call apply_stat_deltas().
+The table is backfilled from existing appointments by install.py.
+
+get_stats() always reads a bounded range of days: a missing date_from/date_to
+is filled in from APPOINTMENT_STATS_DEFAULT_DAYS (default 90, ending today).
+"""
+
+import os
+from collections import Counter
+from datetime import date as date_type, datetime, timedelta
+
+from sqlalchemy import event, insert, inspect, update
+from sqlalchemy.exc import IntegrityError
+from core.utils.utils_db_session import ModuleSessionLocal
+from models.appointment_model import Appointment, AppointmentDailyStat
+
+_stats_table = AppointmentDailyStat.__table__
+STATS_DEFAULT_DAYS = int(os.getenv("APPOINTMENT_STATS_DEFAULT_DAYS", "90"))
+
+
+def stat_key(date, status, dentist_name):
+    if date is None:
+        date = datetime.now()
+    if isinstance(date, datetime):
+        date = date.date()
+    return (date, status or "pending", dentist_name or "")
+
+
+def apply_stat_deltas(conn, deltas):
+    """Apply {(day, status, dentist): delta} as UPDATE count = count + delta, inserting missing keys."""
+    for (day, status, dentist), delta in deltas.items():
+        if not delta:
+            continue
+        criteria = (
+            _stats_table.c.day == day,
+            _stats_table.c.status == status,
+            _stats_table.c.dentist_name == dentist,
+        )
+        result = conn.execute(
+            update(_stats_table).where(*criteria).values(count=_stats_table.c.count + delta)
+        )
+        if result.rowcount:
+            continue
+        try:
+            with conn.begin_nested():
+                conn.execute(
+                    insert(_stats_table).values(day=day, status=status, dentist_name=dentist, count=delta)
+                )
+        except IntegrityError:
+            # Another writer created the row first; fold our delta into it
+            conn.execute(
+                update(_stats_table).where(*criteria).values(count=_stats_table.c.count + delta)
+            )
+
+
+def _old_value(state, attr):
+    history = state.attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(state.object, attr)
+
+
+def _collect_deltas(session):
+    deltas = Counter()
+    for obj in session.new:
+        if isinstance(obj, Appointment):
+            deltas[stat_key(obj.date, obj.status, obj.dentist_name)] += 1
+
+    for obj in session.dirty:
+        if not isinstance(obj, Appointment):
+            continue
+        state = inspect(obj)
+        if not any(state.attrs[a].history.has_changes() for a in ("date", "status", "dentist_name")):
+            continue
+        deltas[stat_key(_old_value(state, "date"), _old_value(state, "status"), _old_value(state, "dentist_name"))] -= 1
+        deltas[stat_key(obj.date, obj.status, obj.dentist_name)] += 1
+
+    for obj in session.deleted:
+        if isinstance(obj, Appointment):
+            state = inspect(obj)
+            deltas[stat_key(_old_value(state, "date"), _old_value(state, "status"), _old_value(state, "dentist_name"))] -= 1
+    return deltas
+
+
+@event.listens_for(ModuleSessionLocal, "before_flush")
+def _track_appointment_changes(session, flush_context, instances):
+    deltas = _collect_deltas(session)
+    if deltas:
+        apply_stat_deltas(session.connection(), deltas)
+
+
+def stats_window(date_from=None, date_to=None, days=STATS_DEFAULT_DAYS):
+    """Fill in a missing bound so the rollup read always covers a bounded range of days."""
+    span = timedelta(days=max(days, 1) - 1)
+    if date_to is None:
+        date_to = date_from + span if date_from else date_type.today()
+    if date_from is None:
+        date_from = date_to - span
+    return date_from, date_to
+
+
+def get_stats(db, date_from=None, date_to=None):
+    """Counts per day, per status and per dentist, read from the rollup only."""
+    date_from, date_to = stats_window(date_from, date_to)
+    query = db.query(
+        AppointmentDailyStat.day,
+        AppointmentDailyStat.status,
+        AppointmentDailyStat.dentist_name,
+        AppointmentDailyStat.count,
+    ).filter(
+        AppointmentDailyStat.day >= date_from,
+        AppointmentDailyStat.day <= date_to,
+        AppointmentDailyStat.count != 0,
+    )
+
+    per_day, per_status, per_dentist = Counter(), Counter(), Counter()
+    for r in query.all():
+        per_day[r.day.isoformat()] += r.count
+        per_status[r.status] += r.count
+        per_dentist[r.dentist_name or "Unassigned"] += r.count
+
+    return {
+        "date_from": date_from.isoformat(),
+        "date_to": date_to.isoformat(),
+        "total": sum(per_status.values()),
+        "per_day": dict(sorted(per_day.items())),
+        "per_status": dict(per_status),
+        "per_dentist": dict(per_dentist),
+    }
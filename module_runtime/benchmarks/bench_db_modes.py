@@ -0,0 +1,79 @@
+"""
+modules/module_runtime/benchmarks/bench_db_modes.py
+----------------------------------------------------
+Concurrent throughput of the module list routes with db_mode "sync"
+(Session in the threadpool) versus "async" (AsyncSession over aiosqlite).
+
+A module's db_mode is fixed when its router is imported, so each mode runs
+bench_modules.py in its own process with <SLUG>_DB_MODE set for every module
+and only the list scenarios selected. Both runs therefore go through the
+real module_db() / fetch_all() path and the real list_* routes on the same
+seeded data. Nothing is simulated: on a local sqlite file the comparison
+shows the per-request overhead of each path, not networked-database waits.
+
+Needs: everything bench_modules.py needs, plus aiosqlite and greenlet
+
+    python bench_db_modes.py --rows 20000 --requests 2000 --concurrency 200
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_MODULES = os.path.join(BENCH_DIR, "bench_modules.py")
+DB_MODE_SLUGS = ("access_matrix", "staff_invites", "appointments")
+LIST_ROUTES = ("access_matrix.list_access*", "staff_invites.list*", "staff_invites.roles", "appointments.list*")
+
+
+def run_mode(mode, args, out):
+    """One bench_modules.py run with every module forced to `mode`; returns its report."""
+    env = dict(os.environ, **{f"{slug.upper()}_DB_MODE": mode for slug in DB_MODE_SLUGS})
+    cmd = [
+        sys.executable, BENCH_MODULES,
+        "--rows", str(args.rows),
+        "--requests", str(args.requests),
+        "--concurrency", str(args.concurrency),
+        "--out", out,
+    ]
+    for pattern in args.routes or LIST_ROUTES:
+        cmd += ["--routes", pattern]
+    subprocess.run(cmd, env=env, check=True, stdout=None if args.verbose else subprocess.DEVNULL)
+    with open(out, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync vs async db_mode throughput of the module list routes.")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--routes", action="append", help="Scenario glob (repeatable); default: the list routes")
+    parser.add_argument("--out", help="Write both reports to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Show each run's own output")
+    args = parser.parse_args(argv)
+
+    reports = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("sync", "async"):
+            print(f"⏱️ Running the list routes with db_mode={mode}...")
+            reports[mode] = run_mode(mode, args, os.path.join(tmp, f"{mode}.json"))
+
+    print(f"rows={args.rows} requests={args.requests} concurrency={args.concurrency}")
+    print(f"{'route':36} {'sync req/s':>11} {'p99 ms':>9} {'async req/s':>12} {'p99 ms':>9}")
+    sync_routes, async_routes = reports["sync"]["routes"], reports["async"]["routes"]
+    for name in sync_routes:
+        s, a = sync_routes[name], async_routes.get(name, {})
+        print(f"{name:36} {s['rps'] or 0:11.1f} {s['p99_ms'] or 0:9.2f} {a.get('rps') or 0:12.1f} {a.get('p99_ms') or 0:9.2f}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
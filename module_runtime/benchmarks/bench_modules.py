@@ -0,0 +1,645 @@
+"""
+modules/module_runtime/benchmarks/bench_modules.py
+--------------------------------------------------
+Throughput and latency of every module API route, plus user_has_access, on a
+seeded local sqlite database. Writes a JSON report that can be compared
+across commits.
+
+The host app is replaced by the stand-ins in ./stand_ins:
+- core.db: an engine on a temp sqlite file
+- core.models.role/user
+- core.utils.auth_utils: always a superadmin
+- core.utils.smtp_utils: counts mail
+- core.utils.safe_import
+The module files are mapped into core.* following each module.json, the way
+the installer copies them. The app is then built with install_lazy_modules()
+and the schema is created with the batched install planner, so the benchmark
+exercises the same bootstrap as production.
+
+Each route scenario sends --requests requests from --concurrency concurrent
+clients (httpx over ASGI, in process). It records req/s, p50/p90/p99/max
+latency and status codes. Read scenarios run before write scenarios, so writes
+don't change what the reads measure.
+
+Needs: fastapi, sqlalchemy, httpx, python-multipart, email-validator,
+python-jose, werkzeug
+
+    python bench_modules.py --rows 100000 --concurrency 50 --out bench-report.json
+    python bench_modules.py --routes 'access_matrix.*' --compare bench-report.json
+
+--replica copies the seeded database to a second sqlite file and serves
+read-only routes from it (core.utils.utils_read_replica), to compare against
+a primary-only run.
+"""
+
+import argparse
+import asyncio
+import csv
+import fnmatch
+import inspect
+import io
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+STAND_INS_DIR = os.path.join(BENCH_DIR, "stand_ins")
+REPO_ROOT = os.path.dirname(os.path.dirname(BENCH_DIR))
+REPORT_VERSION = 1
+
+ROLES = ("superadmin", "admin", "manager", "dentist", "hygienist", "receptionist", "assistant", "staff")
+ACCESS_MODULES = (
+    "appointments", "patients", "billing", "inventory", "reports", "staff_invites", "access_matrix",
+    "treatments", "lab_orders", "prescriptions", "insurance", "payroll", "schedules", "messages",
+    "documents", "imaging", "referrals", "recalls", "expenses", "suppliers", "branches", "audit",
+    "settings", "analytics", "marketing",
+)
+PERMISSIONS = ("view", "create", "edit", "delete")
+DENTISTS = tuple(f"Dr. Bench {i}" for i in range(12))
+APPOINTMENT_STATUSES = ("pending", "confirmed", "completed", "cancelled", "no_show")
+SEED_CHUNK = 5000
+# Host packages the stand-ins provide; files installed elsewhere load from their module folder
+STAND_IN_PACKAGES = ("core.models", "core.routes", "core.utils", "page_routes")
+
+
+def _configure_env(args, tmp):
+    # Read at import time by the module runtime, so set before importing core.*
+    defaults = {
+        "BENCH_DB_URL": f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+        "MODULES_DIR": REPO_ROOT,
+        "MODULE_INDEX_PATH": os.path.join(tmp, "module_index.json"),
+        "MODULE_LAZY_LOADING": "0",
+        "STATIC_ASSET_BUILD": "0",
+        "TEMPLATE_PRELOAD": "0",
+        "TEMPLATE_BYTECODE_CACHE": "",
+        "TEMPLATES_DIR": os.path.join(tmp, "templates"),
+        "MODULE_INSTRUMENTATION": "1" if args.instrument else "0",
+        "SECRET_KEY": "bench-secret",
+        "ALGORITHM": "HS256",
+        "MY_DOMAIN": "http://bench",
+        # The stand-in core.* packages are assembled at runtime (install_stand_ins),
+        # so a fresh forkserver/spawn interpreter could not import the hashing worker
+        "INVITE_HASH_START_METHOD": "fork",
+    }
+    if args.replica:
+        # The copy is taken once after seeding; "any" keeps using it however old it gets
+        defaults.update({
+            "MODULE_DB_REPLICA_URL": f"sqlite:///{os.path.join(tmp, 'bench-replica.db')}",
+            "MODULE_DB_REPLICA_POLICY": "any",
+            "MODULE_DB_REPLICA_HEARTBEAT_SECONDS": "0",
+        })
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+def _manifests():
+    for slug in sorted(os.listdir(REPO_ROOT)):
+        path = os.path.join(REPO_ROOT, slug, "module.json")
+        if os.path.isfile(path):
+            with open(path, encoding="utf-8") as f:
+                yield slug, json.load(f)
+
+
+def install_stand_ins():
+    """Put the stand-ins first on sys.path and map module files into core.* like the installer."""
+    sys.path.insert(0, STAND_INS_DIR)
+    import importlib
+    packages = {}
+    for slug, manifest in _manifests():
+        for key in ("routes", "models", "utils", "page_routes"):
+            mapping = manifest.get(key)
+            if not isinstance(mapping, dict):
+                continue  # list form: loaded from the module folder by the loader
+            for src, dest in mapping.items():
+                package = os.path.dirname(dest).replace("/", ".")
+                if package not in STAND_IN_PACKAGES:
+                    continue
+                source_dir = os.path.dirname(os.path.join(REPO_ROOT, slug, src))
+                if package not in packages:
+                    packages[package] = importlib.import_module(package)
+                if source_dir not in packages[package].__path__:
+                    packages[package].__path__.append(source_dir)
+    return [slug for slug, manifest in _manifests() if manifest.get("status", "active") == "active"]
+
+
+def preload_list_models():
+    """
+    Import list-form models (e.g. appointments) under the names their routers use,
+    with the module folder on sys.path as the loader does, so the planner reuses them.
+    """
+    import importlib
+    for slug, manifest in _manifests():
+        models = manifest.get("models")
+        if not isinstance(models, list):
+            continue
+        module_dir = os.path.join(REPO_ROOT, slug)
+        if module_dir not in sys.path:
+            sys.path.insert(0, module_dir)
+        for src in models:
+            importlib.import_module(os.path.splitext(src)[0].replace("/", "."))
+
+
+def _insert_chunks(conn, table, rows):
+    from sqlalchemy import insert
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= SEED_CHUNK:
+            conn.execute(insert(table), chunk)
+            chunk = []
+    if chunk:
+        conn.execute(insert(table), chunk)
+
+
+def seed(engine, rows):
+    """Roles, users, `rows` access rules, appointments and invites (plus half as many outbox rows)."""
+    from core.models.role import Role
+    from core.models.user import User
+    from core.models.model_access_matrix import AccessMatrix
+    from core.models.model_staff_invites import Invites, InviteOutbox
+    Appointment = sys.modules["models.appointment_model"].Appointment
+
+    started = time.perf_counter()
+    combos = [(m, p) for m in ACCESS_MODULES for p in PERMISSIONS]
+    user_count = max(rows // len(combos) + 1, 10)
+    now = datetime.utcnow().replace(microsecond=0)
+    with engine.begin() as conn:
+        _insert_chunks(conn, Role.__table__, ({"id": i + 1, "name": name} for i, name in enumerate(ROLES)))
+        _insert_chunks(conn, User.__table__, (
+            {
+                "id": i, "username": f"user{i}", "email": f"user{i}@example.com", "full_name": f"User {i}",
+                "role_id": (i % len(ROLES)) + 1, "is_active": True, "created_at": now,
+            }
+            for i in range(1, user_count + 1)
+        ))
+        role_rules = [{"role_id": 1, "user_id": None, "module": "*", "permission": "*"}]
+        role_rules += [
+            {"role_id": role_id, "user_id": None, "module": f"{m}.*" if role_id == 2 else m, "permission": p}
+            for role_id in range(2, len(ROLES) + 1) for m, p in combos[: 10 * role_id]
+        ]
+        _insert_chunks(conn, AccessMatrix.__table__, role_rules)
+        _insert_chunks(conn, AccessMatrix.__table__, (
+            {"role_id": None, "user_id": k // len(combos) + 1, "module": combos[k % len(combos)][0],
+             "permission": combos[k % len(combos)][1]}
+            for k in range(max(rows - len(role_rules), 0))
+        ))
+        start = now - timedelta(days=180)
+        _insert_chunks(conn, Appointment.__table__, (
+            {
+                "patient_name": f"Patient {i}", "patient_email": f"patient{i}@example.com",
+                "dentist_name": DENTISTS[i % len(DENTISTS)],
+                "date": start + timedelta(minutes=30 * (i // len(DENTISTS))),
+                "duration_minutes": 30, "status": APPOINTMENT_STATUSES[i % len(APPOINTMENT_STATUSES)],
+            }
+            for i in range(rows)
+        ))
+        _insert_chunks(conn, Invites.__table__, (
+            {
+                "id": i, "email": f"invitee{i}@example.com", "role_id": (i % len(ROLES)) + 1,
+                "token": f"bench-token-{i}", "created_at": now - timedelta(minutes=i),
+                "expires_at": now + timedelta(hours=24) - timedelta(minutes=i), "accepted": i % 7 == 0,
+            }
+            for i in range(1, rows + 1)
+        ))
+        _insert_chunks(conn, InviteOutbox.__table__, (
+            {
+                "invite_id": i, "recipient": f"invitee{i}@example.com", "subject": "ByteSmile Invitation",
+                "body": "bench", "status": "sent", "attempts": 1, "next_attempt_at": now,
+                "created_at": now, "sent_at": now,
+            }
+            for i in range(1, rows + 1, 2)
+        ))
+    return {
+        "rows": rows, "users": user_count, "roles": len(ROLES),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def snapshot_replica(engine, replica_url):
+    """Copy the primary sqlite file to the replica, heartbeat included."""
+    from core.utils.utils_read_replica import write_heartbeat
+    write_heartbeat(engine)
+    source = sqlite3.connect(engine.url.database)
+    target = sqlite3.connect(replica_url.removeprefix("sqlite:///"))
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def _percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(math.ceil(q * len(ordered)) - 1, 0))]
+
+
+def _summary(latencies, elapsed, count):
+    ordered = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        "requests": count,
+        "seconds": round(elapsed, 3),
+        "rps": round(count / elapsed, 1) if elapsed else None,
+        "p50_ms": ms(_percentile(ordered, 0.50)),
+        "p90_ms": ms(_percentile(ordered, 0.90)),
+        "p99_ms": ms(_percentile(ordered, 0.99)),
+        "max_ms": ms(ordered[-1] if ordered else None),
+    }
+
+
+class Scenario:
+    """One route under load. `build(i)` returns httpx request kwargs for request number i."""
+
+    def __init__(self, name, method, path, build, writes=False, max_requests=None, setup=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.build = build
+        self.writes = writes
+        self.max_requests = max_requests
+        self.setup = setup
+
+
+def _csv_upload(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def build_scenarios(ctx):
+    """Every API route of the active modules. `ctx` carries seed sizes and prepared tokens."""
+    rnd = random.Random(42)
+    rows, users = ctx.rows, ctx.users
+    today = datetime.utcnow().date()
+
+    def rand_user():
+        return rnd.randint(1, users)
+
+    def invite_tokens(count, prefix):
+        # Fresh, signed invites for /verify and /accept
+        def setup():
+            from core.models.model_staff_invites import Invites
+            from core.utils.utils_db_session import session_scope
+            from core.utils.utils_staff_invites import create_invite_token
+            tokens = []
+            with session_scope() as db:
+                for i in range(count):
+                    email = f"{prefix}{i}@example.com"
+                    token = create_invite_token(email, "staff")
+                    db.add(Invites(email=email, role_id=len(ROLES), token=token))
+                    tokens.append(token)
+                db.commit()
+            ctx.tokens[prefix] = tokens
+        return setup
+
+    return [
+        # access_matrix
+        Scenario("access_matrix.list_access", "GET", "/api/access_matrix/",
+                 lambda i: {"params": {"cursor": rnd.randint(0, rows), "limit": 100}}),
+        Scenario("access_matrix.list_access_filtered", "GET", "/api/access_matrix/",
+                 lambda i: {"params": {"module": rnd.choice(ACCESS_MODULES), "permission": "view", "limit": 100}}),
+        Scenario("access_matrix.list_access_304", "GET", "/api/access_matrix/",
+                 lambda i: {"params": {"limit": 100}, "headers": {"If-None-Match": ctx.etags.get("access", "")}},
+                 setup=lambda: ctx.capture_etag("access", "/api/access_matrix/", {"limit": 100})),
+        # NDJSON over every matching row; each request reads a whole module's rules
+        Scenario("access_matrix.list_access_stream", "GET", "/api/access_matrix/",
+                 lambda i: {"params": {"stream": "true", "module": rnd.choice(ACCESS_MODULES)}}, max_requests=200),
+        Scenario("access_matrix.effective", "POST", "/api/access_matrix/effective",
+                 lambda i: {"json": {"user_id": rand_user(), "checks": "all"}}),
+        Scenario("access_matrix.index_stats", "GET", "/api/access_matrix/index/stats", lambda i: {}),
+        Scenario("access_matrix.add", "POST", "/api/access_matrix/add",
+                 lambda i: {"json": {"user_id": rand_user(), "module": f"bench_add_{i}", "permission": "view"}},
+                 writes=True),
+        Scenario("access_matrix.bulk", "POST", "/api/access_matrix/bulk",
+                 lambda i: {"json": {"mode": "upsert", "rules": [
+                     {"user_id": rand_user(), "module": f"bench_bulk_{i}", "permission": p} for p in PERMISSIONS
+                 ]}}, writes=True),
+        Scenario("access_matrix.remove", "DELETE", "/api/access_matrix/{id}",
+                 lambda i: {"path": {"id": rows - i}}, writes=True, max_requests=rows),
+
+        # appointments
+        Scenario("appointments.list", "GET", "/api/appointments/",
+                 lambda i: {"params": {"page": rnd.randint(1, 50), "limit": 20}}),
+        Scenario("appointments.list_filtered", "GET", "/api/appointments/",
+                 lambda i: {"params": {"status": rnd.choice(APPOINTMENT_STATUSES), "limit": 20,
+                                       "date_from": (today - timedelta(days=rnd.randint(1, 150))).isoformat()}}),
+        Scenario("appointments.stats", "GET", "/api/appointments/stats",
+                 lambda i: {"params": {"date_from": (today - timedelta(days=30)).isoformat(),
+                                       "date_to": today.isoformat()}}),
+        Scenario("appointments.availability", "GET", "/api/appointments/availability",
+                 lambda i: {"params": {"dentist": rnd.choice(DENTISTS), "days": 7}}),
+        Scenario("appointments.create", "POST", "/api/appointments/",
+                 lambda i: {"params": {
+                     "patient_name": f"Bench Patient {i}", "dentist_name": f"Dr. Create {i}",
+                     "date": datetime.combine(today + timedelta(days=1), datetime.min.time()).replace(hour=10).isoformat(),
+                 }}, writes=True),
+        Scenario("appointments.update_status", "PATCH", "/api/appointments/{id}",
+                 lambda i: {"path": {"id": rnd.randint(1, rows)}, "params": {"status": rnd.choice(APPOINTMENT_STATUSES)}},
+                 writes=True),
+        Scenario("appointments.import", "POST", "/api/appointments/import",
+                 lambda i: {"files": {"file": ("import.csv", _csv_upload(
+                     ("patient_name", "patient_email", "dentist_name", "date", "duration_minutes", "status", "notes"),
+                     [(f"Imported {i}-{j}", f"imp{i}-{j}@example.com", f"Dr. Import {i}",
+                       (datetime.combine(today + timedelta(days=30 + j // 16), datetime.min.time())
+                        + timedelta(hours=9, minutes=30 * (j % 16))).isoformat(), 30, "pending", "")
+                      for j in range(200)],
+                 ), "text/csv")}}, writes=True),
+
+        # staff_invites
+        Scenario("staff_invites.list", "GET", "/api/staff_invites/list",
+                 lambda i: {"params": {"status": rnd.choice(("all", "active", "expired", "accepted")),
+                                       "page": rnd.randint(1, 20), "limit": 50}}),
+        Scenario("staff_invites.list_304", "GET", "/api/staff_invites/list",
+                 lambda i: {"headers": {"If-None-Match": ctx.etags.get("invites", "")}},
+                 setup=lambda: ctx.capture_etag("invites", "/api/staff_invites/list", {})),
+        Scenario("staff_invites.roles", "GET", "/api/staff_invites/roles", lambda i: {}),
+        Scenario("staff_invites.verify", "GET", "/api/staff_invites/verify",
+                 lambda i: {"params": {"token": ctx.tokens["verify"][i % len(ctx.tokens["verify"])]}},
+                 setup=invite_tokens(100, "verify")),
+        Scenario("staff_invites.metrics", "GET", "/api/staff_invites/metrics", lambda i: {}),
+        Scenario("staff_invites.create", "POST", "/api/staff_invites/create",
+                 lambda i: {"json": {"email": f"created{i}@example.com", "role": "staff"}}, writes=True),
+        Scenario("staff_invites.bulk", "POST", "/api/staff_invites/bulk",
+                 lambda i: {"json": {"invites": [
+                     {"email": f"bulk{i}-{j}@example.com", "role": "staff"} for j in range(20)
+                 ]}}, writes=True),
+        Scenario("staff_invites.bulk_csv", "POST", "/api/staff_invites/bulk/csv",
+                 lambda i: {"files": {"file": ("invites.csv", _csv_upload(
+                     ("email", "role"), [(f"csv{i}-{j}@example.com", "staff") for j in range(20)],
+                 ), "text/csv")}}, writes=True),
+        # Every accept hashes a password; keep the count bounded
+        Scenario("staff_invites.accept", "POST", "/api/staff_invites/accept",
+                 lambda i: {"data": {"token": ctx.tokens["accept"][i], "password": "bench-password"}},
+                 writes=True, max_requests=200, setup=invite_tokens(min(ctx.requests, 200), "accept")),
+        Scenario("staff_invites.revoke", "DELETE", "/api/staff_invites/revoke",
+                 lambda i: {"params": {"token": f"bench-token-{rows - i}"}}, writes=True, max_requests=rows),
+
+        # module_runtime
+        Scenario("module_runtime.db_pool", "GET", "/api/module_runtime/db/pool", lambda i: {}),
+        Scenario("module_runtime.db_replica", "GET", "/api/module_runtime/db/replica", lambda i: {}),
+        Scenario("module_runtime.modules", "GET", "/api/module_runtime/modules", lambda i: {}),
+        Scenario("module_runtime.templates", "GET", "/api/module_runtime/templates", lambda i: {}),
+        Scenario("module_runtime.schema_plan", "GET", "/api/module_runtime/schema/plan",
+                 lambda i: {"params": [("modules", slug) for slug in ctx.slugs]}, max_requests=100),
+
+        # sample
+        Scenario("sample.list", "GET", "/api/sample/", lambda i: {}),
+    ]
+
+
+class BenchContext:
+    def __init__(self, client, args, seeded, slugs):
+        self.client = client
+        self.rows = args.rows
+        self.requests = args.requests
+        self.users = seeded["users"]
+        self.slugs = slugs
+        self.tokens = {}
+        self.etags = {}
+
+    async def capture_etag(self, key, path, params):
+        response = await self.client.get(path, params=params)
+        self.etags[key] = response.headers.get("etag", "")
+
+
+def _sql_queries_seen():
+    from core.utils.utils_instrumentation import metrics
+    with metrics._lock:
+        return sum(h.total for h in metrics.queries.values()), sum(h.count for h in metrics.queries.values())
+
+
+async def run_scenario(client, scenario, args):
+    total = min(args.requests, scenario.max_requests or args.requests)
+    setup = scenario.setup() if scenario.setup else None
+    if inspect.isawaitable(setup):
+        await setup
+
+    async def send(i):
+        kwargs = scenario.build(i)
+        path = scenario.path.format(**kwargs.pop("path", {}))
+        return await client.request(scenario.method, path, **kwargs)
+
+    if not scenario.writes:
+        for i in range(min(args.warmup, total)):
+            await send(i)
+
+    queries_before = _sql_queries_seen() if args.instrument else None
+    latencies, statuses = [], Counter()
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                status = str((await send(i)).status_code)
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(args.concurrency, total))))
+    result = _summary(latencies, time.perf_counter() - started, total)
+    result.update(
+        method=scenario.method,
+        path=scenario.path,
+        concurrency=min(args.concurrency, total),
+        statuses=dict(statuses),
+        errors=sum(n for s, n in statuses.items() if not (s.startswith("2") or s == "304")),
+    )
+    if queries_before is not None:
+        queries, count = _sql_queries_seen()
+        handled = count - queries_before[1]
+        result["sql_queries_per_request"] = round((queries - queries_before[0]) / handled, 2) if handled else None
+    return result
+
+
+def bench_user_has_access(users, calls, concurrency, cold):
+    """Concurrent permission checks; cold = each subject's first check after an index reset."""
+    from core.utils.utils_access_matrix import access_index_stats, bump_access_version, user_has_access
+
+    rnd = random.Random(7)
+    subjects = [SimpleNamespace(id=u, role_id=(u % len(ROLES)) + 1) for u in range(1, users + 1)]
+    bump_access_version()
+    if cold:
+        order = rnd.sample(subjects, min(calls, len(subjects)))
+    else:
+        hot = subjects[:200]
+        for subject in hot:
+            user_has_access(subject, "appointments", "view")
+        order = [rnd.choice(hot) for _ in range(calls)]
+    checks = [(rnd.choice(ACCESS_MODULES), rnd.choice(PERMISSIONS)) for _ in order]
+
+    def call(i):
+        started = time.perf_counter()
+        user_has_access(order[i], *checks[i])
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(call, range(len(order))))
+    result = _summary(latencies, time.perf_counter() - started, len(order))
+    result.update(concurrency=concurrency, index=access_index_stats())
+    return result
+
+
+def _selected(name, patterns):
+    return not patterns or any(fnmatch.fnmatch(name, p) for p in patterns)
+
+
+def _print_result(name, r):
+    print(f"{name:42} {r['rps'] or 0:9.1f} req/s   p50 {r['p50_ms'] or 0:8.2f} ms   "
+          f"p99 {r['p99_ms'] or 0:8.2f} ms   errors {r.get('errors', 0)}")
+
+
+def _git_revision():
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, timeout=10,
+        )
+        return result.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+async def bench(args):
+    slugs = install_stand_ins()
+    import fastapi
+    import sqlalchemy
+    from core.db import Base, engine
+    from core.models.role import Role
+    from core.models.user import User
+    from core.utils.utils_install_planner import plan_install
+    from core.utils.utils_module_index import install_lazy_modules
+
+    app = fastapi.FastAPI()
+    install_lazy_modules(app, modules_dir=REPO_ROOT)
+    report = {
+        "version": REPORT_VERSION,
+        "meta": {
+            "git": _git_revision(),
+            "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "fastapi": fastapi.__version__,
+            "rows": args.rows,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "instrumented": args.instrument,
+            "replica": args.replica,
+        },
+        "routes": {},
+        "functions": {},
+    }
+
+    # Schema first, so background workers started by module routers find their tables
+    preload_list_models()
+    Base.metadata.create_all(engine, tables=[Role.__table__, User.__table__])
+    plan = plan_install(slugs, modules_dir=REPO_ROOT)
+    schema = plan.apply()
+    report["schema"] = {"changes": len(schema["changes"]), "errors": schema["errors"], "timings_ms": schema["timings_ms"]}
+    report["seed"] = seed(engine, args.rows)
+    # Rollups (appointment_daily_stats) were built on empty tables; rebuild them from the seed
+    with engine.begin() as conn:
+        for _, hook in plan.post_install_hooks():
+            hook(conn)
+    print(f"🌱 Seeded {args.rows} rows per table in {report['seed']['seconds']} s.")
+    if args.replica:
+        snapshot_replica(engine, os.environ["MODULE_DB_REPLICA_URL"])
+
+    # Startup imports every router (MODULE_LAZY_LOADING=0) and starts their workers
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            ctx = BenchContext(client, args, report["seed"], slugs)
+            scenarios = [s for s in build_scenarios(ctx) if _selected(s.name, args.routes)]
+            for scenario in sorted(scenarios, key=lambda s: s.writes):
+                result = await run_scenario(client, scenario, args)
+                report["routes"][scenario.name] = result
+                _print_result(scenario.name, result)
+
+        for name, cold in (("access_matrix.user_has_access", False), ("access_matrix.user_has_access_cold", True)):
+            if _selected(name, args.routes):
+                result = await asyncio.to_thread(
+                    bench_user_has_access, report["seed"]["users"], args.requests * 10, args.concurrency, cold,
+                )
+                report["functions"][name] = result
+                _print_result(name, result)
+    return report
+
+
+def compare(baseline, current, threshold, min_ms=1.0):
+    """
+    Print per-benchmark deltas; return the names that regressed by more than `threshold` percent.
+    p99 changes below `min_ms` on both sides are scheduler noise and never count.
+    """
+    regressions = []
+    print(f"\nvs {baseline['meta'].get('git') or 'baseline'} ({baseline['meta'].get('created_at')}):")
+    for section in ("routes", "functions"):
+        for name, new in current.get(section, {}).items():
+            old = baseline.get(section, {}).get(name)
+            if not old or not old.get("rps") or not old.get("p99_ms") or not new.get("rps"):
+                continue
+            rps_delta = (new["rps"] - old["rps"]) / old["rps"] * 100
+            p99_delta = (new["p99_ms"] - old["p99_ms"]) / old["p99_ms"] * 100
+            p99_counts = max(old["p99_ms"], new["p99_ms"]) >= min_ms
+            regressed = rps_delta < -threshold or (p99_counts and p99_delta > threshold)
+            if regressed:
+                regressions.append(name)
+            print(f"{'⚠️' if regressed else '  '} {name:42} rps {old['rps']:9.1f} -> {new['rps']:9.1f} ({rps_delta:+6.1f}%)   "
+                  f"p99 {old['p99_ms']:8.2f} -> {new['p99_ms']:8.2f} ms ({p99_delta:+6.1f}%)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every module API route on a seeded sqlite database.")
+    parser.add_argument("--rows", type=int, default=10000, help="Rows seeded per table (10k-1M)")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per route")
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent clients")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests per read route")
+    parser.add_argument("--routes", action="append", help="Only benchmarks matching this glob (repeatable)")
+    parser.add_argument("--instrument", action="store_true", help="Enable route instrumentation and report SQL per request")
+    parser.add_argument("--replica", action="store_true", help="Serve read-only routes from a copy of the seeded database")
+    parser.add_argument("--out", default="bench-report.json", help="JSON report path")
+    parser.add_argument("--compare", help="Earlier report to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="Ignore p99 changes below this latency")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _configure_env(args, tmp)
+        report = asyncio.run(bench(args))
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"📄 Report written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold, args.min_ms)
+        if regressions:
+            print(f"⚠️ {len(regressions)} regression(s) over {args.threshold}%: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+"""
+In-process stand-in for the host app's `core` package, used by the benchmarks.
+
+core.models, core.utils, core.routes and page_routes are extended at runtime
+(see bench_modules.install_stand_ins) with the module folders their files are
+installed from, so module code imports exactly what it would in the app.
+"""
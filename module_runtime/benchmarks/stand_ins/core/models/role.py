@@ -0,0 +1,9 @@
+from sqlalchemy import Column, Integer, String
+from core.db import Base
+
+
+class Role(Base):
+    __tablename__ = "core_roles"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(50), unique=True, nullable=False)
@@ -0,0 +1,19 @@
+from datetime import datetime
+
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String
+from core.db import Base
+
+
+class User(Base):
+    __tablename__ = "core_users"
+
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String(100), unique=True, nullable=False)
+    email = Column(String(255), unique=True)
+    full_name = Column(String(255))
+    password_hash = Column(String(255))
+    role_id = Column(Integer, ForeignKey("core_roles.id"))
+    position_title = Column(String(100))
+    department = Column(String(100))
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
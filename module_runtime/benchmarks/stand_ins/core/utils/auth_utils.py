@@ -0,0 +1,17 @@
+"""Stand-in auth: every request runs as one superadmin, so routes are measured without login."""
+
+from types import SimpleNamespace
+
+from fastapi import Depends
+
+BENCH_USER = SimpleNamespace(id=1, username="bench", role_id=1, role="superadmin", is_active=True)
+
+
+def get_current_user():
+    return BENCH_USER
+
+
+def require_roles(*roles):
+    def dependency(user=Depends(get_current_user)):
+        return user
+    return dependency
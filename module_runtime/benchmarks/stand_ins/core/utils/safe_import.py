@@ -0,0 +1,9 @@
+import importlib
+
+
+def safe_import(module_name, package, attr):
+    """core.<package>.<module_name>.<attr>, or None when the module is not installed."""
+    try:
+        return getattr(importlib.import_module(f"core.{package}.{module_name}"), attr)
+    except (ImportError, AttributeError):
+        return None
@@ -0,0 +1,12 @@
+"""Stand-in mail delivery: counts messages instead of sending them."""
+
+import threading
+
+_lock = threading.Lock()
+sent = {"count": 0}
+
+
+def send_email(to, subject, body):
+    with _lock:
+        sent["count"] += 1
+    return True
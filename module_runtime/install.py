@@ -0,0 +1,43 @@
+import os, sys
+from core.db import Base, engine
+from sqlalchemy.exc import InvalidRequestError
+
+def install(app=None):
+    """Create the table-version counters used for list ETags, then unregister the model."""
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    models_dir = os.path.join(current_dir, "models")
+    sys.path.insert(0, models_dir)
+
+    try:
+        from model_table_versions import TableVersion
+
+        # 🧹 Remove stale class definitions in ORM registry (safe re-install)
+        class_registry = getattr(Base.registry, "_class_registry", {})
+        if "TableVersion" in class_registry:
+            del class_registry["TableVersion"]
+            print("🧹 Removed old TableVersion ORM class from registry.")
+
+        table_name = TableVersion.__table__.fullname
+        registered = Base.metadata.tables.get(table_name)
+        if registered is not None and registered is not TableVersion.__table__:
+            Base.metadata.remove(registered)
+            print(f"🧹 Removed stale table reference: {table_name}")
+
+        try:
+            Base.metadata.create_all(bind=engine, tables=[TableVersion.__table__])
+            print("✅ Table version counters created (if not existing).")
+        except InvalidRequestError:
+            print("ℹ️ Table already exists; skipping create_all().")
+
+        # ✅ Immediately unregister to prevent “already defined” errors later
+        if table_name in Base.metadata.tables:
+            Base.metadata.remove(Base.metadata.tables[table_name])
+
+        print("✅ Module Runtime installed successfully.")
+
+    except Exception as e:
+        print(f"⚠️ Failed during install: {e}")
+
+    finally:
+        if models_dir in sys.path:
+            sys.path.remove(models_dir)
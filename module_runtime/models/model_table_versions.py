@@ -0,0 +1,15 @@
+"""
+modules/module_runtime/models/model_table_versions.py
+------------------------------------------------------
+Monotonic change counters per table, used to build list ETags.
+"""
+
+from sqlalchemy import BigInteger, Column, String
+from core.db import Base
+
+
+class TableVersion(Base):
+    __tablename__ = "core_table_versions"
+
+    table_name = Column(String(128), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
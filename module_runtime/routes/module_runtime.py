@@ -0,0 +1,59 @@
+from typing import List
+import os
+from fastapi import APIRouter, Depends, HTTPException, Query
+from core.utils.auth_utils import require_roles
+from core.utils.utils_db_session import pool_stats
+from core.utils.utils_module_index import load_module_index, module_load_stats
+from core.utils.utils_install_planner import plan_install
+from core.utils.utils_read_replica import replica_lag, replica_stats
+from core.utils.utils_templates import template_stats
+
+router = APIRouter(prefix="/api/module_runtime", tags=["Module Runtime"])
+
+
+@router.get("/db/pool", dependencies=[Depends(require_roles("superadmin", "admin"))])
+def get_pool_stats():
+    """Connection pool occupancy, sessions in use and checkout wait times."""
+    return pool_stats()
+
+
+@router.get("/db/replica", dependencies=[Depends(require_roles("superadmin", "admin"))])
+def get_replica_stats():
+    """Read-replica policy, current lag and how read sessions were routed."""
+    if replica_stats()["configured"]:
+        replica_lag(refresh=True)
+    return replica_stats()
+
+
+@router.get("/modules", dependencies=[Depends(require_roles("superadmin", "admin"))])
+def get_module_stats():
+    """Indexed modules with their lazy-load status and import time."""
+    index = load_module_index()
+    return {
+        "index_built_at": index["built_at"],
+        "modules": [
+            {"slug": m["slug"], "routes_prefix": m["routes_prefix"], "path": m["path"], "status": m["status"]}
+            for m in index["modules"]
+        ],
+        "loading": module_load_stats(),
+    }
+
+
+@router.get("/schema/plan", dependencies=[Depends(require_roles("superadmin", "admin"))])
+def get_schema_plan(modules: List[str] = Query(...)):
+    """
+    Dry-run diff of the DDL a batched install of `modules` would apply.
+    Only indexed modules are accepted, and nothing is imported from module
+    folders or executed (see plan_install(import_files=False)).
+    """
+    known = {os.path.basename(m["module_dir"]) for m in load_module_index()["modules"]}
+    unknown = [slug for slug in modules if slug not in known]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown module(s): {', '.join(unknown)}")
+    return plan_install(modules, import_files=False).report()
+
+
+@router.get("/templates", dependencies=[Depends(require_roles("superadmin", "admin"))])
+def get_template_stats():
+    """Shared template environment: preload result and compiled-template cache size."""
+    return template_stats()
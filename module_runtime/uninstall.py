@@ -0,0 +1,2 @@
+def uninstall():
+    print("🗑️ Module Runtime uninstalled (modules depending on it will stop loading).")
@@ -0,0 +1,263 @@
+"""
+core/utils/utils_db_session.py
+--------------------------
+Shared, pooled DB sessions for module code.
+
+Routes take a session with `db: Session = Depends(get_db)`; background code
+uses `with session_scope() as db:`. Both always roll back on error and
+release the connection, so no code path can leak a pooled connection.
+
+I/O-heavy list routes can run on AsyncSession instead of the threadpool.
+A module opts in with `"db_mode": "async"` in its module.json (or the env
+override <SLUG>_DB_MODE=async); those routes take
+`db = Depends(module_db("<slug>"))` and read through `await fetch_all(db, stmt)`,
+which works with either session flavour. The async engine is derived from the
+core DB URL (sqlite -> aiosqlite, postgresql -> asyncpg, mysql -> aiomysql)
+unless MODULE_DB_ASYNC_URL is set, and is only created on first use.
+
+Read-only routes can take `module_db("<slug>", read_only=True)` to read from
+a replica when MODULE_DB_REPLICA_URL is set (core.utils.utils_read_replica).
+
+Pool tunables (env):
+    MODULE_DB_POOL_SIZE       persistent connections          default 10
+    MODULE_DB_MAX_OVERFLOW    extra connections under burst   default 20
+    MODULE_DB_POOL_TIMEOUT    seconds to wait for checkout    default 30
+    MODULE_DB_POOL_RECYCLE    recycle connections after (s)   default 1800
+    MODULE_DB_POOL_PRE_PING   test connections on checkout    default 1
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
+from starlette.concurrency import run_in_threadpool
+from core.db import engine as core_engine
+
+POOL_SIZE = int(os.getenv("MODULE_DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("MODULE_DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = float(os.getenv("MODULE_DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("MODULE_DB_POOL_RECYCLE", "1800"))
+POOL_PRE_PING = os.getenv("MODULE_DB_POOL_PRE_PING", "1") == "1"
+ASYNC_URL = os.getenv("MODULE_DB_ASYNC_URL")
+MODULES_DIR = os.getenv("MODULES_DIR", "modules")
+DB_MODES = ("sync", "async")
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg", "mysql": "aiomysql"}
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    "checkouts": 0,
+    "checkout_wait_total_ms": 0.0,
+    "checkout_wait_max_ms": 0.0,
+    "checkout_timeouts": 0,
+    "sessions_in_use": 0,
+    "sessions_opened": 0,
+    "sessions_rolled_back": 0,
+    "async_sessions_opened": 0,
+}
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a free connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with _metrics_lock:
+                _metrics["checkout_timeouts"] += 1
+            raise
+        finally:
+            waited_ms = (time.perf_counter() - started) * 1000
+            with _metrics_lock:
+                _metrics["checkouts"] += 1
+                _metrics["checkout_wait_total_ms"] += waited_ms
+                _metrics["checkout_wait_max_ms"] = max(_metrics["checkout_wait_max_ms"], waited_ms)
+
+
+def _build_engine():
+    url = core_engine.url
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # A second engine would see a different in-memory database
+        return core_engine
+    if url.get_backend_name() == "sqlite":
+        return create_engine(
+            url,
+            pool_pre_ping=POOL_PRE_PING,
+            connect_args={"check_same_thread": False},
+        )
+    return create_engine(
+        url,
+        poolclass=TimedQueuePool,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=POOL_PRE_PING,
+    )
+
+
+module_engine = _build_engine()
+ModuleSessionLocal = sessionmaker(bind=module_engine, autocommit=False, autoflush=False)
+
+
+@contextmanager
+def session_scope(session_factory=None):
+    """Yield a session (from ModuleSessionLocal by default); roll back on error and always close it."""
+    db = (session_factory or ModuleSessionLocal)()
+    with _metrics_lock:
+        _metrics["sessions_in_use"] += 1
+        _metrics["sessions_opened"] += 1
+    try:
+        yield db
+    except BaseException:
+        db.rollback()
+        with _metrics_lock:
+            _metrics["sessions_rolled_back"] += 1
+        raise
+    finally:
+        db.close()
+        with _metrics_lock:
+            _metrics["sessions_in_use"] -= 1
+
+
+def get_db():
+    """FastAPI dependency: one session per request, released when the request ends."""
+    with session_scope() as db:
+        yield db
+
+
+_async_lock = threading.Lock()
+_async_engine = None
+_AsyncSessionLocal = None
+
+
+def _async_url():
+    if ASYNC_URL:
+        return make_url(ASYNC_URL)
+    url = core_engine.url
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f"No async driver known for '{backend}'; set MODULE_DB_ASYNC_URL")
+    if backend == "sqlite" and url.database in (None, "", ":memory:"):
+        raise RuntimeError("Async DB mode needs a file or server database, not in-memory sqlite")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+
+def get_async_engine():
+    """The shared AsyncEngine, created on first use so sync-only installs never import a driver."""
+    global _async_engine, _AsyncSessionLocal
+    with _async_lock:
+        if _async_engine is None:
+            from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+            url = _async_url()
+            kwargs = {"pool_pre_ping": POOL_PRE_PING}
+            if url.get_backend_name() != "sqlite":
+                kwargs.update(
+                    pool_size=POOL_SIZE,
+                    max_overflow=MAX_OVERFLOW,
+                    pool_timeout=POOL_TIMEOUT,
+                    pool_recycle=POOL_RECYCLE,
+                )
+            _async_engine = create_async_engine(url, **kwargs)
+            _AsyncSessionLocal = sessionmaker(
+                bind=_async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+            )
+        return _async_engine
+
+
+@asynccontextmanager
+async def async_session_scope():
+    """Async counterpart of session_scope()."""
+    get_async_engine()
+    db = _AsyncSessionLocal()
+    with _metrics_lock:
+        _metrics["sessions_in_use"] += 1
+        _metrics["sessions_opened"] += 1
+        _metrics["async_sessions_opened"] += 1
+    try:
+        yield db
+    except BaseException:
+        await db.rollback()
+        with _metrics_lock:
+            _metrics["sessions_rolled_back"] += 1
+        raise
+    finally:
+        await db.close()
+        with _metrics_lock:
+            _metrics["sessions_in_use"] -= 1
+
+
+async def get_async_db():
+    """FastAPI dependency yielding an AsyncSession for the request."""
+    async with async_session_scope() as db:
+        yield db
+
+
+def module_db_mode(slug, manifest_path=None):
+    """
+    "sync" or "async" for a module: <SLUG>_DB_MODE env wins, then "db_mode"
+    in its module.json (MODULES_DIR/<slug>/module.json unless a path is given).
+    """
+    mode = os.getenv(f"{slug.upper()}_DB_MODE")
+    if not mode:
+        path = manifest_path or os.path.join(MODULES_DIR, slug, "module.json")
+        try:
+            with open(path, encoding="utf-8") as f:
+                mode = json.load(f).get("db_mode")
+        except (OSError, ValueError):
+            mode = None
+    mode = (mode or "sync").lower()
+    return mode if mode in DB_MODES else "sync"
+
+
+def module_db(slug, manifest_path=None, read_only=False):
+    """
+    Session dependency matching the module's configured db_mode.
+    read_only=True routes sync reads to the replica when one is configured
+    (see core.utils.utils_read_replica); async sessions always use the primary.
+    """
+    if module_db_mode(slug, manifest_path) == "async":
+        return get_async_db
+    if read_only:
+        from core.utils.utils_read_replica import get_read_db
+        return get_read_db
+    return get_db
+
+
+async def fetch_all(db, stmt):
+    """Execute a select on either session flavour without blocking the event loop."""
+    if isinstance(db, Session):
+        return await run_in_threadpool(lambda: db.execute(stmt).all())
+    return (await db.execute(stmt)).all()
+
+
+def pool_stats():
+    """Pool occupancy and checkout-wait metrics for sizing the pool."""
+    with _metrics_lock:
+        stats = dict(_metrics)
+    pool = module_engine.pool
+    stats["checkout_wait_avg_ms"] = round(
+        stats["checkout_wait_total_ms"] / stats["checkouts"], 3
+    ) if stats["checkouts"] else 0.0
+    stats["pool_class"] = type(pool).__name__
+    for attr in ("size", "checkedout", "checkedin", "overflow"):
+        fn = getattr(pool, attr, None)
+        if callable(fn):
+            stats[f"pool_{attr}"] = fn()
+    stats["pool_max_overflow"] = MAX_OVERFLOW if isinstance(pool, QueuePool) else None
+    if _async_engine is not None:
+        async_pool = _async_engine.pool
+        stats["async_pool_class"] = type(async_pool).__name__
+        for attr in ("size", "checkedout", "checkedin", "overflow"):
+            fn = getattr(async_pool, attr, None)
+            if callable(fn):
+                stats[f"async_pool_{attr}"] = fn()
+    return stats
@@ -0,0 +1,296 @@
+"""
+core/utils/utils_install_planner.py
+--------------------------
+Batched schema install/upgrade for several modules at once.
+
+plan_install(["access_matrix", "staff_invites", ...]) works in four steps:
+- reads each module's manifest and imports its models
+- combines their tables in foreign-key order (core_roles before
+  core_access_matrix / core_staff_invites, invites before the outbox, ...)
+- inspects the database once
+- diffs the result into missing tables, columns and indexes
+
+plan.apply() runs every statement in one transaction. That is atomic on
+PostgreSQL and SQLite; MySQL commits each DDL statement implicitly. Then
+each module's optional post_install(conn) data hook runs. Each step is
+timed. Module install.py files stay usable on their own for one-off installs.
+
+Slugs must be plain folder names under MODULES_DIR. Planning never executes
+install.py: hooks are found by parsing it and only loaded by apply().
+plan_install(..., import_files=False), used by the HTTP dry run, also never
+imports model files from module folders. It only uses models this process
+has already imported or can import from core.models, so a request cannot
+register new tables on the shared metadata.
+
+CLI:
+    python -m core.utils.utils_install_planner access_matrix staff_invites --dry-run
+"""
+
+import argparse
+import ast
+import importlib
+import importlib.util
+import json
+import os
+import sys
+import time
+
+from sqlalchemy import inspect
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.schema import CreateIndex, CreateTable, sort_tables
+from core.db import engine
+from core.utils.utils_db_session import MODULES_DIR
+
+# Tables owned by core that module models reference
+CORE_MODEL_MODULES = ("core.models.role", "core.models.user")
+
+
+class InstallPlan:
+    """Ordered DDL for a set of modules, plus timings. Nothing runs until apply()."""
+
+    def __init__(self, slugs, tables, statements, post_install, timings, errors):
+        self.slugs = slugs
+        self.tables = tables
+        self.statements = statements        # [(table_name, kind, sql)]
+        self.post_install = post_install    # [(slug, install.py path)]
+        self.timings = timings
+        self.errors = errors
+        self._hooks = None
+
+    def diff(self):
+        return [{"table": t, "change": kind, "sql": sql} for t, kind, sql in self.statements]
+
+    def post_install_hooks(self):
+        """[(slug, post_install callable)], importing each install.py on first use."""
+        if self._hooks is None:
+            self._hooks = [(slug, _load_post_install(path)) for slug, path in self.post_install]
+        return self._hooks
+
+    def apply(self, bind=None):
+        bind = bind or engine
+        started = time.perf_counter()
+        with bind.begin() as conn:
+            for _, _, sql in self.statements:
+                conn.exec_driver_sql(sql)
+            for slug, hook in self.post_install_hooks():
+                hook(conn)
+        self.timings["apply_ms"] = _ms(started)
+        return self.report(applied=True)
+
+    def report(self, applied=False):
+        return {
+            "modules": self.slugs,
+            "tables": [t.name for t in self.tables],
+            "changes": self.diff(),
+            "post_install": [slug for slug, _ in self.post_install],
+            "errors": self.errors,
+            "applied": applied,
+            "timings_ms": self.timings,
+        }
+
+
+def _ms(started):
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def _module_dir(slug, modules_dir):
+    """Folder of `slug`, refusing anything that is not a plain folder name under modules_dir."""
+    separators = {"/", "\\", os.sep, os.altsep} - {None}
+    if not slug or slug.startswith(".") or any(sep in slug for sep in separators):
+        raise ValueError(f"Invalid module slug '{slug}'")
+    return os.path.join(modules_dir, slug)
+
+
+def _read_manifest(slug, modules_dir):
+    module_dir = _module_dir(slug, modules_dir)
+    with open(os.path.join(module_dir, "module.json"), encoding="utf-8") as f:
+        return module_dir, json.load(f)
+
+
+def _loaded_from(path):
+    """A module already imported from `path` under any name (e.g. a router's models.x)."""
+    target = os.path.realpath(path)
+    for module in list(sys.modules.values()):
+        filename = getattr(module, "__file__", None)
+        if filename and os.path.basename(filename) == os.path.basename(target) \
+                and os.path.realpath(filename) == target:
+            return module
+    return None
+
+
+def _import_file(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    if name in sys.modules:
+        return sys.modules[name]
+    models_dir = os.path.dirname(path)
+    sys.path.insert(0, models_dir)
+    try:
+        return importlib.import_module(name)
+    finally:
+        if models_dir in sys.path:
+            sys.path.remove(models_dir)
+
+
+def _model_modules(module_dir, manifest, import_files=True):
+    """
+    Installed copies (core/models/...) when present, else the files in the module folder.
+    import_files=False never imports from the module folder; a model only found
+    there raises ImportError unless this process already imported it.
+    """
+    models = manifest.get("models") or {}
+    if isinstance(models, dict):
+        pairs = list(models.items())
+    else:
+        pairs = [(src, None) for src in models]
+    modules = []
+    for src, dest in pairs:
+        # Importing a file twice would redefine its tables on the shared metadata
+        loaded = _loaded_from(os.path.join(module_dir, src))
+        if loaded is not None:
+            modules.append(loaded)
+            continue
+        if dest:
+            try:
+                modules.append(importlib.import_module(os.path.splitext(dest)[0].replace("/", ".")))
+                continue
+            except ImportError:
+                pass
+        if not import_files:
+            raise ImportError(f"{src} is not imported in this process; plan it from the CLI")
+        modules.append(_import_file(os.path.join(module_dir, src)))
+    return modules
+
+
+def _module_tables(module):
+    tables = []
+    for obj in vars(module).values():
+        table = getattr(obj, "__table__", None)
+        if table is not None and getattr(obj, "__module__", None) == module.__name__:
+            tables.append(table)
+    return tables
+
+
+def _post_install_path(module_dir):
+    """install.py if it defines a top-level post_install(); found by parsing, not importing."""
+    path = os.path.join(module_dir, "install.py")
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    if any(isinstance(node, ast.FunctionDef) and node.name == "post_install" for node in tree.body):
+        return path
+    return None
+
+
+def _load_post_install(path):
+    name = f"_install_{os.path.basename(os.path.dirname(path))}"
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.post_install
+
+
+def column_ddl(table, column, dialect):
+    """ALTER TABLE ... ADD COLUMN for a model column, with its server default rendered by the dialect."""
+    compiler = dialect.ddl_compiler(dialect, None)
+    preparer = compiler.preparer
+    ddl = (
+        f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+        f"{preparer.format_column(column)} {column.type.compile(dialect=dialect)}"
+    )
+    default = column.server_default
+    # SQLite only accepts constant defaults on ADD COLUMN
+    if default is not None and dialect.name == "sqlite" and not isinstance(getattr(default, "arg", None), str):
+        default = None
+    if default is not None:
+        ddl += f" DEFAULT {compiler.get_column_default_string(column)}"
+        # Existing rows take the default, so NOT NULL holds from the start
+        if not column.nullable:
+            ddl += " NOT NULL"
+    return ddl
+
+
+def add_missing_columns(conn, table):
+    """Add model columns the live table lacks (data kept); for module install.py files. Returns the DDL run."""
+    existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+    statements = [column_ddl(table, c, conn.dialect) for c in table.columns if c.name not in existing]
+    for sql in statements:
+        conn.exec_driver_sql(sql)
+    return statements
+
+
+def _diff(tables, conn):
+    """Compare the target tables with the live schema using a single Inspector."""
+    dialect = conn.dialect
+    inspector = inspect(conn)
+    existing = set(inspector.get_table_names())
+    statements = []
+    for table in tables:
+        if table.name not in existing:
+            statements.append((table.name, "create_table", str(CreateTable(table).compile(dialect=dialect)).strip()))
+            for index in sorted(table.indexes, key=lambda i: i.name):
+                statements.append((table.name, "create_index", str(CreateIndex(index).compile(dialect=dialect)).strip()))
+            continue
+
+        columns = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                statements.append((table.name, "add_column", column_ddl(table, column, dialect)))
+        indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            if index.name not in indexes:
+                statements.append((table.name, "create_index", str(CreateIndex(index).compile(dialect=dialect)).strip()))
+    return statements
+
+
+def plan_install(slugs, modules_dir=MODULES_DIR, bind=None, import_files=True):
+    """Build the combined, FK-ordered DDL plan for `slugs` without executing it."""
+    bind = bind or engine
+    timings, errors = {}, {}
+
+    started = time.perf_counter()
+    for name in CORE_MODEL_MODULES:
+        importlib.import_module(name)
+    tables, post_install = [], []
+    for slug in slugs:
+        try:
+            module_dir, manifest = _read_manifest(slug, modules_dir)
+            for module in _model_modules(module_dir, manifest, import_files):
+                tables.extend(t for t in _module_tables(module) if all(t is not seen for seen in tables))
+            hook_path = _post_install_path(module_dir)
+            if hook_path is not None:
+                post_install.append((slug, hook_path))
+        except (OSError, ValueError, SyntaxError, ImportError, InvalidRequestError) as e:
+            errors[slug] = str(e)
+    timings["load_models_ms"] = _ms(started)
+
+    started = time.perf_counter()
+    ordered = sort_tables(tables)
+    with bind.connect() as conn:
+        statements = _diff(ordered, conn)
+    timings["inspect_diff_ms"] = _ms(started)
+
+    return InstallPlan(list(slugs), ordered, statements, post_install, timings, errors)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Install or upgrade module schemas in one batch.")
+    parser.add_argument("modules", nargs="+", help="Module slugs (folder names under MODULES_DIR)")
+    parser.add_argument("--dry-run", action="store_true", help="Print the DDL diff without applying it")
+    parser.add_argument("--modules-dir", default=MODULES_DIR)
+    args = parser.parse_args(argv)
+
+    plan = plan_install(args.modules, modules_dir=args.modules_dir)
+    report = plan.report() if args.dry_run else plan.apply()
+    for change in report["changes"]:
+        print(f"{'🔎' if args.dry_run else '✅'} {change['table']}: {change['change']}\n    {change['sql']}")
+    if not report["changes"]:
+        print("✅ Schema already up to date.")
+    for slug, error in report["errors"].items():
+        print(f"⚠️ {slug}: {error}")
+    print(f"⏱️ {report['timings_ms']}")
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
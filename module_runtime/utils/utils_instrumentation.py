@@ -0,0 +1,266 @@
+"""
+core/utils/utils_instrumentation.py
+--------------------------
+Per-request latency and SQL instrumentation for module routes, exported as
+Prometheus text on /metrics.
+
+InstrumentationMiddleware starts a stats scope for every HTTP request. The
+scope lives in a contextvar, so threadpool handlers share it. Engine-level
+cursor hooks count each statement and its DB time into the active scope.
+When the request ends, the route template, module slug (from the manifest
+index) and status are recorded into:
+
+    module_request_duration_seconds   histogram  {module, route, method}
+    module_request_sql_queries        histogram  {module, route, method}
+    module_requests_total             counter    {module, route, method, status}
+    module_db_seconds_total           counter    {module, route, method}
+    module_n_plus_one_total           counter    {module, route, method}
+
+A request that runs the same statement text at least N_PLUS_ONE_THRESHOLD
+times is counted as an N+1 and logged once per route and statement. Hot
+helpers that are not routes (e.g. user_has_access) can be wrapped with
+@timed(module, name) to get module_function_duration_seconds and
+module_function_sql_queries_total.
+
+Env:
+    MODULE_INSTRUMENTATION     0 disables the middleware and /metrics   default 1
+    N_PLUS_ONE_THRESHOLD       repeats of one statement per request     default 10
+    METRICS_TOKEN              if set, /metrics requires this bearer token
+"""
+
+import os
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from functools import wraps
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.responses import PlainTextResponse, Response
+
+INSTRUMENTATION_ENABLED = os.getenv("MODULE_INSTRUMENTATION", "1") == "1"
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class RequestStats:
+    """SQL activity of one request (or one @timed call outside a request)."""
+
+    __slots__ = ("queries", "db_seconds", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = Counter()
+
+
+_current = ContextVar("module_request_stats", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("instrumentation_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    started = conn.info.get("instrumentation_started")
+    if started:
+        stats.db_seconds += time.perf_counter() - started.pop()
+    stats.queries += 1
+    stats.statements[statement] += 1
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.queries = {}
+        self.requests = Counter()
+        self.db_seconds = Counter()
+        self.n_plus_one = Counter()
+        self.function_latency = {}
+        self.function_queries = Counter()
+        self._reported = set()
+
+    def record_request(self, module, route, method, status, elapsed, stats):
+        key = (module, route, method)
+        repeated = [(sql, n) for sql, n in stats.statements.items() if n >= N_PLUS_ONE_THRESHOLD]
+        with self._lock:
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            self.queries.setdefault(key, Histogram(QUERY_BUCKETS)).observe(stats.queries)
+            self.requests[key + (str(status),)] += 1
+            self.db_seconds[key] += stats.db_seconds
+            if repeated:
+                self.n_plus_one[key] += 1
+            new = [(sql, n) for sql, n in repeated if (key, sql) not in self._reported]
+            self._reported.update((key, sql) for sql, _ in new)
+        for sql, n in new:
+            print(f"⚠️ Possible N+1 in {method} {route} ({module}): ran {n}x: {' '.join(sql.split())[:200]}")
+
+    def record_function(self, module, name, elapsed, queries):
+        with self._lock:
+            self.function_latency.setdefault((module, name), Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            self.function_queries[(module, name)] += queries
+
+
+metrics = MetricsRegistry()
+
+
+def _route_template(scope):
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def _module_for_path(path):
+    from core.utils.utils_module_index import module_slug_for_path
+    return module_slug_for_path(path) or "core"
+
+
+class InstrumentationMiddleware:
+    """ASGI middleware recording latency and SQL counts per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            metrics.record_request(
+                _module_for_path(scope["path"]), _route_template(scope), scope["method"],
+                status["code"], elapsed, stats,
+            )
+
+
+def timed(module, name):
+    """Decorator: latency histogram and SQL count for a non-route hot path."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            outer = _current.get()
+            stats = RequestStats()
+            token = _current.set(stats)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                _current.reset(token)
+                if outer is not None:
+                    # Still charge the statements to the surrounding request
+                    outer.queries += stats.queries
+                    outer.db_seconds += stats.db_seconds
+                    outer.statements.update(stats.statements)
+                metrics.record_function(module, name, elapsed, stats.queries)
+        return wrapper
+    return decorator
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _histogram_lines(name, series, label_names):
+    lines = [f"# TYPE {name} histogram"]
+    for key, hist in sorted(series.items()):
+        labels = dict(zip(label_names, key))
+        cumulative = 0
+        for bound, count in zip(hist.buckets, hist.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {hist.count}")
+        lines.append(f"{name}_sum{_labels(**labels)} {hist.total}")
+        lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
+    return lines
+
+
+def _counter_lines(name, series, label_names):
+    lines = [f"# TYPE {name} counter"]
+    for key, value in sorted(series.items()):
+        lines.append(f"{name}{_labels(**dict(zip(label_names, key)))} {value}")
+    return lines
+
+
+def render_metrics():
+    """All metrics in Prometheus text exposition format."""
+    route = ("module", "route", "method")
+    function = ("module", "function")
+    with metrics._lock:
+        lines = []
+        lines += _histogram_lines("module_request_duration_seconds", metrics.latency, route)
+        lines += _histogram_lines("module_request_sql_queries", metrics.queries, route)
+        lines += _counter_lines("module_requests_total", metrics.requests, route + ("status",))
+        lines += _counter_lines("module_db_seconds_total", metrics.db_seconds, route)
+        lines += _counter_lines("module_n_plus_one_total", metrics.n_plus_one, route)
+        lines += _histogram_lines("module_function_duration_seconds", metrics.function_latency, function)
+        lines += _counter_lines("module_function_sql_queries_total", metrics.function_queries, function)
+
+    from core.utils.utils_db_session import pool_stats
+    pool = pool_stats()
+    for key in ("sessions_in_use", "pool_checkedout", "pool_size"):
+        if isinstance(pool.get(key), (int, float)):
+            lines.append(f"# TYPE module_db_{key} gauge")
+            lines.append(f"module_db_{key} {pool[key]}")
+    for key in ("checkouts", "checkout_timeouts"):
+        lines.append(f"# TYPE module_db_{key}_total counter")
+        lines.append(f"module_db_{key}_total {pool[key]}")
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_endpoint(request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        return Response(status_code=401)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+def install_instrumentation(app):
+    """Wrap the app with the middleware and expose /metrics."""
+    if not INSTRUMENTATION_ENABLED:
+        return
+    app.add_middleware(InstrumentationMiddleware)
+    app.add_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
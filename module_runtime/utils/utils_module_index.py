@@ -0,0 +1,408 @@
+"""
+core/utils/utils_module_index.py
+--------------------------
+Manifest index and lazy router loading for installed modules.
+
+Every module.json under MODULES_DIR is summarised once into module_index.json:
+slug, prefixes, entry point, page routes, models, utils, templates, sidebar
+templates, static maps and tracked tables. On startup only that file is read,
+plus one stat() per manifest to detect edits. Nothing is imported.
+
+install_lazy_modules(app) adds a small ASGI middleware. The first request
+under a module's routes_prefix (API) or path (pages) imports that router off
+the event loop, includes it in the app, and runs its startup handlers. Import
+time per module is recorded and reported by module_load_stats(). A module
+whose import fails answers 503 and is retried after MODULE_LOAD_RETRY_SECONDS.
+
+Background workers are declared per module in module.json and started by
+app startup, whether or not the module's router has been requested:
+    "background_workers": [{"module": "utils/x.py", "start": "start_x",
+                            "stop": "stop_x", "enabled_by": "OPTIONAL_ENV_FLAG"}]
+
+Env:
+    MODULES_DIR           where module folders live                default "modules"
+    MODULE_INDEX_PATH     index file                               default MODULES_DIR/module_index.json
+    MODULE_LAZY_LOADING   0 = import every router at startup        default 1
+    MODULE_LOAD_RETRY_SECONDS  wait before re-importing a failed module default 10
+    TEMPLATE_PRELOAD      compile manifest templates at startup    default 1
+    STATIC_ASSET_BUILD    fingerprint changed static assets at startup and
+                          serve them from ASSET_URL_PREFIX           default 1
+    MODULE_INSTRUMENTATION  per-route latency/SQL metrics on /metrics default 1
+    MODULE_DB_REPLICA_URL   read replica for read-only routes (see
+                            core.utils.utils_read_replica)            default unset
+
+CLI (rebuild the index after adding or editing modules):
+    python -m core.utils.utils_module_index
+"""
+
+import asyncio
+import importlib
+import importlib.util
+import inspect
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from core.utils.utils_db_session import MODULES_DIR
+
+INDEX_PATH = os.getenv("MODULE_INDEX_PATH") or os.path.join(MODULES_DIR, "module_index.json")
+LAZY_LOADING = os.getenv("MODULE_LAZY_LOADING", "1") == "1"
+LOAD_RETRY_SECONDS = float(os.getenv("MODULE_LOAD_RETRY_SECONDS", "10"))
+TEMPLATE_PRELOAD = os.getenv("TEMPLATE_PRELOAD", "1") == "1"
+STATIC_ASSET_BUILD = os.getenv("STATIC_ASSET_BUILD", "1") == "1"
+INDEX_VERSION = 4
+
+_load_stats = {}
+_loader = None
+
+
+def _dotted(relative_path):
+    """core/routes/x.py -> core.routes.x"""
+    return os.path.splitext(relative_path)[0].replace("\\", "/").replace("/", ".")
+
+
+def _worker_entries(module_dir, manifest):
+    """Background workers with the import name of their module (installed copy when mapped)."""
+    utils = manifest.get("utils")
+    installed = utils if isinstance(utils, dict) else {}
+    workers = []
+    for worker in manifest.get("background_workers") or []:
+        dest = installed.get(worker["module"])
+        workers.append({
+            "module": _dotted(dest or worker["module"]),
+            # Module-local files import as utils.x / models.x with the module folder on sys.path
+            "module_dir": None if dest else module_dir,
+            "start": worker["start"],
+            "stop": worker.get("stop"),
+            "enabled_by": worker.get("enabled_by"),
+        })
+    return workers
+
+
+def _manifest_entry(module_dir, manifest_path):
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    entry_point = manifest.get("entry_point")
+    installed = (manifest.get("routes") or {}).get(entry_point) if entry_point else None
+    if installed:
+        api = {"module": _dotted(installed)}
+    elif entry_point:
+        api = {"file": os.path.join(module_dir, entry_point)}
+    else:
+        api = None
+
+    return {
+        "slug": manifest.get("slug") or os.path.basename(module_dir),
+        "name": manifest.get("name"),
+        "status": manifest.get("status", "active"),
+        "path": manifest.get("path"),
+        "routes_prefix": manifest.get("routes_prefix"),
+        "db_mode": manifest.get("db_mode", "sync"),
+        "module_dir": module_dir,
+        "api": api,
+        "pages": [_dotted(dest) for dest in (manifest.get("page_routes") or {}).values()],
+        "models": manifest.get("models") or {},
+        "utils": manifest.get("utils") or {},
+        "templates": manifest.get("templates") or {},
+        "sidebar_template": manifest.get("sidebar_template") or {},
+        "static": manifest.get("static") or {},
+        "depends_on": (manifest.get("dependencies") or {}).get("modules", []),
+        "tracked_tables": manifest.get("tracked_tables") or [],
+        "workers": _worker_entries(module_dir, manifest),
+        "manifest_mtime": os.stat(manifest_path).st_mtime,
+    }
+
+
+def _manifest_paths(modules_dir):
+    paths = {}
+    try:
+        entries = sorted(os.scandir(modules_dir), key=lambda e: e.name)
+    except FileNotFoundError:
+        return paths
+    for entry in entries:
+        manifest_path = os.path.join(entry.path, "module.json")
+        if entry.is_dir() and os.path.isfile(manifest_path):
+            paths[entry.path] = manifest_path
+    return paths
+
+
+def build_module_index(modules_dir=MODULES_DIR, index_path=INDEX_PATH):
+    """Parse every module.json and write the index atomically. Returns the index."""
+    modules = []
+    for module_dir, manifest_path in _manifest_paths(modules_dir).items():
+        try:
+            modules.append(_manifest_entry(module_dir, manifest_path))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Skipping {manifest_path}: {e}")
+
+    index = {"version": INDEX_VERSION, "built_at": time.time(), "modules": modules}
+    write_atomic(index_path, json.dumps(index, indent=2).encode("utf-8"))
+    return index
+
+
+def write_atomic(path, data):
+    """Write bytes to `path` via a uniquely named temp file, so concurrent workers never share one."""
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=os.path.basename(path) + ".",
+                                     suffix=".tmp", delete=False) as f:
+        f.write(data)
+    try:
+        # NamedTemporaryFile creates 0600; give the result the usual umask-based mode
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(f.name, 0o666 & ~umask)
+        os.replace(f.name, path)
+    except OSError:
+        os.unlink(f.name)
+        raise
+
+
+def _is_stale(index, modules_dir):
+    if index.get("version") != INDEX_VERSION:
+        return True
+    known = {m["module_dir"]: m["manifest_mtime"] for m in index.get("modules", [])}
+    current = _manifest_paths(modules_dir)
+    if set(known) != set(current):
+        return True
+    return any(os.stat(path).st_mtime != known[module_dir] for module_dir, path in current.items())
+
+
+def load_module_index(modules_dir=MODULES_DIR, index_path=INDEX_PATH):
+    """Read the index, rebuilding it when a manifest was added, removed or edited."""
+    try:
+        with open(index_path, encoding="utf-8") as f:
+            index = json.load(f)
+        if not _is_stale(index, modules_dir):
+            return index
+    except (OSError, ValueError):
+        pass
+    return build_module_index(modules_dir, index_path)
+
+
+@contextmanager
+def _module_path(module_dir):
+    """Module-local code imports its own models/ and utils/ as top-level names; only while importing."""
+    added = bool(module_dir) and module_dir not in sys.path
+    if added:
+        sys.path.insert(0, module_dir)
+    try:
+        yield
+    finally:
+        if added and module_dir in sys.path:
+            sys.path.remove(module_dir)
+
+
+def _import_module_file(slug, path, module_dir):
+    name = f"_module_{slug}_{os.path.splitext(os.path.basename(path))[0]}"
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    try:
+        with _module_path(module_dir):
+            spec.loader.exec_module(module)
+    except BaseException:
+        sys.modules.pop(name, None)
+        raise
+    return module
+
+
+class ModuleLoader:
+    """Imports and mounts module routers on first use."""
+
+    def __init__(self, app, index):
+        self.app = app
+        self.modules = {
+            m["slug"]: m for m in index.get("modules", []) if m.get("status", "active") == "active"
+        }
+        # Longest prefix first so /api/x_y never matches module /api/x
+        prefixes = []
+        for slug, m in self.modules.items():
+            for prefix in (m.get("routes_prefix"), m.get("path")):
+                if prefix:
+                    prefixes.append((prefix.rstrip("/"), slug))
+        self.prefixes = sorted(prefixes, key=lambda p: len(p[0]), reverse=True)
+        self.loaded = set()
+        self.failed = {}        # slug -> monotonic time of the last failed import
+        self.workers = []       # (slug, module, worker entry) started by start_workers()
+        self._lock = asyncio.Lock()
+
+    def slug_for_path(self, path):
+        for prefix, slug in self.prefixes:
+            if path == prefix or path.startswith(prefix + "/"):
+                return slug
+        return None
+
+    def _import_routers(self, slug):
+        """All of the module's routers, or None when any of them failed to import."""
+        m = self.modules[slug]
+        started = time.perf_counter()
+        routers, error = [], None
+        try:
+            api = m.get("api")
+            if api and "module" in api:
+                routers.append(importlib.import_module(api["module"]).router)
+            elif api:
+                routers.append(_import_module_file(slug, api["file"], m["module_dir"]).router)
+            for page_module in m.get("pages", []):
+                routers.append(importlib.import_module(page_module).router)
+        except Exception as e:
+            error = str(e)
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+        _load_stats[slug] = {"import_ms": elapsed_ms, "loaded_at": time.time(), "error": error}
+        if error:
+            print(f"⚠️ Module {slug} failed to load after {elapsed_ms} ms: {error}")
+            return None
+        print(f"📦 Module {slug} loaded in {elapsed_ms} ms.")
+        return routers
+
+    async def _mount(self, slug):
+        routers = await run_in_threadpool(self._import_routers, slug)
+        if routers is None:
+            # Not marked loaded: the next request after LOAD_RETRY_SECONDS tries again
+            self.failed[slug] = time.monotonic()
+            return False
+        for router in routers:
+            # include_router() also queues the router's startup/shutdown handlers on the app
+            self.app.include_router(router)
+            # Startup already ran (or is running load_all); run this router's handlers here, once
+            for handler in getattr(router, "on_startup", []):
+                if handler in self.app.router.on_startup:
+                    self.app.router.on_startup.remove(handler)
+                result = handler()
+                if inspect.isawaitable(result):
+                    await result
+        self.app.openapi_schema = None
+        self.loaded.add(slug)
+        self.failed.pop(slug, None)
+        return True
+
+    async def ensure_loaded(self, path):
+        """False when the module owning `path` could not be imported (recently)."""
+        slug = self.slug_for_path(path)
+        if slug is None or slug in self.loaded:
+            return True
+        async with self._lock:
+            if slug in self.loaded:
+                return True
+            failed_at = self.failed.get(slug)
+            if failed_at is not None and time.monotonic() - failed_at < LOAD_RETRY_SECONDS:
+                return False
+            return await self._mount(slug)
+
+    async def load_all(self):
+        for slug in self.modules:
+            if slug not in self.loaded:
+                await self._mount(slug)
+
+    def start_workers(self):
+        """Start every active module's background workers; they do not wait for a first request."""
+        for slug, m in self.modules.items():
+            for worker in m.get("workers", []):
+                flag = worker.get("enabled_by")
+                if flag and os.getenv(flag) != "1":
+                    continue
+                try:
+                    with _module_path(worker["module_dir"]):
+                        module = importlib.import_module(worker["module"])
+                    getattr(module, worker["start"])()
+                except Exception as e:
+                    print(f"⚠️ Module {slug} worker {worker['start']} failed to start: {e}")
+                    continue
+                self.workers.append((slug, module, worker))
+
+    def stop_workers(self):
+        for slug, module, worker in reversed(self.workers):
+            if worker.get("stop"):
+                try:
+                    getattr(module, worker["stop"])()
+                except Exception as e:
+                    print(f"⚠️ Module {slug} worker {worker['stop']} failed to stop: {e}")
+        self.workers = []
+
+
+class LazyModuleMiddleware:
+    """ASGI middleware that mounts a module's routers before its first request is routed."""
+
+    def __init__(self, app, loader):
+        self.app = app
+        self.loader = loader
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket") and not await self.loader.ensure_loaded(scope["path"]):
+            if scope["type"] == "websocket":
+                await send({"type": "websocket.close", "code": 1013})
+                return
+            slug = self.loader.slug_for_path(scope["path"])
+            response = JSONResponse(
+                {"detail": f"Module {slug} is unavailable: it failed to load"},
+                status_code=503,
+                headers={"Retry-After": str(max(1, round(LOAD_RETRY_SECONDS)))},
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+def install_lazy_modules(app, modules_dir=MODULES_DIR, index_path=INDEX_PATH):
+    """Call once while building the app, instead of importing every module's routes."""
+    global _loader
+    index = load_module_index(modules_dir, index_path)
+    # Every worker bumps the list-ETag counters, whichever routers it has loaded
+    from core.utils.utils_table_versions import track_manifest_tables
+    track_manifest_tables(index)
+    loader = _loader = ModuleLoader(app, index)
+    app.state.module_loader = loader
+    app.add_middleware(LazyModuleMiddleware, loader=loader)
+    app.router.on_startup.append(loader.start_workers)
+    app.router.on_shutdown.append(loader.stop_workers)
+    if not LAZY_LOADING:
+        app.router.on_startup.append(loader.load_all)
+    if STATIC_ASSET_BUILD:
+        from core.utils.utils_static_assets import build_static_assets, mount_static_assets
+        mount_static_assets(app)
+        # Before template preload so asset_url() already sees the new manifest
+        app.router.on_startup.append(lambda: build_static_assets(index))
+    if TEMPLATE_PRELOAD:
+        from core.utils.utils_templates import preload_templates
+        app.router.on_startup.append(lambda: preload_templates(index))
+    from core.utils.utils_read_replica import install_read_replica
+    install_read_replica(app)
+    # Added last so it is the outermost middleware and times lazy imports too
+    from core.utils.utils_instrumentation import install_instrumentation
+    install_instrumentation(app)
+    print(f"🗂️ Module index: {len(loader.modules)} active module(s), lazy loading {'on' if LAZY_LOADING else 'off'}.")
+    return loader
+
+
+def module_slug_for_path(path):
+    """Slug of the module owning `path`, or None before install_lazy_modules() ran."""
+    return _loader.slug_for_path(path) if _loader else None
+
+
+def module_load_stats():
+    """Per-module import time and status; modules not requested yet show as not loaded."""
+    slugs = set(_load_stats) | set(_loader.modules if _loader else ())
+    modules = {}
+    for slug in sorted(slugs):
+        stats = _load_stats.get(slug)
+        modules[slug] = dict(stats, loaded=stats["error"] is None) if stats else {"loaded": False}
+    return {
+        "total_import_ms": round(sum(s["import_ms"] for s in _load_stats.values()), 2),
+        "modules": modules,
+    }
+
+
+def main(argv=None):
+    index = build_module_index()
+    print(f"🗂️ Indexed {len(index['modules'])} module(s) into {INDEX_PATH}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,426 @@
+"""
+core/utils/utils_read_replica.py
+--------------------------
+Read-replica routing for module list routes and permission checks.
+
+With MODULE_DB_REPLICA_URL set, `module_db("<slug>", read_only=True)` and
+`read_session_scope()` hand out a ReplicaRoutingSession:
+- plain SELECTs go to the replica
+- everything else goes to the primary: writes, SELECT ... FOR UPDATE, raw
+  text() and the flush
+- after the session's first write, every later statement also uses the
+  primary (read-your-writes within the session)
+
+Whether the replica may be used at all is the staleness policy
+(MODULE_DB_REPLICA_POLICY):
+    off    always read from the primary
+    lag    use the replica while its lag is <= MODULE_DB_REPLICA_MAX_LAG seconds (default)
+    any    use the replica whenever it is reachable
+
+Lag comes from a heartbeat: one writer stores the current time (ms) in the
+reserved "__replica_heartbeat__" row of core_table_versions on the primary.
+Reading that row back from the replica gives how far behind it is. With no
+heartbeat, or an unreachable replica, reads fall back to the primary.
+
+Only one process writes the heartbeat (MODULE_DB_REPLICA_HEARTBEAT_WRITER):
+    auto   processes elect a writer through the "__replica_heartbeat_owner__"
+           row (default). The owner holds it while its heartbeat stays fresh.
+           When the heartbeat is more than three intervals old, another
+           process takes the row over with a compare-and-set UPDATE.
+    1      this process always writes (one designated writer)
+    0      this process never writes
+The heartbeat thread is started by install_replica_heartbeat(app), which
+install_read_replica() (and so install_lazy_modules()) registers. Apps that
+don't use those can call install_replica_heartbeat(app) or
+start_replica_heartbeat() directly.
+
+Callers that cache what they read (the access index) pass `tables=`. The
+replica is then used only when its core_table_versions counters for those
+tables have caught up with the primary's. That comparison is reused for
+LAG_CHECK_SECONDS, like the lag reading.
+
+ReadYourWritesMiddleware keeps a client on the primary after it changes
+something. A successful POST/PUT/PATCH/DELETE sets a short-lived cookie, and
+requests carrying it read from the primary until it expires.
+
+Two sqlite files work as primary and replica: copy the primary file over
+the replica to "replicate" it.
+
+Env:
+    MODULE_DB_REPLICA_URL                replica database URL ("" disables routing)
+    MODULE_DB_REPLICA_POLICY             off | lag | any                     default lag
+    MODULE_DB_REPLICA_MAX_LAG            seconds of lag tolerated             default 5
+    MODULE_DB_REPLICA_STICKY_SECONDS     primary reads after a client write  default MAX_LAG
+    MODULE_DB_REPLICA_HEARTBEAT_SECONDS  heartbeat interval (0 = none)        default 1
+    MODULE_DB_REPLICA_HEARTBEAT_WRITER   auto | 1 | 0                        default auto
+    MODULE_DB_REPLICA_LAG_CHECK_SECONDS  how long a lag reading is reused     default 0.5
+"""
+
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.cookies import SimpleCookie
+
+from sqlalchemy import create_engine, insert, select, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session, sessionmaker
+from core.models.model_table_versions import TableVersion
+from core.utils.utils_table_versions import read_table_versions
+from core.utils.utils_db_session import (
+    MAX_OVERFLOW,
+    POOL_PRE_PING,
+    POOL_RECYCLE,
+    POOL_SIZE,
+    POOL_TIMEOUT,
+    module_engine,
+    session_scope,
+)
+
+REPLICA_URL = os.getenv("MODULE_DB_REPLICA_URL")
+POLICIES = ("off", "lag", "any")
+POLICY = os.getenv("MODULE_DB_REPLICA_POLICY", "lag").lower()
+MAX_LAG = float(os.getenv("MODULE_DB_REPLICA_MAX_LAG", "5"))
+STICKY_SECONDS = float(os.getenv("MODULE_DB_REPLICA_STICKY_SECONDS") or MAX_LAG)
+HEARTBEAT_SECONDS = float(os.getenv("MODULE_DB_REPLICA_HEARTBEAT_SECONDS", "1"))
+HEARTBEAT_WRITER = os.getenv("MODULE_DB_REPLICA_HEARTBEAT_WRITER", "auto").lower()
+LAG_CHECK_SECONDS = float(os.getenv("MODULE_DB_REPLICA_LAG_CHECK_SECONDS", "0.5"))
+HEARTBEAT_KEY = "__replica_heartbeat__"
+HEARTBEAT_OWNER_KEY = "__replica_heartbeat_owner__"
+# An owner whose heartbeat is this many intervals old is taken over
+HEARTBEAT_TAKEOVER_INTERVALS = 3
+STICKY_COOKIE = "db_primary_until"
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+_lock = threading.Lock()
+_replica_engine = None
+_ReplicaSessionLocal = None
+_lag = {"lag": None, "checked": 0.0, "error": None}
+_caught_up_checks = {}  # sorted tables -> (monotonic check time, caught up)
+# Identifies this process on the heartbeat owner row
+_heartbeat = {"token": secrets.randbits(62), "writer": False, "takeovers": 0}
+_stats = {
+    "replica_sessions": 0,
+    "primary_sessions": 0,
+    "pinned_by_client": 0,
+    "stale": 0,
+    "unavailable": 0,
+    "not_caught_up": 0,
+    "switched_to_primary": 0,
+}
+_pinned = ContextVar("replica_pinned_to_primary", default=False)
+_stop_event = threading.Event()
+
+
+def _count(key):
+    with _lock:
+        _stats[key] += 1
+
+
+def get_replica_engine():
+    """The replica Engine, created on first use; None when no replica is configured."""
+    global _replica_engine, _ReplicaSessionLocal
+    if not REPLICA_URL:
+        return None
+    with _lock:
+        if _replica_engine is None:
+            url = make_url(REPLICA_URL)
+            if url.get_backend_name() == "sqlite":
+                _replica_engine = create_engine(
+                    url, pool_pre_ping=POOL_PRE_PING, connect_args={"check_same_thread": False},
+                )
+            else:
+                _replica_engine = create_engine(
+                    url,
+                    pool_size=POOL_SIZE,
+                    max_overflow=MAX_OVERFLOW,
+                    pool_timeout=POOL_TIMEOUT,
+                    pool_recycle=POOL_RECYCLE,
+                    pool_pre_ping=POOL_PRE_PING,
+                )
+            # One factory per engine, like ModuleSessionLocal in utils_db_session
+            _ReplicaSessionLocal = sessionmaker(
+                class_=ReplicaRoutingSession, replica=_replica_engine, autocommit=False, autoflush=False,
+            )
+        return _replica_engine
+
+
+class ReplicaRoutingSession(Session):
+    """Sends plain SELECTs to the replica until the session writes; then sticks to the primary."""
+
+    def __init__(self, replica, **kwargs):
+        super().__init__(**kwargs)
+        self.replica = replica
+        self.use_primary = False
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if not self.use_primary and not self._flushing and _is_plain_select(clause):
+            return self.replica
+        if not self.use_primary:
+            self.use_primary = True
+            _count("switched_to_primary")
+        return module_engine
+
+
+def _is_plain_select(clause):
+    return (
+        clause is not None
+        and getattr(clause, "is_select", False)
+        and getattr(clause, "_for_update_arg", None) is None
+    )
+
+
+def write_heartbeat(bind=None):
+    """Store the current time on the primary's heartbeat row."""
+    table = TableVersion.__table__
+    now_ms = int(time.time() * 1000)
+    with (bind or module_engine).begin() as conn:
+        updated = conn.execute(
+            update(table).where(table.c.table_name == HEARTBEAT_KEY).values(version=now_ms)
+        ).rowcount
+        if not updated:
+            conn.execute(insert(table).values(table_name=HEARTBEAT_KEY, version=now_ms))
+
+
+def _ensure_row(conn_factory, key, value):
+    """Create a core_table_versions row if missing; a concurrent insert by another process is fine."""
+    try:
+        with conn_factory.begin() as conn:
+            conn.execute(insert(TableVersion.__table__).values(table_name=key, version=value))
+    except IntegrityError:
+        pass
+
+
+def heartbeat_tick(bind=None, interval_seconds=HEARTBEAT_SECONDS):
+    """
+    One heartbeat round for this process: write it if we are (or become) the
+    writer. Returns True when this process wrote the heartbeat.
+    """
+    bind = bind or module_engine
+    if HEARTBEAT_WRITER == "0":
+        return False
+    if HEARTBEAT_WRITER == "1":
+        write_heartbeat(bind)
+        return True
+
+    table = TableVersion.__table__
+    token = _heartbeat["token"]
+    with bind.connect() as conn:
+        found = read_table_versions(conn, [HEARTBEAT_OWNER_KEY, HEARTBEAT_KEY])
+    owner, beat_ms = found[HEARTBEAT_OWNER_KEY], found[HEARTBEAT_KEY]
+    if owner != token:
+        stale_ms = HEARTBEAT_TAKEOVER_INTERVALS * interval_seconds * 1000
+        if owner and time.time() * 1000 - beat_ms <= stale_ms:
+            _heartbeat["writer"] = False
+            return False
+        _ensure_row(bind, HEARTBEAT_OWNER_KEY, 0)
+        # Compare-and-set: of several processes seeing the same stale owner, one wins
+        with bind.begin() as conn:
+            won = conn.execute(
+                update(table)
+                .where(table.c.table_name == HEARTBEAT_OWNER_KEY, table.c.version == owner)
+                .values(version=token)
+            ).rowcount
+        if not won:
+            _heartbeat["writer"] = False
+            return False
+        _heartbeat["takeovers"] += 1
+        print("🪞 This process now writes the read-replica heartbeat.")
+    write_heartbeat(bind)
+    _heartbeat["writer"] = True
+    return True
+
+
+def replica_lag(refresh=False):
+    """Seconds the replica trails the primary's heartbeat; None when unknown or unreachable."""
+    now = time.monotonic()
+    with _lock:
+        if not refresh and now - _lag["checked"] < LAG_CHECK_SECONDS:
+            return _lag["lag"]
+    lag, error = None, None
+    try:
+        with get_replica_engine().connect() as conn:
+            beat_ms = conn.execute(
+                select(TableVersion.version).where(TableVersion.table_name == HEARTBEAT_KEY)
+            ).scalar()
+        if beat_ms is not None:
+            lag = max(time.time() - beat_ms / 1000, 0.0)
+        else:
+            error = "no heartbeat on replica"
+    except SQLAlchemyError as e:
+        error = str(e)
+    with _lock:
+        if error and error != _lag["error"]:
+            print(f"⚠️ Read replica unavailable, reading from primary: {error}")
+        _lag.update(lag=lag, checked=now, error=error)
+    return lag
+
+
+def _caught_up(replica, tables):
+    """True when the replica has every change the primary has counted for `tables` (cached briefly)."""
+    key = tuple(sorted(tables))
+    now = time.monotonic()
+    with _lock:
+        cached = _caught_up_checks.get(key)
+    if cached is not None and now - cached[0] < LAG_CHECK_SECONDS:
+        return cached[1]
+    try:
+        with module_engine.connect() as conn:
+            primary = read_table_versions(conn, key)
+        with replica.connect() as conn:
+            copied = read_table_versions(conn, key)
+        result = all(copied[name] >= primary[name] for name in key)
+    except SQLAlchemyError:
+        result = False
+    with _lock:
+        _caught_up_checks[key] = (now, result)
+    return result
+
+
+def _replica_for_read(tables=None):
+    """The replica engine if the policy allows reading from it right now, else None."""
+    replica = get_replica_engine()
+    if replica is None or POLICY not in ("lag", "any"):
+        return None
+    if _pinned.get():
+        _count("pinned_by_client")
+        return None
+    lag = replica_lag()
+    if lag is None:
+        _count("unavailable")
+        return None
+    if POLICY == "lag" and lag > MAX_LAG:
+        _count("stale")
+        return None
+    if tables and not _caught_up(replica, tables):
+        _count("not_caught_up")
+        return None
+    return replica
+
+
+@contextmanager
+def read_session_scope(tables=None):
+    """
+    session_scope() for reads: a ReplicaRoutingSession when the replica may be
+    used, otherwise a plain primary session. `tables` additionally requires the
+    replica to have caught up on those tables (for callers that cache results).
+    """
+    replica = _replica_for_read(tables)
+    if replica is None:
+        _count("primary_sessions")
+        with session_scope() as db:
+            yield db
+        return
+    _count("replica_sessions")
+    with session_scope(_ReplicaSessionLocal) as db:
+        yield db
+
+
+def get_read_db():
+    """FastAPI dependency for read-only routes: one replica-routed session per request."""
+    with read_session_scope() as db:
+        yield db
+
+
+class ReadYourWritesMiddleware:
+    """Pins a client to the primary for STICKY_SECONDS after one of its writes succeeds."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = _pinned.set(_sticky_until(scope) > time.time())
+        is_write = scope["method"] in WRITE_METHODS
+
+        async def send_wrapper(message):
+            if is_write and message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + STICKY_SECONDS
+                cookie = (
+                    f"{STICKY_COOKIE}={until:.3f}; Max-Age={int(STICKY_SECONDS) + 1}; "
+                    "Path=/; HttpOnly; SameSite=Lax"
+                )
+                message = dict(message, headers=list(message.get("headers", [])) + [(b"set-cookie", cookie.encode())])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _pinned.reset(token)
+
+
+def _sticky_until(scope):
+    for name, value in scope.get("headers", []):
+        if name == b"cookie":
+            morsel = SimpleCookie(value.decode("latin-1")).get(STICKY_COOKIE)
+            if morsel is not None:
+                try:
+                    return float(morsel.value)
+                except ValueError:
+                    return 0.0
+    return 0.0
+
+
+def start_replica_heartbeat(interval_seconds=HEARTBEAT_SECONDS):
+    """Run heartbeat_tick() now and then every interval in a daemon thread."""
+    if not REPLICA_URL or interval_seconds <= 0 or HEARTBEAT_WRITER == "0":
+        return None
+    _stop_event.clear()
+
+    def loop():
+        while True:
+            try:
+                heartbeat_tick(interval_seconds=interval_seconds)
+            except SQLAlchemyError as e:
+                print(f"⚠️ Replica heartbeat failed: {e}")
+            if _stop_event.wait(interval_seconds):
+                return
+
+    thread = threading.Thread(target=loop, name="replica-heartbeat", daemon=True)
+    thread.start()
+    return thread
+
+
+def stop_replica_heartbeat():
+    _stop_event.set()
+
+
+def install_replica_heartbeat(app):
+    """Start the heartbeat with the app and stop it on shutdown (no routing middleware)."""
+    if not REPLICA_URL:
+        return
+    app.router.on_startup.append(start_replica_heartbeat)
+    app.router.on_shutdown.append(stop_replica_heartbeat)
+
+
+def install_read_replica(app):
+    """Client stickiness middleware plus the heartbeat, when a replica is configured."""
+    if not REPLICA_URL or POLICY not in POLICIES or POLICY == "off":
+        return
+    app.add_middleware(ReadYourWritesMiddleware)
+    install_replica_heartbeat(app)
+    print(f"🪞 Read replica routing on (policy {POLICY}, max lag {MAX_LAG}s).")
+
+
+def replica_stats():
+    with _lock:
+        stats = dict(_stats)
+        lag, error = _lag["lag"], _lag["error"]
+    return {
+        "configured": bool(REPLICA_URL),
+        "policy": POLICY,
+        "max_lag_seconds": MAX_LAG,
+        "sticky_seconds": STICKY_SECONDS,
+        "last_lag_seconds": round(lag, 3) if lag is not None else None,
+        "last_error": error,
+        "heartbeat_mode": HEARTBEAT_WRITER,
+        "heartbeat_writer": _heartbeat["writer"],
+        "heartbeat_takeovers": _heartbeat["takeovers"],
+        **stats,
+    }
@@ -0,0 +1,60 @@
+"""
+core/utils/utils_smtp.py
+--------------------------
+Shared SMTP settings, connections and message building for module mailers
+(the invite outbox, appointment reminders).
+
+SMTP settings: SMTP_HOST / SMTP_PORT / SMTP_USER / SMTP_PASSWORD / SMTP_FROM /
+SMTP_USE_TLS. Without SMTP_HOST, smtp_config() returns None and callers fall
+back to core.utils.smtp_utils.send_email. For local testing point
+SMTP_HOST/SMTP_PORT at a debugging server, e.g.
+`python -m aiosmtpd -n -l localhost:1025` with SMTP_USE_TLS=0.
+"""
+
+import os
+import smtplib
+from email.message import EmailMessage
+
+
+def smtp_config():
+    """SMTP settings from the environment, or None when SMTP_HOST is unset."""
+    host = os.getenv("SMTP_HOST")
+    if not host:
+        return None
+    return {
+        "host": host,
+        "port": int(os.getenv("SMTP_PORT", "587")),
+        "user": os.getenv("SMTP_USER"),
+        "password": os.getenv("SMTP_PASSWORD"),
+        "sender": os.getenv("SMTP_FROM") or os.getenv("SMTP_USER") or "no-reply@localhost",
+        "use_tls": os.getenv("SMTP_USE_TLS", "1") == "1",
+    }
+
+
+def open_smtp(config):
+    """An authenticated SMTP connection (STARTTLS unless use_tls is off)."""
+    server = smtplib.SMTP(config["host"], config["port"], timeout=30)
+    if config["use_tls"]:
+        server.starttls()
+    if config["user"] and config["password"]:
+        server.login(config["user"], config["password"])
+    return server
+
+
+def close_smtp(server):
+    """QUIT politely; drop the socket if the server is already gone."""
+    try:
+        server.quit()
+    except (smtplib.SMTPException, OSError):
+        server.close()
+
+
+def build_message(config, to, subject, html_body):
+    """HTML email with a plain-text fallback part."""
+    msg = EmailMessage()
+    msg["From"] = config["sender"]
+    msg["To"] = to
+    msg["Subject"] = subject
+    msg.set_content("This message requires an HTML-capable email client.")
+    msg.add_alternative(html_body, subtype="html")
+    return msg
@@ -0,0 +1,246 @@
+"""
+core/utils/utils_static_assets.py
+--------------------------
+Fingerprinted, precompressed static assets built from the manifests' `static` maps.
+
+build_static_assets() copies every CSS/JS file listed by an active module into
+ASSET_BUILD_DIR. Each copy gets a content hash in its name
+(css/access_matrix.3f2a9c1b7d04.css), plus .gz and, when the optional
+`brotli` package is installed, .br variants. asset-manifest.json maps each
+installed URL (/static/css/access_matrix.css) to its fingerprinted URL.
+
+Templates call {{ asset_url('/static/css/access_matrix.css') }}. It returns
+the fingerprinted URL, or the plain path when no build exists. Fingerprinted
+files are served under ASSET_URL_PREFIX by AssetFiles with
+`Cache-Control: immutable` and the best precompressed variant the client
+accepts, so nothing is compressed per request.
+
+Env:
+    ASSET_BUILD_DIR      output directory                 default "static_build"
+    ASSET_URL_PREFIX     URL the build is mounted at       default "/assets"
+
+CLI (run after installing or upgrading modules):
+    python -m core.utils.utils_static_assets
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import sys
+import threading
+import time
+
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.staticfiles import StaticFiles
+from core.utils.utils_module_index import load_module_index, write_atomic
+
+try:
+    import brotli
+except ImportError:  # optional: gzip-only builds without it
+    brotli = None
+
+ASSET_BUILD_DIR = os.getenv("ASSET_BUILD_DIR", "static_build")
+ASSET_URL_PREFIX = os.getenv("ASSET_URL_PREFIX", "/assets").rstrip("/")
+MANIFEST_NAME = "asset-manifest.json"
+IMMUTABLE = "public, max-age=31536000, immutable"
+COMPRESSIBLE = (".css", ".js", ".svg", ".html", ".json", ".map", ".txt")
+# Below this, compression headers cost more than they save
+MIN_COMPRESS_BYTES = 256
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_lock = threading.Lock()
+_manifest = None
+
+
+def _static_pairs(module):
+    """Yield (source in module folder, installed path) from a nested static map."""
+    def walk(mapping):
+        for key, value in mapping.items():
+            if isinstance(value, dict):
+                yield from walk(value)
+            else:
+                yield key, value
+    yield from walk(module.get("static") or {})
+
+
+def _fingerprinted(installed_path, digest):
+    # static/appointments/js/appointments.js -> appointments/js/appointments.<hash>.js
+    relative = installed_path.replace("\\", "/")
+    relative = relative[len("static/"):] if relative.startswith("static/") else relative
+    stem, ext = os.path.splitext(relative)
+    return f"{stem}.{digest}{ext}"
+
+
+def _write_variants(data, target):
+    # Each file is replaced atomically: a running server never serves a half-written variant
+    write_atomic(target, data)
+    sizes = {"size": len(data)}
+    if not target.endswith(COMPRESSIBLE) or len(data) < MIN_COMPRESS_BYTES:
+        return sizes
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    write_atomic(target + ".gz", gz)
+    sizes["gzip_size"] = len(gz)
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        write_atomic(target + ".br", br)
+        sizes["br_size"] = len(br)
+    return sizes
+
+
+def _source_path(module, source, installed):
+    # The installed copy is what the app serves today; fall back to the module folder
+    if os.path.isfile(installed):
+        return installed
+    return os.path.join(module["module_dir"], source)
+
+
+def build_static_assets(index=None, build_dir=ASSET_BUILD_DIR, force=False):
+    """Fingerprint and precompress every manifest asset; unchanged sources are skipped."""
+    global _manifest
+    if index is None:
+        index = load_module_index()
+
+    started = time.perf_counter()
+    previous = {} if force else (_read_manifest(build_dir) or {}).get("assets", {})
+    assets, built, missing = {}, 0, []
+    for module in index.get("modules", []):
+        if module.get("status", "active") != "active":
+            continue
+        for source, installed in _static_pairs(module):
+            path = _source_path(module, source, installed)
+            url = "/" + installed.replace("\\", "/").lstrip("/")
+            try:
+                stat = os.stat(path)
+            except OSError:
+                missing.append(url)
+                continue
+
+            known = previous.get(url)
+            if known and known["mtime"] == stat.st_mtime and known["source_size"] == stat.st_size \
+                    and os.path.isfile(os.path.join(build_dir, known["file"])):
+                assets[url] = known
+                continue
+
+            with open(path, "rb") as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            relative = _fingerprinted(installed, digest)
+            target = os.path.join(build_dir, relative)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            entry = _write_variants(data, target)
+            entry.update(
+                module=module["slug"],
+                file=relative,
+                url=f"{ASSET_URL_PREFIX}/{relative}",
+                hash=digest,
+                mtime=stat.st_mtime,
+                source_size=stat.st_size,
+            )
+            assets[url] = entry
+            built += 1
+
+    manifest = {"built_at": time.time(), "url_prefix": ASSET_URL_PREFIX, "assets": assets}
+    os.makedirs(build_dir, exist_ok=True)
+    write_atomic(os.path.join(build_dir, MANIFEST_NAME), json.dumps(manifest, indent=2).encode("utf-8"))
+    with _lock:
+        _manifest = manifest
+
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+    print(f"📦 Static assets: {built} built, {len(assets) - built} unchanged in {elapsed_ms} ms.")
+    for url in missing:
+        print(f"⚠️ Static asset not found: {url}")
+    return {"built": built, "total": len(assets), "missing": missing, "build_ms": elapsed_ms}
+
+
+def _read_manifest(build_dir=ASSET_BUILD_DIR):
+    try:
+        with open(os.path.join(build_dir, MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def asset_manifest():
+    global _manifest
+    with _lock:
+        if _manifest is None:
+            _manifest = _read_manifest() or {"assets": {}}
+        return _manifest
+
+
+def asset_url(path, fallback=None):
+    """Fingerprinted URL for an installed static path, else `fallback` or the path itself."""
+    entry = asset_manifest()["assets"].get("/" + path.lstrip("/"))
+    if entry is not None:
+        return entry["url"]
+    return fallback or path
+
+
+def accepted_encodings(header):
+    """Precompressed encodings the client accepts, best first (RFC 9110 Accept-Encoding; q=0 refuses)."""
+    weights = {}
+    for part in header.split(","):
+        coding, *params = [p.strip() for p in part.split(";")]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding.lower()] = q
+    wildcard = weights.get("*", 0.0)
+    ranked = []
+    for preference, (encoding, suffix) in enumerate(ENCODINGS):
+        q = weights.get(encoding, wildcard)
+        if q > 0:
+            ranked.append((-q, preference, encoding, suffix))
+    return [(encoding, suffix) for _, _, encoding, suffix in sorted(ranked)]
+
+
+class AssetFiles(StaticFiles):
+    """Serves fingerprinted files with immutable caching and precompressed variants."""
+
+    async def get_response(self, path, scope):
+        accept = Headers(scope=scope).get("accept-encoding", "")
+        response = None
+        for encoding, suffix in accepted_encodings(accept):
+            try:
+                response = await super().get_response(path + suffix, scope)
+            except HTTPException:
+                continue
+            if response.status_code in (200, 304):
+                response.headers["Content-Encoding"] = encoding
+                media_type, _ = mimetypes.guess_type(path)
+                if media_type:
+                    response.headers["Content-Type"] = media_type
+                break
+            response = None
+        if response is None:
+            response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = IMMUTABLE
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+
+def mount_static_assets(app, build_dir=ASSET_BUILD_DIR):
+    """Mount the build at ASSET_URL_PREFIX (creates the directory if needed)."""
+    os.makedirs(build_dir, exist_ok=True)
+    app.mount(ASSET_URL_PREFIX, AssetFiles(directory=build_dir), name="module_assets")
+
+
+def main(argv=None):
+    force = "--force" in (argv if argv is not None else sys.argv[1:])
+    result = build_static_assets(force=force)
+    return 1 if result["missing"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+core/utils/utils_table_versions.py
+--------------------------
+Per-table change counters and strong ETags for polled list endpoints.
+
+Any ORM flush or ORM bulk UPDATE/DELETE/INSERT that touches a tracked table
+bumps that table's row in core_table_versions inside the same transaction.
+The counter therefore moves whichever route, worker or core page made the
+change, and it rolls back with it.
+
+Tables are registered centrally from the "tracked_tables" list in each
+module.json when this module is imported (and again by install_lazy_modules).
+A worker that has not loaded a module's router yet still bumps its counters.
+
+List routes hash the versions of the tables they read, plus their query
+params, into an ETag. A matching If-None-Match is answered with 304 after
+one primary-key lookup, so the join and the serialization are skipped.
+"""
+
+import hashlib
+
+from fastapi import Request, Response
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from core.models.model_table_versions import TableVersion
+from core.utils.utils_db_session import fetch_all
+
+# Browsers keep the body but revalidate with If-None-Match on every load
+CACHE_CONTROL = "private, no-cache"
+
+_tracked = set()
+
+
+def track_tables(*names):
+    """Start counting changes to these tables; returns the names for use as a list key."""
+    _tracked.update(names)
+    return names
+
+
+def track_manifest_tables(index=None):
+    """Track every table listed under "tracked_tables" in the module manifests."""
+    if index is None:
+        from core.utils.utils_module_index import load_module_index
+        try:
+            index = load_module_index()
+        except OSError as e:
+            print(f"⚠️ Could not read the module index for tracked tables: {e}")
+            return
+    for module in index.get("modules", []):
+        track_tables(*module.get("tracked_tables", []))
+
+
+def bump_table_versions(conn, names):
+    """Increment the counters for `names` on `conn`'s current transaction."""
+    table = TableVersion.__table__
+    # Fixed order so concurrent writers lock the counter rows the same way
+    for name in sorted(names):
+        bump = update(table).where(table.c.table_name == name).values(version=table.c.version + 1)
+        if conn.execute(bump).rowcount:
+            continue
+        try:
+            with conn.begin_nested():
+                conn.execute(insert(table).values(table_name=name, version=1))
+        except IntegrityError:
+            # Another transaction created the row first
+            conn.execute(bump)
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_flushed_tables(session, flush_context, instances):
+    names = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__table__", None)
+        if table is not None and table.name in _tracked:
+            names.add(table.name)
+    if names:
+        bump_table_versions(session.connection(), names)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _bump_bulk_tables(orm_execute_state):
+    state = orm_execute_state
+    if not (state.is_update or state.is_delete or getattr(state, "is_insert", False)):
+        return
+    name = getattr(getattr(state.statement, "table", None), "name", None)
+    if name in _tracked:
+        bump_table_versions(state.session.connection(), {name})
+
+
+def read_table_versions(conn, names):
+    """Current counters for `names` on a Connection or sync Session, as {name: version}."""
+    found = dict(conn.execute(
+        select(TableVersion.table_name, TableVersion.version).where(TableVersion.table_name.in_(names))
+    ).all())
+    return {name: found.get(name, 0) for name in names}
+
+
+async def table_versions(db, names):
+    """Current counters for `names` (0 for tables never written)."""
+    rows = await fetch_all(
+        db,
+        select(TableVersion.table_name, TableVersion.version).where(TableVersion.table_name.in_(names)),
+    )
+    found = {r.table_name: r.version for r in rows}
+    return [found.get(name, 0) for name in names]
+
+
+async def list_etag(db, names, request: Request, *extra):
+    """Strong ETag over the table versions, the request's query params and any `extra` values."""
+    versions = await table_versions(db, names)
+    parts = [f"{name}:{version}" for name, version in zip(names, versions)]
+    parts.append(str(sorted(request.query_params.multi_items())))
+    parts.extend(str(e) for e in extra)
+    return '"' + hashlib.sha256("|".join(parts).encode()).hexdigest()[:32] + '"'
+
+
+def not_modified(request: Request, etag):
+    """A 304 response if the client already holds `etag`, else None."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    candidates = {t.strip().removeprefix("W/") for t in header.split(",")}
+    if etag in candidates or "*" in candidates:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+    return None
+
+
+def set_etag(response: Response, etag):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+
+track_manifest_tables()
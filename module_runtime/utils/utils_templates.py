@@ -0,0 +1,108 @@
+"""
+core/utils/utils_templates.py
+--------------------------
+One Jinja2 environment shared by every module page route.
+
+All page routes render through `templates` from this file. They share one
+loader and one compiled-template cache per worker instead of keeping one each.
+Compiled bytecode is also written to a FileSystemBytecodeCache keyed by
+template name and source checksum. A worker that starts later, or a restart,
+loads the bytecode instead of re-parsing the template.
+
+preload_templates() compiles every template listed in the manifests'
+`templates` and `sidebar_template` maps. Running it at startup keeps the
+compile cost off the first request.
+
+Templates get `asset_url(path)` for fingerprinted static URLs
+(see core.utils.utils_static_assets).
+
+Env:
+    TEMPLATES_DIR              template root                         default "templates"
+    TEMPLATE_BYTECODE_CACHE    bytecode cache dir ("" disables)      default ".cache/jinja"
+    TEMPLATE_AUTO_RELOAD       re-check template mtimes on render    default 1
+    TEMPLATE_CACHE_SIZE        compiled templates kept per worker    default 400
+"""
+
+import os
+import time
+
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, TemplateError
+from core.utils.utils_static_assets import asset_url
+
+TEMPLATES_DIR = os.getenv("TEMPLATES_DIR", "templates")
+BYTECODE_CACHE_DIR = os.getenv("TEMPLATE_BYTECODE_CACHE", ".cache/jinja")
+AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "1") == "1"
+CACHE_SIZE = int(os.getenv("TEMPLATE_CACHE_SIZE", "400"))
+TEMPLATE_MAPS = ("templates", "sidebar_template")
+
+_preload_stats = {}
+
+
+def _bytecode_cache():
+    if not BYTECODE_CACHE_DIR:
+        return None
+    os.makedirs(BYTECODE_CACHE_DIR, exist_ok=True)
+    return FileSystemBytecodeCache(BYTECODE_CACHE_DIR, "bytesmile-%s.jinja.cache")
+
+
+env = Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    autoescape=True,
+    bytecode_cache=_bytecode_cache(),
+    auto_reload=AUTO_RELOAD,
+    cache_size=CACHE_SIZE,
+)
+env.globals["asset_url"] = asset_url
+templates = Jinja2Templates(env=env)
+
+
+def _template_name(installed_path):
+    """templates/sidebar/x.html -> sidebar/x.html (name relative to TEMPLATES_DIR)."""
+    path = installed_path.replace("\\", "/")
+    prefix = os.path.basename(os.path.normpath(TEMPLATES_DIR)) + "/"
+    return path[len(prefix):] if path.startswith(prefix) else path
+
+
+def manifest_template_names(index=None):
+    """Every template installed by an active module, per the manifest index."""
+    if index is None:
+        from core.utils.utils_module_index import load_module_index
+        index = load_module_index()
+    names = []
+    for module in index.get("modules", []):
+        if module.get("status", "active") != "active":
+            continue
+        for key in TEMPLATE_MAPS:
+            for installed_path in (module.get(key) or {}).values():
+                name = _template_name(installed_path)
+                if name not in names:
+                    names.append(name)
+    return names
+
+
+def preload_templates(index=None):
+    """Compile (or load from bytecode cache) every manifest template into the shared env."""
+    started = time.perf_counter()
+    loaded, failed = 0, {}
+    for name in manifest_template_names(index):
+        try:
+            env.get_template(name)
+            loaded += 1
+        except TemplateError as e:
+            failed[name] = str(e)
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+    _preload_stats.update(loaded=loaded, failed=failed, preload_ms=elapsed_ms, at=time.time())
+    print(f"🧩 Preloaded {loaded} template(s) in {elapsed_ms} ms.")
+    for name, error in failed.items():
+        print(f"⚠️ Template {name} failed to compile: {error}")
+    return dict(_preload_stats)
+
+
+def template_stats():
+    return {
+        "preload": dict(_preload_stats),
+        "compiled_in_memory": len(env.cache) if env.cache is not None else 0,
+        "bytecode_cache_dir": BYTECODE_CACHE_DIR or None,
+        "auto_reload": AUTO_RELOAD,
+    }
@@ -3,37 +3,50 @@ from core.db import Base, engine
 from sqlalchemy.exc import InvalidRequestError
 
 def install(app=None):
-    """Robust install: register model, create table once, unregister cleanly to avoid reimport issues."""
+    """Robust install: register models, create tables once, unregister cleanly to avoid reimport issues."""
     current_dir = os.path.dirname(os.path.abspath(__file__))
     models_dir = os.path.join(current_dir, "models")
     sys.path.insert(0, models_dir)
 
     try:
-        from model_staff_invites import Invites
+        from model_staff_invites import Invites, InvitesArchive, InviteOutbox
+        models = (Invites, InvitesArchive, InviteOutbox)
 
         # 🧹 Remove stale class definitions in ORM registry (safe re-install)
         class_registry = getattr(Base.registry, "_class_registry", {})
-        if "Invites" in class_registry:
-            del class_registry["Invites"]
-            print("🧹 Removed old Invites ORM class from registry.")
-
-        # 🧹 Remove any existing table reference before re-creation
-        table_name = Invites.__table__.fullname
-        if table_name in Base.metadata.tables:
-            Base.metadata.remove(Base.metadata.tables[table_name])
-            print(f"🧹 Removed stale table reference: {table_name}")
-
-        # ✅ Create table if it doesn’t exist yet
+        for model in models:
+            if model.__name__ in class_registry:
+                del class_registry[model.__name__]
+                print(f"🧹 Removed old {model.__name__} ORM class from registry.")
+
+        # 🧹 Remove stale table references before re-creation
+        # (the outbox FK needs the current invites table to stay in metadata)
+        table_names = [model.__table__.fullname for model in models]
+        for model in models:
+            table_name = model.__table__.fullname
+            registered = Base.metadata.tables.get(table_name)
+            if registered is not None and registered is not model.__table__:
+                Base.metadata.remove(registered)
+                print(f"🧹 Removed stale table reference: {table_name}")
+
+        # ✅ Create tables if they don’t exist yet (parent first)
         try:
-            Base.metadata.create_all(bind=engine, tables=[Invites.__table__])
-            print("✅ Invites table created (if not existing).")
+            Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in models])
+            print("✅ Invites tables created (if not existing).")
         except InvalidRequestError:
-            print("ℹ️ Table already exists; skipping create_all().")
+            print("ℹ️ Tables already exist; skipping create_all().")
+
+        # 🧩 Migrate indexes onto tables created by earlier versions
+        for model in models:
+            for index in model.__table__.indexes:
+                index.create(bind=engine, checkfirst=True)
+        print("✅ Invites indexes ensured.")
 
         # ✅ Immediately unregister to prevent “already defined” errors later
-        if table_name in Base.metadata.tables:
-            Base.metadata.remove(Base.metadata.tables[table_name])
-            print("🧹 Model unregistered from metadata after install.")
+        for table_name in table_names:
+            if table_name in Base.metadata.tables:
+                Base.metadata.remove(Base.metadata.tables[table_name])
+        print("🧹 Models unregistered from metadata after install.")
 
         print("✅ Invites module installed successfully.")
 
@@ -1,10 +1,11 @@
 """
 modules/staff_invites/models/model_staff_invites.py
 ---------------------------------------
-Database model for invitation tracking (invite-only registration).
+Database models for invitation tracking (invite-only registration)
+and the durable outbox used to deliver invite emails.
 """
 
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Boolean, DateTime, Index
 from datetime import datetime, timedelta
 from core.db import Base
 
@@ -22,6 +23,58 @@ class Invites(Base):
     )
     accepted = Column(Boolean, default=False)
 
+    __table_args__ = (
+        # create_invite / bulk duplicate checks filter on (email, role_id, accepted)
+        Index("ix_staff_invites_email_role_accepted", "email", "role_id", "accepted"),
+        # list status filters and the lifecycle sweeper
+        Index("ix_staff_invites_accepted_expires", "accepted", "expires_at"),
+        Index("ix_staff_invites_created", "created_at", "id"),
+        # Never hand out a swept invite's id again (SQLite otherwise reuses the highest rowid)
+        {"sqlite_autoincrement": True},
+    )
+
     def is_expired(self) -> bool:
         """Check if the staff_invites token is expired."""
         return datetime.utcnow() > self.expires_at
+
+
+class InvitesArchive(Base):
+    """Expired or accepted invites moved out of core_staff_invites by the sweeper."""
+    __tablename__ = "core_staff_invites_archive"
+
+    # Own key: live invite ids can repeat over time, so they are kept in original_id
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    original_id = Column(Integer, index=True)
+    email = Column(String, nullable=False)
+    role_id = Column(Integer, nullable=False)
+    token = Column(String, nullable=False)
+    created_at = Column(DateTime)
+    expires_at = Column(DateTime)
+    accepted = Column(Boolean, default=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = {"sqlite_autoincrement": True}
+
+
+class InviteOutbox(Base):
+    """Queued invite emails, drained by the background outbox workers."""
+    __tablename__ = "core_staff_invite_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    invite_id = Column(Integer, ForeignKey("core_staff_invites.id", ondelete="SET NULL"), nullable=True)
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    # queued -> sending -> sent | failed; sending -> cancelled when its invite is revoked
+    status = Column(String(16), nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = Column(String(32), nullable=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_staff_invite_outbox_due", "status", "next_attempt_at"),
+        Index("ix_staff_invite_outbox_invite", "invite_id"),
+    )
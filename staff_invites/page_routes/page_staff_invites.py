@@ -1,10 +1,9 @@
 # page_routes/page_invite.py
 from fastapi import APIRouter, Request, Depends
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from core.utils.utils_templates import templates
 from core.utils.auth_utils import require_roles, get_current_user
 
-templates = Jinja2Templates(directory="templates")
 router = APIRouter(tags=["Pages"])
 
 @router.get("/staff_invites/accept_page", response_class=HTMLResponse)
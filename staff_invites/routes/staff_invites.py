@@ -4,23 +4,48 @@ core/routes/invite.py
 Handles invite-only user registration links using core_invites table.
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Form
-from pydantic import BaseModel, EmailStr
-from datetime import datetime
-from werkzeug.security import generate_password_hash
+from fastapi import APIRouter, HTTPException, Depends, Form, UploadFile, File, Query, Request, Response
+from pydantic import BaseModel, EmailStr, ValidationError
+from datetime import datetime, timedelta
+from typing import List, Literal
+import csv
+import io
 from core.utils.auth_utils import require_roles
-from core.utils.utils_staff_invites import create_invite_token, decode_invite_token
+from core.utils.utils_staff_invites import (
+    INVITE_TOKEN_EXPIRE_HOURS,
+    create_invite_token,
+    decode_invite_token,
+    get_cached_invite,
+    cache_valid_invite,
+    cache_invalid_invite,
+    evict_invite_token,
+    invite_cache_stats,
+    invites_version,
+)
+from core.utils.utils_password_hashing import HashingBusy, hash_password, hashing_stats, shutdown_hashing
 from core.models.role import Role
-from core.models.model_staff_invites import Invites
-from core.utils.smtp_utils import send_email
+from core.models.model_staff_invites import Invites, InviteOutbox
+from core.utils.utils_invite_outbox import enqueue_email, outbox
 from core.models.user import User
-from core.db import SessionLocal
+from core.utils.utils_db_session import fetch_all, get_db, module_db, session_scope
+from core.utils.utils_table_versions import list_etag, not_modified, set_etag, track_tables
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
 import os
 
 
 router = APIRouter(prefix="/api/staff_invites", tags=["Invitations"])
 MY_DOMAIN = os.getenv("MY_DOMAIN")
 
+# Tables whose changes alter the list/roles responses (see list ETags)
+INVITE_LIST_TABLES = track_tables(Invites.__tablename__, InviteOutbox.__tablename__, Role.__tablename__)
+ROLE_LIST_TABLES = track_tables(Role.__tablename__)
+
+# 📮 Invite emails are delivered by the outbox workers, not inside the request.
+# The outbox and the sweeper are "background_workers" in module.json and start
+# with the app, not with this router.
+router.add_event_handler("shutdown", shutdown_hashing)
+
 
 class InviteRequest(BaseModel):
     email: EmailStr
@@ -30,78 +55,213 @@ class AcceptInviteRequest(BaseModel):
     token: str
     password: str
 
+class BulkInviteRequest(BaseModel):
+    invites: List[InviteRequest]
+
+BULK_INVITE_LIMIT = 500
+
+def invite_email_body(role_name, invite_link, expires_at):
+    return f"""
+        <h3>You’ve been invited to join ByteSmile</h3>
+        <p>You’ve been invited to register as a <b>{role_name}</b>.</p>
+        <p>Click the button below to complete your registration:</p>
+        <a href="{invite_link}" style="
+            display: inline-block;
+            padding: 10px 20px;
+            font-size: 16px;
+            color: #ffffff;
+            background-color: #007BFF;
+            text-decoration: none;
+            border-radius: 5px;
+        ">Complete Registration</a>
+        <p>This link expires on <b>{expires_at.strftime('%Y-%m-%d %H:%M:%S')}</b>.</p>
+    """
+
+
 @router.post("/create", dependencies=[Depends(require_roles("superadmin","admin", "manager"))])
-def create_invite(data: InviteRequest):
+def create_invite(data: InviteRequest, db: Session = Depends(get_db)):
     """
     Create an invitation link for a new staff member and store it in core_invites.
     """
-    db = SessionLocal()
     role = db.query(Role).filter_by(name=data.role).first()
     if not role:
-        db.close()
         raise HTTPException(status_code=400, detail=f"Role '{data.role}' does not exist")
 
     # Check if there's an existing unexpired invite
     existing = db.query(Invites).filter_by(email=data.email, role_id=role.id, accepted=False).first()
     if existing and not existing.is_expired():
-        db.close()
         raise HTTPException(status_code=400, detail="An active invite already exists for this email and role")
 
-    # Create and store invite
+    # Create and store invite, staging its email in the outbox in the same transaction
     token = create_invite_token(data.email, data.role)
     invite = Invites(email=data.email, role_id=role.id, token=token)
     db.add(invite)
-    db.commit()
-    db.refresh(invite)
-    db.close()
+    db.flush()
 
     invite_link = f"{MY_DOMAIN}/staff_invites/accept_page?token={token}"
-    email_body = f"""
-        <h3>You’ve been invited to join ByteSmile</h3>
-        <p>You’ve been invited to register as a <b>{data.role}</b>.</p>
-        <p>Click the button below to complete your registration:</p>
-        <a href="{invite_link}" style="
-            display: inline-block;
-            padding: 10px 20px;
-            font-size: 16px;
-            color: #ffffff;
-            background-color: #007BFF;
-            text-decoration: none;
-            border-radius: 5px;
-        ">Complete Registration</a>
-        <p>This link expires on <b>{invite.expires_at.strftime('%Y-%m-%d %H:%M:%S')}</b>.</p>
-    """
+    enqueue_email(
+        db,
+        data.email,
+        "ByteSmile Invitation",
+        invite_email_body(data.role, invite_link, invite.expires_at),
+        invite_id=invite.id,
+    )
+    expires_at = invite.expires_at
+    db.commit()
+    outbox.notify()
 
-    send_email(data.email, "ByteSmile Invitation", email_body)
-    # TODO: Send invite email here using your email service
     return {
         "message": "Invites created successfully",
         "invite_link": invite_link,
-        "expires_at": invite.expires_at.isoformat()
+        "expires_at": expires_at.isoformat(),
+        "delivery_status": "queued",
     }
 
 
+def _create_invites_bulk(rows):
+    """
+    Create many invites in one transaction.
+    `rows` is a list of (email, role) or an error string per input row.
+    Returns per-row results in input order.
+    """
+    results = [None] * len(rows)
+    valid = [(i, r) for i, r in enumerate(rows) if not isinstance(r, str)]
+    for i, r in enumerate(rows):
+        if isinstance(r, str):
+            results[i] = {"row": i + 1, "status": "error", "detail": r}
+
+    with session_scope() as db:
+        # One lookup for every role named in the batch
+        role_names = {role for _, (_, role) in valid}
+        roles = {r.name: r.id for r in db.query(Role.id, Role.name).filter(Role.name.in_(role_names)).all()}
+
+        # One IN query for active invites among all emails in the batch
+        emails = {email for _, (email, _) in valid}
+        active = {
+            (r.email, r.role_id)
+            for r in db.query(Invites.email, Invites.role_id).filter(
+                Invites.email.in_(emails),
+                Invites.accepted.is_(False),
+                Invites.expires_at > datetime.utcnow(),
+            ).all()
+        } if emails else set()
+
+        created, seen = [], set()
+        for i, (email, role) in valid:
+            role_id = roles.get(role)
+            if role_id is None:
+                results[i] = {"row": i + 1, "email": email, "status": "error", "detail": f"Role '{role}' does not exist"}
+            elif (email, role_id) in active or (email, role_id) in seen:
+                results[i] = {"row": i + 1, "email": email, "status": "skipped", "detail": "An active invite already exists for this email and role"}
+            else:
+                seen.add((email, role_id))
+                created.append((i, email, role, role_id, create_invite_token(email, role)))
+
+        if created:
+            # One multi-row INSERT for the invites and one for their outbox rows
+            now = datetime.utcnow()
+            expires_at = now + timedelta(hours=INVITE_TOKEN_EXPIRE_HOURS)
+            db.execute(insert(Invites.__table__), [
+                {"email": email, "role_id": role_id, "token": token, "created_at": now,
+                 "expires_at": expires_at, "accepted": False}
+                for _, email, _, role_id, token in created
+            ])
+            tokens = [token for *_, token in created]
+            ids = dict(db.execute(select(Invites.token, Invites.id).where(Invites.token.in_(tokens))).all())
+
+            messages = []
+            for i, email, role, _, token in created:
+                invite_link = f"{MY_DOMAIN}/staff_invites/accept_page?token={token}"
+                messages.append({
+                    "invite_id": ids[token],
+                    "recipient": email,
+                    "subject": "ByteSmile Invitation",
+                    "body": invite_email_body(role, invite_link, expires_at),
+                    "status": "queued",
+                    "next_attempt_at": now,
+                })
+                results[i] = {
+                    "row": i + 1,
+                    "email": email,
+                    "role": role,
+                    "status": "created",
+                    "invite_link": invite_link,
+                    "expires_at": expires_at.isoformat(),
+                }
+            db.execute(insert(InviteOutbox.__table__), messages)
+            db.commit()
+
+    if created:
+        outbox.notify()
+    return {
+        "created": sum(1 for r in results if r["status"] == "created"),
+        "skipped": sum(1 for r in results if r["status"] == "skipped"),
+        "errors": sum(1 for r in results if r["status"] == "error"),
+        "results": results,
+    }
+
+
+@router.post("/bulk", dependencies=[Depends(require_roles("superadmin", "admin", "manager"))])
+def create_invites_bulk(data: BulkInviteRequest):
+    """Invite many staff at once; all invites are written in a single transaction."""
+    if len(data.invites) > BULK_INVITE_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_INVITE_LIMIT} invites per request")
+    return _create_invites_bulk([(r.email, r.role) for r in data.invites])
+
+
+@router.post("/bulk/csv", dependencies=[Depends(require_roles("superadmin", "admin", "manager"))])
+def create_invites_bulk_csv(file: UploadFile = File(...)):
+    """Same as /bulk from a CSV upload with an `email,role` header."""
+    reader = csv.DictReader(io.TextIOWrapper(file.file, encoding="utf-8-sig", newline=""))
+    rows = []
+    for record in reader:
+        if len(rows) >= BULK_INVITE_LIMIT:
+            raise HTTPException(status_code=400, detail=f"At most {BULK_INVITE_LIMIT} invites per request")
+        try:
+            parsed = InviteRequest(email=(record.get("email") or "").strip(), role=(record.get("role") or "").strip())
+            rows.append((parsed.email, parsed.role))
+        except ValidationError as e:
+            rows.append(f"Invalid row: {e.errors()[0]['msg']}")
+    return _create_invites_bulk(rows)
+
+
 @router.get("/verify")
 def verify_invite(token: str):
     """
     Verify if an invite token is valid and not expired.
+    Results (including failures) are cached, so page refreshes skip the JWT decode and the DB.
     """
-    db = SessionLocal()
+    cached = get_cached_invite(token)
+    if cached is not None:
+        if not cached["valid"]:
+            raise HTTPException(status_code=cached["status_code"], detail=cached["detail"])
+        if datetime.utcnow() > cached["expires_at"]:
+            evict_invite_token(token)
+            raise HTTPException(status_code=400, detail="Invites expired")
+        return {"valid": True, "email": cached["email"], "role": cached["role"]}
+
     data = decode_invite_token(token)
     if not data:
-        db.close()
+        cache_invalid_invite(token, 400, "Invalid or expired invite token")
         raise HTTPException(status_code=400, detail="Invalid or expired invite token")
 
-    invite = db.query(Invites).filter_by(token=token).first()
-    if not invite:
-        db.close()
-        raise HTTPException(status_code=404, detail="Invites not found")
+    # Read before the lookup, so a change made meanwhile invalidates the entry cached below
+    version = invites_version()
+    with session_scope() as db:
+        invite = db.query(Invites).filter_by(token=token).first()
+        if not invite:
+            cache_invalid_invite(token, 404, "Invites not found")
+            raise HTTPException(status_code=404, detail="Invites not found")
 
-    if invite.is_expired():
-        db.close()
-        raise HTTPException(status_code=400, detail="Invites expired")
+        if invite.is_expired():
+            cache_invalid_invite(token, 400, "Invites expired")
+            raise HTTPException(status_code=400, detail="Invites expired")
+
+        if invite.accepted:
+            cache_invalid_invite(token, 400, "Invite already used")
+            raise HTTPException(status_code=400, detail="Invite already used")
 
-    db.close()
+        cache_valid_invite(token, data["email"], data["role"], invite.id, invite.expires_at, version)
     return {"valid": True, "email": data["email"], "role": data["role"]}
 
 
@@ -110,11 +270,16 @@ def accept_invite_api(token: str = Form(...), password: str = Form(...)):
     """
     Accept an invite, register a new user, and mark the invite as accepted.
     Compatible with upgraded User model.
+    The password is hashed in a worker process with no DB session open.
     """
-    db = SessionLocal()
-    try:
-        data_decoded = decode_invite_token(token)
-        if not data_decoded:
+    # Short session for validation; no pooled connection is held while the password is hashed
+    with session_scope() as db:
+        # A cached verification already proved the signature; only decode on a miss
+        cached = get_cached_invite(token)
+        if cached is not None and not cached["valid"]:
+            raise HTTPException(status_code=cached["status_code"], detail=cached["detail"])
+        if cached is None and not decode_invite_token(token):
+            cache_invalid_invite(token, 400, "Invalid or expired invite token")
             raise HTTPException(status_code=400, detail="Invalid or expired invite token")
 
         invite = db.query(Invites).filter_by(token=token).first()
@@ -139,78 +304,160 @@ def accept_invite_api(token: str = Form(...), password: str = Form(...)):
             raise HTTPException(status_code=400, detail="User already exists")
 
         # ✅ Capture invite data before closing session
+        invite_id = invite.id
+        invite_role_id = invite.role_id
         user_email = invite.email
         username = user_email.split("@")[0]
         role_name = role.name
 
-        # Create the new staff user
-        new_user = User(
-            username=username,
-            email=user_email,
-            full_name=username.title(),
-            password_hash=generate_password_hash(password),
-            role_id=invite.role_id,
-            position_title=role_name.title(),
-            department="Clinic",
-            is_active=True,
-            created_at=datetime.utcnow(),
-        )
-
-        invite.accepted = True
-        db.add(new_user)
-        db.commit()
+    try:
+        password_hash = hash_password(password)
+    except HashingBusy as e:
+        raise HTTPException(status_code=503, detail=f"{e}; please retry shortly")
 
-        return {
-            "message": f"✅ Invite accepted. User '{username}' created successfully as '{role_name}'."
-        }
+    try:
+        with session_scope() as db:
+            # Claim the invite atomically; a concurrent accept of the same token loses here
+            claimed = db.query(Invites).filter(
+                Invites.id == invite_id, Invites.accepted.is_(False)
+            ).update({"accepted": True}, synchronize_session=False)
+            if not claimed:
+                raise HTTPException(status_code=400, detail="Invite already used")
+
+            # Create the new staff user
+            new_user = User(
+                username=username,
+                email=user_email,
+                full_name=username.title(),
+                password_hash=password_hash,
+                role_id=invite_role_id,
+                position_title=role_name.title(),
+                department="Clinic",
+                is_active=True,
+                created_at=datetime.utcnow(),
+            )
+            db.add(new_user)
+            db.commit()
+            evict_invite_token(token)
+
+            return {
+                "message": f"✅ Invite accepted. User '{username}' created successfully as '{role_name}'."
+            }
 
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=f"Server error during invite acceptance: {e}")
-    finally:
-        db.close()
+
+
+@router.get("/metrics", dependencies=[Depends(require_roles("superadmin", "admin"))])
+def invite_metrics():
+    """Hashing pool timings and verified-token cache counters."""
+    return {"hashing": hashing_stats(), "token_cache": invite_cache_stats()}
 
 
 @router.get("/list")
-def list_invites():
-    db = SessionLocal()
+async def list_invites(
+    request: Request,
+    response: Response,
+    status: Literal["all", "active", "expired", "accepted"] = "all",
+    page: int = Query(1, ge=1),
+    limit: int = Query(50, ge=1, le=500),
+    db=Depends(module_db("staff_invites", read_only=True)),
+):
+    """
+    Invites newest first; status filtering and pagination happen in SQL.
+    Unchanged lists are answered 304 from the ETag.
+    """
+    now = datetime.utcnow()
+    # "expired" flips without a write, so the next pending expiry is part of the ETag
+    next_expiry = await fetch_all(
+        db,
+        select(func.min(Invites.expires_at)).where(Invites.accepted.is_(False), Invites.expires_at > now),
+    )
+    etag = await list_etag(db, INVITE_LIST_TABLES, request, next_expiry[0][0])
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    # Latest outbox message per invite carries the delivery status
+    latest_message = (
+        select(InviteOutbox.invite_id, func.max(InviteOutbox.id).label("message_id"))
+        .group_by(InviteOutbox.invite_id)
+        .subquery()
+    )
     # Join roles to get their names
-    staff_invites = db.query(Invites, Role.name.label("role_name")).join(Role, Invites.role_id == Role.id).all()
-
+    query = (
+        select(
+            Invites,
+            Role.name.label("role_name"),
+            InviteOutbox.status.label("delivery_status"),
+            InviteOutbox.attempts.label("delivery_attempts"),
+            InviteOutbox.last_error.label("delivery_error"),
+        )
+        .join(Role, Invites.role_id == Role.id)
+        .outerjoin(latest_message, latest_message.c.invite_id == Invites.id)
+        .outerjoin(InviteOutbox, InviteOutbox.id == latest_message.c.message_id)
+    )
+
+    if status == "active":
+        query = query.filter(Invites.accepted.is_(False), Invites.expires_at > now)
+    elif status == "expired":
+        query = query.filter(Invites.accepted.is_(False), Invites.expires_at <= now)
+    elif status == "accepted":
+        query = query.filter(Invites.accepted.is_(True))
+
+    staff_invites = await fetch_all(
+        db,
+        query.order_by(Invites.created_at.desc(), Invites.id.desc())
+        .offset((page - 1) * limit)
+        .limit(limit + 1),
+    )
+
+    has_more = len(staff_invites) > limit
     data = []
-    for invite, role_name in staff_invites:
+    for invite, role_name, delivery_status, delivery_attempts, delivery_error in staff_invites[:limit]:
         data.append({
             "email": invite.email,
             "role": role_name,
             "created_at": invite.created_at.strftime("%Y-%m-%d %H:%M"),
             "expires_at": invite.expires_at.strftime("%Y-%m-%d %H:%M"),
             "accepted": invite.accepted,
-            "expired": invite.is_expired(),
-            "token": invite.token
+            "expired": invite.expires_at <= now,
+            "token": invite.token,
+            "delivery_status": delivery_status,
+            "delivery_attempts": delivery_attempts or 0,
+            "delivery_error": delivery_error,
         })
-    db.close()
-    return data
+    set_etag(response, etag)
+    return {"items": data, "page": page, "limit": limit, "has_more": has_more}
 
 @router.delete("/revoke")
-def revoke_invite(token: str):
-    db = SessionLocal()
+def revoke_invite(token: str, db: Session = Depends(get_db)):
     invite = db.query(Invites).filter_by(token=token).first()
     if not invite:
-        db.close()
         raise HTTPException(status_code=404, detail="Invites not found")
+    # Don't deliver an invite email for a revoked invite. A row a worker already
+    # claimed is cancelled instead; the worker re-checks it right before sending.
+    db.query(InviteOutbox).filter(
+        InviteOutbox.invite_id == invite.id, InviteOutbox.status == "queued"
+    ).delete(synchronize_session=False)
+    db.query(InviteOutbox).filter(
+        InviteOutbox.invite_id == invite.id, InviteOutbox.status == "sending"
+    ).update({"status": "cancelled", "claim_token": None}, synchronize_session=False)
     db.delete(invite)
     db.commit()
-    db.close()
+    evict_invite_token(token)
     return {"message": "Invites revoked successfully"}
 
 
 @router.get("/roles")
-def get_roles():
+async def get_roles(request: Request, response: Response, db=Depends(module_db("staff_invites", read_only=True))):
     """Return all available roles for invites dropdown."""
-    db = SessionLocal()
-    roles = db.query(Role).order_by(Role.name.asc()).all()
-    data = [{"id": r.id, "name": r.name} for r in roles]
-    db.close()
-    return data
\ No newline at end of file
+    etag = await list_etag(db, ROLE_LIST_TABLES, request)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    set_etag(response, etag)
+    roles = await fetch_all(db, select(Role.id, Role.name).order_by(Role.name.asc()))
+    return [{"id": r.id, "name": r.name} for r in roles]
\ No newline at end of file
@@ -0,0 +1,287 @@
+"""
+core/utils/utils_invite_outbox.py
+--------------------------
+Durable outbox for invite emails.
+
+create_invite writes the email into core_staff_invite_outbox in the same
+transaction as the invite and returns immediately. A small pool of worker
+threads drains the outbox over pooled, reused SMTP connections and retries
+failures with exponential backoff. Right before sending, a worker re-checks
+that it still holds each claimed row, so a row cancelled meanwhile (revoked
+invite) is not delivered.
+
+SMTP settings are read by core.utils.utils_smtp (SMTP_HOST, ...). Without
+SMTP_HOST messages go through core.utils.smtp_utils.send_email.
+"""
+
+import os
+import queue
+import smtplib
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+from core.utils.utils_db_session import session_scope
+from core.models.model_staff_invites import InviteOutbox
+from core.utils.smtp_utils import send_email
+from core.utils.utils_smtp import build_message, close_smtp, open_smtp, smtp_config
+
+OUTBOX_WORKERS = int(os.getenv("STAFF_INVITES_OUTBOX_WORKERS", "2"))
+OUTBOX_BATCH_SIZE = int(os.getenv("STAFF_INVITES_OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_POLL_SECONDS = float(os.getenv("STAFF_INVITES_OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("STAFF_INVITES_OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_BACKOFF_SECONDS = 30
+# A "sending" row whose lease expired (worker died) becomes due again
+OUTBOX_LEASE = timedelta(minutes=5)
+
+
+class SMTPConnectionPool:
+    """Keeps up to `size` authenticated SMTP connections alive for reuse across batches."""
+
+    def __init__(self, size=OUTBOX_WORKERS, config=None):
+        self.config = config if config is not None else smtp_config()
+        self._idle = queue.LifoQueue(maxsize=max(size, 1))
+        self.stats = {"opened": 0, "reused": 0}
+
+    def _open(self):
+        server = open_smtp(self.config)
+        self.stats["opened"] += 1
+        return server
+
+    def acquire(self):
+        while True:
+            try:
+                server = self._idle.get_nowait()
+            except queue.Empty:
+                return self._open()
+            try:
+                server.noop()
+                self.stats["reused"] += 1
+                return server
+            except (smtplib.SMTPException, OSError):
+                server.close()
+
+    def release(self, server, broken=False):
+        if broken:
+            server.close()
+            return
+        try:
+            self._idle.put_nowait(server)
+        except queue.Full:
+            close_smtp(server)
+
+    def send(self, server, to, subject, html_body):
+        server.send_message(build_message(self.config, to, subject, html_body))
+
+    def close(self):
+        while True:
+            try:
+                server = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            close_smtp(server)
+
+
+def enqueue_email(db, recipient, subject, body, invite_id=None):
+    """Stage an email in the outbox; it is sent once the caller's transaction commits."""
+    message = InviteOutbox(
+        invite_id=invite_id,
+        recipient=recipient,
+        subject=subject,
+        body=body,
+        status="queued",
+        next_attempt_at=datetime.utcnow(),
+    )
+    db.add(message)
+    return message
+
+
+def _backoff(attempts):
+    return timedelta(seconds=OUTBOX_BACKOFF_SECONDS * (2 ** max(attempts - 1, 0)))
+
+
+class OutboxWorkerPool:
+    """Background threads that claim due outbox rows in batches and deliver them."""
+
+    def __init__(self, workers=OUTBOX_WORKERS, batch_size=OUTBOX_BATCH_SIZE, smtp_pool=None):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.smtp_pool = smtp_pool or SMTPConnectionPool(size=workers)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self.stats = {"sent": 0, "retried": 0, "failed": 0, "cancelled": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def notify(self):
+        """Wake a worker now instead of waiting for the next poll."""
+        self._wake.set()
+
+    def _claim(self):
+        """Lease up to batch_size due rows to this worker and return them."""
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        with session_scope() as db:
+            due_ids = [
+                r.id for r in db.query(InviteOutbox.id)
+                .filter(
+                    InviteOutbox.status.in_(("queued", "sending")),
+                    InviteOutbox.next_attempt_at <= now,
+                )
+                .order_by(InviteOutbox.next_attempt_at.asc())
+                .limit(self.batch_size)
+                .all()
+            ]
+            if not due_ids:
+                return []
+            db.execute(
+                update(InviteOutbox)
+                .where(
+                    InviteOutbox.id.in_(due_ids),
+                    InviteOutbox.status.in_(("queued", "sending")),
+                    InviteOutbox.next_attempt_at <= now,
+                )
+                .values(status="sending", claim_token=token, next_attempt_at=now + OUTBOX_LEASE)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            rows = (
+                db.query(InviteOutbox.id, InviteOutbox.recipient, InviteOutbox.subject,
+                         InviteOutbox.body, InviteOutbox.attempts, InviteOutbox.claim_token)
+                .filter(InviteOutbox.claim_token == token)
+                .all()
+            )
+            return rows
+
+    def _still_claimed(self, rows):
+        """The claimed rows nobody cancelled since the claim (revoke sets status "cancelled")."""
+        with session_scope() as db:
+            held = {
+                r.id for r in db.query(InviteOutbox.id).filter(
+                    InviteOutbox.id.in_([r.id for r in rows]),
+                    InviteOutbox.status == "sending",
+                    InviteOutbox.claim_token == rows[0].claim_token,
+                ).all()
+            }
+        return [r for r in rows if r.id in held]
+
+    def _deliver(self, rows):
+        """Send a claimed batch over one pooled connection; returns {id: error or None}."""
+        results = {}
+        if self.smtp_pool.config is None:
+            for r in rows:
+                try:
+                    send_email(r.recipient, r.subject, r.body)
+                    results[r.id] = None
+                except Exception as e:
+                    results[r.id] = str(e)
+            return results
+
+        try:
+            server = self.smtp_pool.acquire()
+        except (smtplib.SMTPException, OSError) as e:
+            return {r.id: f"connect: {e}" for r in rows}
+
+        broken = False
+        for r in rows:
+            if broken:
+                results[r.id] = "connection lost"
+                continue
+            try:
+                self.smtp_pool.send(server, r.recipient, r.subject, r.body)
+                results[r.id] = None
+            except smtplib.SMTPRecipientsRefused as e:
+                results[r.id] = str(e)
+            except (smtplib.SMTPException, OSError) as e:
+                results[r.id] = str(e)
+                broken = True
+        self.smtp_pool.release(server, broken=broken)
+        return results
+
+    def _record(self, rows, results):
+        now = datetime.utcnow()
+        with session_scope() as db:
+            sent_ids = [i for i, err in results.items() if err is None]
+            if sent_ids:
+                db.execute(
+                    update(InviteOutbox)
+                    .where(InviteOutbox.id.in_(sent_ids), InviteOutbox.status == "sending")
+                    .values(status="sent", sent_at=now, claim_token=None, last_error=None,
+                            attempts=InviteOutbox.attempts + 1)
+                    .execution_options(synchronize_session=False)
+                )
+            for r in rows:
+                error = results.get(r.id)
+                if error is None:
+                    continue
+                attempts = r.attempts + 1
+                give_up = attempts >= OUTBOX_MAX_ATTEMPTS
+                db.execute(
+                    update(InviteOutbox)
+                    # A row cancelled while it was being sent stays cancelled
+                    .where(InviteOutbox.id == r.id, InviteOutbox.status == "sending")
+                    .values(
+                        status="failed" if give_up else "queued",
+                        attempts=attempts,
+                        last_error=error[:500],
+                        claim_token=None,
+                        next_attempt_at=now + _backoff(attempts),
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                self._count("failed" if give_up else "retried")
+            db.commit()
+            self._count("sent", len(sent_ids))
+
+    def drain_once(self):
+        """Claim, deliver and record one batch. Returns the number of rows processed."""
+        rows = self._claim()
+        if rows:
+            live = self._still_claimed(rows)
+            self._count("cancelled", len(rows) - len(live))
+            if live:
+                self._record(live, self._deliver(live))
+        return len(rows)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.drain_once():
+                    continue
+            except Exception as e:
+                print(f"⚠️ Invite outbox worker error: {e}")
+            self._wake.wait(OUTBOX_POLL_SECONDS)
+            self._wake.clear()
+
+    def start(self):
+        self._stop.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"invite-outbox-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        print(f"📮 Invite outbox started with {self.workers} worker(s).")
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+        self.smtp_pool.close()
+
+
+outbox = OutboxWorkerPool()
+
+
+def start_outbox():
+    if OUTBOX_WORKERS > 0:
+        outbox.start()
+
+
+def stop_outbox():
+    outbox.stop()
@@ -0,0 +1,96 @@
+"""
+core/utils/utils_invite_sweeper.py
+--------------------------
+Background lifecycle sweeper for core_staff_invites.
+
+Invites that were accepted, or expired without being accepted, are kept for
+INVITE_RETENTION_DAYS and then archived into core_staff_invites_archive
+(INVITE_SWEEP_MODE=archive, default) or purged (INVITE_SWEEP_MODE=purge).
+Work is done in chunks of INVITE_SWEEP_CHUNK_SIZE ids, each in its own short
+transaction, so the sweeper never holds long locks on the live table.
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, insert, or_, select
+from core.utils.utils_db_session import session_scope
+from core.models.model_staff_invites import Invites, InvitesArchive, InviteOutbox
+
+INVITE_RETENTION_DAYS = int(os.getenv("INVITE_RETENTION_DAYS", "30"))
+INVITE_SWEEP_MODE = os.getenv("INVITE_SWEEP_MODE", "archive")
+INVITE_SWEEP_CHUNK_SIZE = int(os.getenv("INVITE_SWEEP_CHUNK_SIZE", "500"))
+INVITE_SWEEP_INTERVAL_SECONDS = int(os.getenv("INVITE_SWEEP_INTERVAL_SECONDS", "3600"))
+
+_stop_event = threading.Event()
+
+
+def _sweepable(cutoff):
+    return or_(
+        and_(Invites.accepted.is_(True), Invites.created_at < cutoff),
+        and_(Invites.accepted.is_(False), Invites.expires_at < cutoff),
+    )
+
+
+def sweep_invites(retention_days=INVITE_RETENTION_DAYS, mode=INVITE_SWEEP_MODE,
+                  chunk_size=INVITE_SWEEP_CHUNK_SIZE, max_chunks=None):
+    """Archive or purge finished invites older than the retention window. Returns rows swept."""
+    if mode not in ("archive", "purge"):
+        raise ValueError(f"Unknown sweep mode '{mode}'")
+
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    swept = chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        with session_scope() as db:
+            ids = [
+                r.id for r in db.query(Invites.id)
+                .filter(_sweepable(cutoff))
+                .order_by(Invites.id.asc())
+                .limit(chunk_size)
+                .all()
+            ]
+            if not ids:
+                break
+
+            if mode == "archive":
+                columns = ["email", "role_id", "token", "created_at", "expires_at", "accepted"]
+                live = Invites.__table__.c
+                db.execute(
+                    insert(InvitesArchive.__table__).from_select(
+                        ["original_id", *columns],
+                        select(live.id, *[live[c] for c in columns]).where(Invites.id.in_(ids)),
+                    )
+                )
+            db.query(InviteOutbox).filter(InviteOutbox.invite_id.in_(ids)).delete(synchronize_session=False)
+            db.query(Invites).filter(Invites.id.in_(ids)).delete(synchronize_session=False)
+            db.commit()
+
+        swept += len(ids)
+        chunks += 1
+        if len(ids) < chunk_size:
+            break
+
+    if swept:
+        print(f"🧹 Invite sweeper {mode}d {swept} invite(s) older than {retention_days} day(s).")
+    return swept
+
+
+def start_invite_sweeper(interval_seconds=INVITE_SWEEP_INTERVAL_SECONDS):
+    """Run sweep_invites() periodically in a daemon thread."""
+    _stop_event.clear()
+
+    def loop():
+        while not _stop_event.wait(interval_seconds):
+            try:
+                sweep_invites()
+            except Exception as e:
+                print(f"⚠️ Invite sweep failed: {e}")
+
+    thread = threading.Thread(target=loop, name="invite-sweeper", daemon=True)
+    thread.start()
+    return thread
+
+
+def stop_invite_sweeper():
+    _stop_event.set()
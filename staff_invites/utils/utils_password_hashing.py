@@ -0,0 +1,141 @@
+"""
+core/utils/utils_password_hashing.py
+--------------------------
+Process-pool password hashing for invite acceptance.
+
+generate_password_hash is deliberately CPU-heavy. Running it in a worker
+process keeps the API threadpool and the GIL free for other requests. The
+number of in-flight hashes is bounded; beyond that callers get HashingBusy
+instead of piling up behind the pool. A hash that times out keeps its slot
+until the worker actually finishes it.
+
+The pool is created on first use, when the server already runs threads (outbox,
+sweeper, DB pools), so workers are started with "forkserver" (or "spawn")
+rather than fork(), which could copy a lock held by another thread.
+
+Tunables (env):
+    INVITE_HASH_WORKERS      worker processes (0 = hash inline)        default 2
+    INVITE_HASH_MAX_PENDING  queued + running hashes before rejecting   default 32
+    INVITE_HASH_TIMEOUT      seconds to wait for a result               default 30
+    INVITE_HASH_START_METHOD multiprocessing start method             default forkserver
+    INVITE_HASH_METHOD       werkzeug method incl. work factor, e.g.
+                             "pbkdf2:sha256:600000" or "scrypt:32768:8:1"
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from werkzeug.security import generate_password_hash
+
+HASH_WORKERS = int(os.getenv("INVITE_HASH_WORKERS", "2"))
+HASH_MAX_PENDING = int(os.getenv("INVITE_HASH_MAX_PENDING", "32"))
+HASH_TIMEOUT_SECONDS = float(os.getenv("INVITE_HASH_TIMEOUT", "30"))
+HASH_METHOD = os.getenv("INVITE_HASH_METHOD")
+HASH_START_METHOD = os.getenv("INVITE_HASH_START_METHOD") or (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(max(HASH_MAX_PENDING, 1))
+_metrics_lock = threading.Lock()
+_metrics = {
+    "hashed": 0,
+    "rejected": 0,
+    "inline": 0,
+    "total_hash_ms": 0.0,
+    "max_hash_ms": 0.0,
+    "total_wait_ms": 0.0,
+    "max_wait_ms": 0.0,
+}
+
+
+class HashingBusy(Exception):
+    """Raised when too many password hashes are already queued."""
+
+
+def _hash_in_worker(password, method):
+    """Runs inside the worker process; returns (hash, elapsed_seconds)."""
+    started = time.perf_counter()
+    if method:
+        hashed = generate_password_hash(password, method=method)
+    else:
+        hashed = generate_password_hash(password)
+    return hashed, time.perf_counter() - started
+
+
+def _get_executor():
+    global _executor
+    if HASH_WORKERS <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context(HASH_START_METHOD),
+            )
+        return _executor
+
+
+def _record(hash_seconds, total_seconds, inline):
+    hash_ms = hash_seconds * 1000
+    wait_ms = max(total_seconds - hash_seconds, 0) * 1000
+    with _metrics_lock:
+        _metrics["hashed"] += 1
+        _metrics["inline"] += int(inline)
+        _metrics["total_hash_ms"] += hash_ms
+        _metrics["max_hash_ms"] = max(_metrics["max_hash_ms"], hash_ms)
+        _metrics["total_wait_ms"] += wait_ms
+        _metrics["max_wait_ms"] = max(_metrics["max_wait_ms"], wait_ms)
+
+
+def hash_password(password: str) -> str:
+    """Hash a password off the request thread; raises HashingBusy when saturated."""
+    if not _slots.acquire(blocking=False):
+        with _metrics_lock:
+            _metrics["rejected"] += 1
+        raise HashingBusy("Password hashing queue is full")
+
+    started = time.perf_counter()
+    try:
+        executor = _get_executor()
+        if executor is not None:
+            future = executor.submit(_hash_in_worker, password, HASH_METHOD)
+    except BaseException:
+        _slots.release()
+        raise
+    if executor is None:
+        try:
+            hashed, elapsed = _hash_in_worker(password, HASH_METHOD)
+        finally:
+            _slots.release()
+        _record(elapsed, time.perf_counter() - started, inline=True)
+        return hashed
+
+    # The slot is freed when the worker finishes, not when we stop waiting for it
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        hashed, elapsed = future.result(timeout=HASH_TIMEOUT_SECONDS)
+    except FutureTimeout:
+        raise HashingBusy("Password hashing timed out")
+    _record(elapsed, time.perf_counter() - started, inline=False)
+    return hashed
+
+
+def hashing_stats():
+    with _metrics_lock:
+        stats = dict(_metrics)
+    hashed = stats["hashed"] or 1
+    stats["avg_hash_ms"] = round(stats["total_hash_ms"] / hashed, 2)
+    stats["avg_wait_ms"] = round(stats["total_wait_ms"] / hashed, 2)
+    stats.update(workers=HASH_WORKERS, max_pending=HASH_MAX_PENDING, method=HASH_METHOD or "werkzeug default")
+    return stats
+
+
+def shutdown_hashing():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
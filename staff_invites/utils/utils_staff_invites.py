@@ -4,9 +4,15 @@ core/utils/utils_staff_invites.py
 Utilities for invite-only registration tokens.
 """
 
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 import os
+import threading
+import time
+from sqlalchemy.exc import SQLAlchemyError
+from core.utils.utils_db_session import module_engine
+from core.utils.utils_table_versions import read_table_versions
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
@@ -27,3 +33,107 @@ def decode_invite_token(token: str):
         return data
     except JWTError:
         return None
+
+
+# 🧠 Verified-token cache
+# Maps token -> verification result so repeat /verify calls skip jwt.decode and
+# the Invites lookup. Entries are bounded in number and lifetime; positive
+# entries never outlive the invite itself. Revoke/accept evict in this process.
+# Positive entries also carry the shared core_staff_invites counter they were
+# verified under: once any worker changes an invite it moves, and those entries
+# are re-verified (INVITE_CACHE_VERSION_CHECK_MS reuses a reading, default 0).
+INVITES_TABLE = "core_staff_invites"
+INVITE_CACHE_MAX_ENTRIES = int(os.getenv("INVITE_CACHE_MAX_ENTRIES", "2048"))
+INVITE_CACHE_TTL_SECONDS = int(os.getenv("INVITE_CACHE_TTL_SECONDS", "300"))
+INVITE_CACHE_NEGATIVE_TTL_SECONDS = int(os.getenv("INVITE_CACHE_NEGATIVE_TTL_SECONDS", "60"))
+INVITE_CACHE_VERSION_CHECK_SECONDS = int(os.getenv("INVITE_CACHE_VERSION_CHECK_MS", "0")) / 1000
+
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
+_token_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "stale": 0}
+_shared = {"version": None, "checked": float("-inf")}
+
+
+def invites_version():
+    """Shared change counter of core_staff_invites on the primary; None when it can't be read."""
+    now = time.monotonic()
+    with _token_cache_lock:
+        if now - _shared["checked"] < INVITE_CACHE_VERSION_CHECK_SECONDS:
+            return _shared["version"]
+    try:
+        with module_engine.connect() as conn:
+            version = read_table_versions(conn, [INVITES_TABLE])[INVITES_TABLE]
+    except SQLAlchemyError as e:
+        print(f"⚠️ Invite version check failed: {e}")
+        return None
+    with _token_cache_lock:
+        _shared.update(version=version, checked=now)
+    return version
+
+
+def _cache_put(token, entry, ttl_seconds):
+    entry["cached_until"] = time.monotonic() + max(ttl_seconds, 0)
+    with _token_cache_lock:
+        _token_cache[token] = entry
+        _token_cache.move_to_end(token)
+        while len(_token_cache) > INVITE_CACHE_MAX_ENTRIES:
+            _token_cache.popitem(last=False)
+
+
+def get_cached_invite(token: str):
+    """Return the cached verification result for a token, or None on a miss."""
+    with _token_cache_lock:
+        entry = _token_cache.get(token)
+        if entry is None or entry["cached_until"] < time.monotonic():
+            if entry is not None:
+                del _token_cache[token]
+            _token_cache_stats["misses"] += 1
+            return None
+    # A valid entry is only served if no worker changed an invite since it was verified
+    if entry["valid"] and invites_version() != entry["version"]:
+        with _token_cache_lock:
+            if _token_cache.get(token) is entry:
+                del _token_cache[token]
+            _token_cache_stats["stale"] += 1
+            _token_cache_stats["misses"] += 1
+        return None
+    with _token_cache_lock:
+        if token in _token_cache:
+            _token_cache.move_to_end(token)
+        _token_cache_stats["hits"] += 1
+    return entry
+
+
+def cache_valid_invite(token: str, email: str, role: str, invite_id: int, expires_at: datetime, version):
+    """
+    Cache a verified token until the invite expires (capped by the TTL). `version`
+    is invites_version() read before the invite was looked up.
+    """
+    if version is None:
+        return
+    remaining = (expires_at - datetime.utcnow()).total_seconds()
+    entry = {
+        "valid": True,
+        "email": email,
+        "role": role,
+        "invite_id": invite_id,
+        "expires_at": expires_at,
+        "version": version,
+    }
+    _cache_put(token, entry, min(INVITE_CACHE_TTL_SECONDS, remaining))
+
+
+def cache_invalid_invite(token: str, status_code: int, detail: str):
+    """Remember that a token is invalid, revoked, used or expired."""
+    _cache_put(token, {"valid": False, "status_code": status_code, "detail": detail}, INVITE_CACHE_NEGATIVE_TTL_SECONDS)
+
+
+def evict_invite_token(token: str):
+    with _token_cache_lock:
+        if _token_cache.pop(token, None) is not None:
+            _token_cache_stats["evictions"] += 1
+
+
+def invite_cache_stats():
+    with _token_cache_lock:
+        return dict(_token_cache_stats, entries=len(_token_cache))